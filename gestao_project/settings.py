@@ -26,6 +26,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # primeiro a medir a resposta pronta, por último a ver a requisição (ver INSTRUMENTACAO_*)
+    'stock.middleware.InstrumentacaoMiddleware',
 ]
 
 ROOT_URLCONF = 'gestao_project.urls'
@@ -48,10 +50,74 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'gestao_project.wsgi.application'
 
+# SQLite em produção, aplicado a cada conexão (stock.signals.configurar_sqlite). WAL deixa
+# leituras e a escrita acontecerem ao mesmo tempo; busy_timeout faz esperar pelo lock em vez
+# de falhar com "database is locked". Todos ajustáveis por variável de ambiente.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    # NORMAL é seguro com WAL (só a última transação pode se perder numa queda de energia)
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '20000')),
+    'cache_size': -int(os.environ.get('SQLITE_CACHE_KB', '32768')),  # negativo = KiB
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_MB', '256')) * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+            # BEGIN IMMEDIATE: a transação pega o lock de escrita no início; com DEFERRED, duas
+            # transações que leem e depois escrevem (Movimento.save) falham sem esperar o timeout
+            # (opção do Django 5.1+). Leituras não abrem transação: não disputam esse lock
+            'transaction_mode': os.environ.get('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+        },
+        # conexões persistentes entre requisições (0 = uma por requisição)
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {
+            # banco de teste em arquivo: testes com várias threads precisam de
+            # conexões reais (o SQLite em memória não compartilha locks com timeout)
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    }
+}
+
+# Banco de relatórios (stock.roteamento): exportações e APIs analíticas leem de uma cópia
+# em vez do banco do balcão. Com RELATORIOS_DB definido, é um arquivo SQLite atualizado
+# pelo comando atualizar_relatorios (ex.: a cada 5 min pelo cron); sem ele, tudo lê do default.
+RELATORIOS_DB = os.environ.get('RELATORIOS_DB')
+if RELATORIOS_DB:
+    DATABASES['relatorios'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': RELATORIOS_DB,
+        'OPTIONS': {'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000},
+        # sem conexões persistentes: cada requisição abre o arquivo mais recente
+        'CONN_MAX_AGE': 0,
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['stock.roteamento.RelatoriosRouter']
+# cópia mais velha que isso (segundos) é ignorada: as leituras voltam para o default
+RELATORIOS_DEFASAGEM_MAX = int(os.environ.get('RELATORIOS_DEFASAGEM_MAX', '900'))
+# PRAGMAs por alias (substituem SQLITE_PRAGMAS): a cópia é só de leitura e fica sem WAL
+SQLITE_PRAGMAS_POR_BANCO = {
+    'relatorios': {
+        'query_only': 'ON',
+        'busy_timeout': SQLITE_PRAGMAS['busy_timeout'],
+        'cache_size': SQLITE_PRAGMAS['cache_size'],
+        'mmap_size': SQLITE_PRAGMAS['mmap_size'],
+        'temp_store': 'MEMORY',
+    },
+}
+
+# Cache local (por processo). Em produção com vários workers, prefira um
+# backend compartilhado, ex.: django.core.cache.backends.filebased.FileBasedCache
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'gestao-estoque'),
     }
 }
 
@@ -74,6 +140,19 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Relatórios gerados em segundo plano (fora de MEDIA_ROOT: não são públicos)
+EXPORTACOES_ROOT = BASE_DIR / 'exportacoes'
+
+# Movimentos antigos arquivados (comando arquivar_movimentos)
+ARQUIVO_MOVIMENTOS_ROOT = BASE_DIR / 'arquivo_movimentos'
+
+# Instrumentação de desempenho (stock.middleware): fração das requisições medidas
+# (0 desliga; em produção algo como 0.05), arquivo JSON lines lido pelo comando
+# relatorio_desempenho e quantas execuções da mesma consulta indicam N+1
+INSTRUMENTACAO_AMOSTRAGEM = float(os.environ.get('INSTRUMENTACAO_AMOSTRAGEM', '0'))
+INSTRUMENTACAO_ARQUIVO = BASE_DIR / 'logs' / 'desempenho.jsonl'
+INSTRUMENTACAO_REPETICOES = 5
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_REDIRECT_URL = '/'
@@ -1,19 +1,53 @@
 
 from django.contrib import admin
-from .models import Material, Movimento
+from . import miniaturas
+from .models import ArquivoMovimentos, Exportacao, Material, Movimento, PeriodoAlerta
 
 @admin.register(Material)
 class MaterialAdmin(admin.ModelAdmin):
     list_display = ('nome', 'quantidade', 'minimo', 'preview')
     readonly_fields = ('preview',)
+    search_fields = ('nome',)
 
     def preview(self, obj):
         if obj.imagem:
-            return f"<img src='{obj.imagem.url}' style='max-height:60px; max-width:120px; object-fit:cover;'/>"
+            return f"<img src='{obj.thumb_url}' style='max-height:60px; max-width:120px; object-fit:cover;'/>"
         return ''
     preview.allow_tags = True
     preview.short_description = 'Imagem'
 
+    def save_model(self, request, obj, form, change):
+        trocou = 'imagem' in form.changed_data
+        hash_anterior = obj.imagem_hash
+        if trocou:
+            obj.imagem_hash = ''
+        super().save_model(request, obj, form, change)
+        if trocou:
+            miniaturas.agendar_descarte(hash_anterior)
+            if obj.imagem:
+                miniaturas.agendar(obj.pk)
+
+    def delete_model(self, request, obj):
+        hash_imagem = obj.imagem_hash
+        super().delete_model(request, obj)
+        miniaturas.agendar_descarte(hash_imagem)
+
 @admin.register(Movimento)
 class MovimentoAdmin(admin.ModelAdmin):
     list_display = ('material', 'tipo', 'quantidade', 'criado')
+    # busca o material sob demanda em vez de um <option> por material
+    autocomplete_fields = ('material',)
+
+@admin.register(Exportacao)
+class ExportacaoAdmin(admin.ModelAdmin):
+    list_display = ('relatorio', 'formato', 'inicio', 'fim', 'status', 'criado', 'concluido')
+    list_filter = ('status', 'relatorio')
+
+@admin.register(PeriodoAlerta)
+class PeriodoAlertaAdmin(admin.ModelAdmin):
+    list_display = ('material', 'inicio', 'fim', 'duracao')
+    list_filter = ('fim',)
+
+@admin.register(ArquivoMovimentos)
+class ArquivoMovimentosAdmin(admin.ModelAdmin):
+    list_display = ('mes', 'linhas', 'inicio', 'fim', 'arquivo', 'criado')
@@ -0,0 +1,77 @@
+"""
+Arquivo frio de movimentos antigos.
+
+Movimentos anteriores a um corte saem da tabela e vão para blocos mensais
+em CSV compactado (gzip) na pasta ARQUIVO_MOVIMENTOS_ROOT, registrados em
+ArquivoMovimentos. Cada bloco guarda as linhas em ordem decrescente de
+data, com as mesmas colunas usadas pela exportação de movimentos, então a
+exportação pode intercalar a tabela e o arquivo sem reordenar nada.
+"""
+import csv
+import gzip
+import io
+from datetime import date, datetime
+
+from .models import ArquivoMovimentos
+
+COLUNAS = ('id', 'criado', 'usuario', 'material_id', 'material', 'tipo', 'quantidade', 'nota', 'data_devolucao')
+# campos de Movimento.values_list() na ordem de COLUNAS
+CAMPOS = ('id', 'criado', 'usuario__username', 'material_id', 'material__nome', 'tipo', 'quantidade', 'nota',
+          'data_devolucao')
+
+
+def gravar_bloco(destino, linhas):
+    """Grava as tuplas (na ordem de CAMPOS) em gzip/CSV no arquivo binário `destino`."""
+    with gzip.GzipFile(fileobj=destino, mode='wb') as gz, \
+            io.TextIOWrapper(gz, encoding='utf-8', newline='') as texto:
+        writer = csv.writer(texto)
+        writer.writerow(COLUNAS)
+        for linha in linhas:
+            writer.writerow([_texto(v) for v in linha])
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return valor
+
+
+def _int(valor):
+    return int(valor) if valor else None
+
+
+def ler_bloco(origem):
+    """Tuplas de um bloco, com os tipos de volta (datas, inteiros, None)."""
+    with gzip.GzipFile(fileobj=origem, mode='rb') as gz, \
+            io.TextIOWrapper(gz, encoding='utf-8', newline='') as texto:
+        reader = csv.reader(texto)
+        next(reader)
+        for pk, criado, usuario, material_id, material, tipo, quantidade, nota, devolucao in reader:
+            yield (
+                int(pk), datetime.fromisoformat(criado), usuario or None, _int(material_id), material or None,
+                tipo, _int(quantidade), nota, date.fromisoformat(devolucao) if devolucao else None,
+            )
+
+
+def movimentos_arquivados(inicio=None, fim=None):
+    """
+    Movimentos arquivados com criado em [inicio, fim) (datetimes aware; None =
+    sem limite), do mais recente para o mais antigo. Só abre os blocos que
+    cruzam o intervalo.
+    """
+    blocos = ArquivoMovimentos.objects.order_by('-fim')
+    if inicio:
+        blocos = blocos.filter(fim__gte=inicio)
+    if fim:
+        blocos = blocos.filter(inicio__lt=fim)
+    for bloco in blocos:
+        with bloco.arquivo.open('rb') as origem:
+            for linha in ler_bloco(origem):
+                criado = linha[1]
+                if fim and criado >= fim:
+                    continue
+                if inicio and criado < inicio:
+                    break
+                yield linha
@@ -0,0 +1,124 @@
+"""
+Benchmarks de desempenho do app stock.
+
+Cada benchmark é uma função registrada com @benchmark('nome') que recebe
+parâmetros nomeados (ex.: n) e devolve um dict de métricas. Execute com:
+
+    python manage.py benchmark <nome> [--n N] [--saida resultado.json]
+
+Os benchmarks rodam sempre em um banco de teste descartável. Um resultado
+salvo com --saida serve de base para --comparar, que falha se algum tempo,
+pico de memória ou número de consultas piorar além da tolerância.
+"""
+import multiprocessing
+import resource
+import time
+from contextlib import contextmanager
+
+from django.db import connections
+
+BENCHMARKS = {}
+
+
+def benchmark(nome):
+    def registrar(func):
+        BENCHMARKS[nome] = func
+        return func
+    return registrar
+
+
+@contextmanager
+def cronometro():
+    """Uso: with cronometro() as t: ...; depois t['s'] tem os segundos."""
+    t = {}
+    inicio = time.perf_counter()
+    try:
+        yield t
+    finally:
+        t['s'] = time.perf_counter() - inicio
+
+
+def _rss_kb():
+    # RSS atual (Linux); usado como base para o pico do processo filho
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() // 1024
+
+
+def _executar_filho(fila, func, args):
+    rss_inicial = _rss_kb()
+    with cronometro() as t:
+        func(*args)
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    connections.close_all()
+    fila.put({'s': round(t['s'], 3), 'pico_rss_mb': round((pico - rss_inicial) / 1024, 1)})
+
+
+def medir_em_processo(func, *args):
+    """
+    Executa func(*args) num processo filho (fork) e devolve o tempo e o pico
+    de RSS acima do que o processo já usava ao começar. Isola a medição de
+    memória entre variantes comparadas no mesmo benchmark. Somente Linux.
+    """
+    connections.close_all()  # o filho abre a própria conexão
+    ctx = multiprocessing.get_context('fork')
+    fila = ctx.Queue()
+    proc = ctx.Process(target=_executar_filho, args=(fila, func, args))
+    proc.start()
+    resultado = fila.get()
+    proc.join()
+    return resultado
+
+
+# métricas de custo (menor é melhor), pelo fim do nome; vazões (por segundo) ficam de fora
+SUFIXOS_CUSTO = ('ms', '_s', 'kb', '_mb', 'consultas')
+SUFIXOS_VAZAO = ('linhas_s', 'mov_s')
+MINIMO_MS = 2.0
+
+
+def metricas(resultado, prefixo=''):
+    """Achata o resultado de um benchmark em (caminho, valor) das métricas de custo."""
+    for chave, valor in resultado.items():
+        caminho = f'{prefixo}.{chave}' if prefixo else chave
+        if isinstance(valor, dict):
+            yield from metricas(valor, caminho)
+        elif (isinstance(valor, (int, float)) and not isinstance(valor, bool)
+              and chave.endswith(SUFIXOS_CUSTO) and not chave.endswith(SUFIXOS_VAZAO)):
+            yield caminho, valor
+
+
+def comparar(base, atual, tolerancia=0.25):
+    """
+    Regressões de `atual` em relação a `base` ({benchmark: resultado}), como
+    (benchmark, métrica, valor base, valor atual). Tempos e memória regridem
+    acima de base * (1 + tolerancia) (tempos em ms só com diferença de pelo
+    menos MINIMO_MS, abaixo disso é ruído); consultas SQL são determinísticas
+    e regridem com qualquer aumento. Métricas ausentes de um dos lados e
+    execuções com outro n são ignoradas.
+    """
+    regressoes = []
+    for nome, resultado in atual.items():
+        anterior = base.get(nome)
+        if not anterior or anterior.get('n') != resultado.get('n'):
+            continue
+        valores_base = dict(metricas(anterior))
+        for caminho, valor in metricas(resultado):
+            if caminho not in valores_base:
+                continue
+            antes = valores_base[caminho]
+            if caminho.endswith('consultas'):
+                piorou = valor > antes
+            else:
+                piorou = valor > antes * (1 + tolerancia)
+                if caminho.endswith('ms'):
+                    piorou = piorou and valor - antes >= MINIMO_MS
+            if piorou:
+                regressoes.append((nome, caminho, antes, valor))
+    return regressoes
+
+
+def carregar():
+    # importa os módulos para que os @benchmark sejam registrados
+    from . import (  # noqa: F401
+        busca, concorrencia, consolidado, exportacoes, importacao, indices, movimentos, previsao, saldos, suite,
+    )
+    return BENCHMARKS
@@ -0,0 +1,70 @@
+import random
+
+from django.db.models import Q
+
+from stock import busca
+from stock.models import Material
+
+from . import benchmark, cronometro
+
+PALAVRAS = [
+    'cabo', 'elétrico', 'fita', 'isolante', 'parafuso', 'sextavado', 'porca', 'arruela', 'lâmpada', 'led',
+    'tomada', 'interruptor', 'disjuntor', 'conector', 'mangueira', 'válvula', 'registro', 'joelho', 'luva',
+    'papel', 'sulfite', 'caneta', 'grampeador', 'pasta', 'envelope', 'toner', 'cartucho', 'álcool', 'detergente',
+    'vassoura', 'balde', 'pano', 'esponja', 'cola', 'silicone', 'broca', 'aço', 'alumínio', 'plástico', 'borracha',
+]
+MEDIDAS = ['6mm', '10mm', '2,5mm', '1/2"', '3/4"', '100m', '1L', '5L', 'A4', 'nº 2']
+CONSULTAS = ['cabo', 'eletrico', 'par sext', 'lampada led', 'fita isolante', 'al', 'valvula registro', 'tonner']
+
+
+def _materiais(n, rnd):
+    for i in range(n):
+        nome = ' '.join(rnd.sample(PALAVRAS, 2)).capitalize() + ' ' + rnd.choice(MEDIDAS)
+        descricao = ' '.join(rnd.choices(PALAVRAS, k=8))
+        yield Material(nome=nome, descricao=f'{descricao} (lote {i})', quantidade=rnd.randint(0, 500))
+
+
+def _percentis(tempos):
+    ordenados = sorted(tempos)
+    return {
+        'p50_ms': round(ordenados[len(ordenados) // 2] * 1000, 2),
+        'p95_ms': round(ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))] * 1000, 2),
+    }
+
+
+def _medir(func, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        for consulta in CONSULTAS:
+            with cronometro() as t:
+                func(consulta)
+            tempos.append(t['s'])
+    return _percentis(tempos)
+
+
+def _icontains(texto, limite=busca.LIMITE_PADRAO):
+    # o que a listagem fazia antes: varredura da tabela inteira, sem acentos nem ranking
+    qs = Material.objects.order_by('nome', 'id')
+    for termo in busca.termos(texto):
+        qs = qs.filter(Q(nome__icontains=termo) | Q(descricao__icontains=termo))
+    return list(qs[:limite])
+
+
+@benchmark('busca')
+def busca_materiais(n=100000, repeticoes=5):
+    """Latência da busca de materiais (FTS5 ranqueado x icontains) e custo de indexação."""
+    rnd = random.Random(42)
+    with cronometro() as t:
+        Material.objects.bulk_create(_materiais(n, rnd), batch_size=5000)
+    resultado = {'n': n, 'inserir_com_indice_s': round(t['s'], 2)}
+    if not busca.disponivel():
+        return {**resultado, 'ignorado': 'índice FTS5 só no SQLite'}
+    with cronometro() as t:
+        busca.reconstruir()
+    resultado['reconstruir_s'] = round(t['s'], 2)
+    resultado['resultados'] = {consulta: len(busca.ranquear(consulta, 1000)) for consulta in CONSULTAS}
+    resultado['fts'] = _medir(busca.buscar, repeticoes)
+    resultado['fts_listagem'] = _medir(lambda q: list(busca.filtrar(Material.objects.order_by('nome', 'id'), q)[:50]),
+                                       repeticoes)
+    resultado['icontains'] = _medir(_icontains, repeticoes)
+    return resultado
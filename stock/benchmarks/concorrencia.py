@@ -0,0 +1,110 @@
+import random
+import threading
+from contextlib import contextmanager
+
+from django.db import OperationalError, connection, connections
+from django.db.models import Sum
+from django.test import override_settings
+
+from stock.models import Material, Movimento
+
+from . import benchmark, cronometro
+from .dados import semear
+
+# como o SQLite vem sem ajuste: journal em arquivo, fsync completo, transações DEFERRED
+# e o timeout padrão do módulo sqlite3
+PADRAO = {
+    'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'options': {},
+}
+
+
+@contextmanager
+def configuracao_sqlite(pragmas, options):
+    """Troca PRAGMAs e OPTIONS das conexões abertas a partir daqui (threads novas incluídas)."""
+    config = connections.settings['default']
+    anteriores = config['OPTIONS']
+    connections.close_all()
+    config['OPTIONS'] = options
+    try:
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            yield
+    finally:
+        connections.close_all()
+        config['OPTIONS'] = anteriores
+
+
+def _carga(ids, escritores, leitores, escritas):
+    """Escritores gravam `escritas` saídas cada; leitores consultam até os escritores terminarem."""
+    contagem = {'escritas': 0, 'leituras': 0, 'locked': 0, 'outros_erros': 0}
+    trava = threading.Lock()
+    fim = threading.Event()
+    largada = threading.Barrier(escritores + leitores)
+
+    def registrar(chave):
+        with trava:
+            contagem[chave] += 1
+
+    def executar(operacao):
+        try:
+            operacao()
+        except OperationalError as exc:
+            registrar('locked' if 'locked' in str(exc) else 'outros_erros')
+            return False
+        return True
+
+    def escritor(semente):
+        rnd = random.Random(semente)
+        try:
+            largada.wait()
+            for _ in range(escritas):
+                if executar(lambda: Movimento.objects.create(material_id=rnd.choice(ids), tipo='SAIDA', quantidade=1)):
+                    registrar('escritas')
+        finally:
+            connection.close()
+
+    def leitor():
+        try:
+            largada.wait()
+            while not fim.is_set():
+                # o que as listagens e o dashboard fazem a cada requisição
+                if executar(lambda: (list(Material.objects.order_by('nome', 'id')[:50]),
+                                     Movimento.objects.aggregate(Sum('quantidade')))):
+                    registrar('leituras')
+        finally:
+            connection.close()
+
+    threads_escrita = [threading.Thread(target=escritor, args=(i,)) for i in range(escritores)]
+    threads_leitura = [threading.Thread(target=leitor) for _ in range(leitores)]
+    with cronometro() as t:
+        for th in threads_escrita + threads_leitura:
+            th.start()
+        for th in threads_escrita:
+            th.join()
+        fim.set()
+        for th in threads_leitura:
+            th.join()
+
+    tentativas = escritores * escritas
+    return {
+        's': round(t['s'], 2),
+        'escritas_s': round(contagem['escritas'] / t['s']),
+        'leituras_s': round(contagem['leituras'] / t['s']),
+        'erros_lock': contagem['locked'],
+        'taxa_erro_escrita': round(1 - contagem['escritas'] / tentativas, 4),
+        'outros_erros': contagem['outros_erros'],
+    }
+
+
+@benchmark('concorrencia')
+def concorrencia(n=200, escritores=4, leitores=8):
+    """Vazão e erros "database is locked" com leitores e escritores simultâneos: SQLite padrão x ajustado."""
+    if connection.vendor != 'sqlite':
+        return {'n': n, 'ignorado': 'só se aplica ao SQLite'}
+    ids = [m.pk for m in semear(materiais=200, movimentos=20000)]
+    resultado = {'n': n, 'escritores': escritores, 'leitores': leitores}
+    with configuracao_sqlite(**PADRAO):
+        resultado['padrao'] = _carga(ids, escritores, leitores, n)
+    # o que está em settings (SQLITE_PRAGMAS e OPTIONS do banco)
+    resultado['ajustado'] = _carga(ids, escritores, leitores, n)
+    return resultado
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from stock import exports
+from stock.models import Movimento, MovimentoDiario
+
+from . import benchmark, cronometro
+from .dados import semear
+
+
+def _resumo_movimentos(inicio, fim):
+    qs = exports.filtrar_periodo(Movimento.objects.filter(material__isnull=False), inicio, fim).order_by()
+    return list(qs.values('material_id', 'tipo').annotate(quantidade=Sum('quantidade'), total=Count('id')))
+
+
+def _resumo_consolidado(inicio, fim):
+    qs = MovimentoDiario.objects.periodo(inicio, fim).order_by()
+    return list(qs.values('material_id', 'tipo').annotate(quantidade=Sum('quantidade'), total=Sum('total')))
+
+
+@benchmark('consolidado')
+def consolidado(n=1000000):
+    """Resumo por material e tipo num período: movimentos brutos x consolidado diário."""
+    # o ganho depende de quantos movimentos caem em cada (material, dia, tipo)
+    semear(materiais=200, movimentos=n, dias=365)
+    hoje = timezone.localdate()
+    resultado = {'n': n, 'linhas_consolidado': MovimentoDiario.objects.count(), 'periodos': {}}
+    for dias in (30, 180, 365):
+        inicio = hoje - timedelta(days=dias)
+        tempos = {}
+        for nome, func in (('movimentos_ms', _resumo_movimentos), ('consolidado_ms', _resumo_consolidado)):
+            melhor = None
+            for _ in range(3):
+                with cronometro() as t:
+                    func(inicio, hoje)
+                melhor = t['s'] if melhor is None else min(melhor, t['s'])
+            tempos[nome] = round(melhor * 1000, 1)
+        resultado['periodos'][f'{dias}d'] = tempos
+    return resultado
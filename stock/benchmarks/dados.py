@@ -0,0 +1,102 @@
+"""Gerador de dados sintéticos (reprodutível pela semente) para os benchmarks."""
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image
+
+from stock.models import Material, Movimento, MovimentoDiario
+
+# distribuição aproximada dos tipos de movimento em um almoxarifado
+PESOS_TIPOS = {
+    'SAIDA': 60,
+    'ENTRADA': 25,
+    'EMPRESTIMO': 4,
+    'DEVOLVIDO': 6,
+    'ADICAO': 4,
+    'DELETE': 1,
+}
+
+
+@contextmanager
+def datas_manuais(*models):
+    """Desliga auto_now/auto_now_add para gravar datas históricas com bulk_create."""
+    campos = []
+    for model in models:
+        for campo in model._meta.concrete_fields:
+            if getattr(campo, 'auto_now', False) or getattr(campo, 'auto_now_add', False):
+                campos.append((campo, campo.auto_now, campo.auto_now_add))
+                campo.auto_now = campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo, auto_now, auto_now_add in campos:
+            campo.auto_now, campo.auto_now_add = auto_now, auto_now_add
+
+
+def _imagem(rnd, lado=600):
+    buffer = BytesIO()
+    Image.new('RGB', (lado, lado * 3 // 4), tuple(rnd.randrange(256) for _ in range(3))).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def semear(materiais=1000, movimentos=100000, dias=3 * 365, semente=42, lote=20000, imagens=0):
+    """
+    Cria `materiais` materiais (~10% abaixo do mínimo) e `movimentos`
+    movimentos espalhados pelos últimos `dias` dias, em ordem cronológica,
+    sem ajustar estoque. Os `imagens` primeiros materiais recebem uma foto
+    JPEG gravada no storage (use um MEDIA_ROOT temporário). Devolve a lista
+    de materiais.
+    """
+    rnd = random.Random(semente)
+    agora = timezone.now()
+    with datas_manuais(Material, Movimento):
+        mats = []
+        for i in range(materiais):
+            quantidade = rnd.randint(0, 500)
+            minimo = rnd.randint(0, 50) if i % 10 else 600
+            mats.append(Material(
+                nome=f'Material {i:05d}',
+                descricao=f'Item de expediente número {i}',
+                quantidade=quantidade,
+                minimo=minimo,
+                criado=agora - timedelta(days=dias),
+                atualizado=agora,
+                # bulk_create não passa por save(): o alerta materializado vai explícito
+                alerta_desde=agora if quantidade < minimo else None,
+            ))
+        storage = Material._meta.get_field('imagem').storage
+        for mat in mats[:imagens]:
+            mat.imagem = storage.save(f'materiais/bench_{mat.nome[-5:]}.jpg', ContentFile(_imagem(rnd)))
+        mats = Material.objects.bulk_create(mats)
+        tipos = list(PESOS_TIPOS)
+        pesos = list(PESOS_TIPOS.values())
+        passo = timedelta(days=dias) / max(movimentos, 1)
+        inicio = agora - timedelta(days=dias)
+        variacoes = MovimentoDiario.variacoes()
+        for base in range(0, movimentos, lote):
+            linhas = []
+            for i in range(base, min(base + lote, movimentos)):
+                tipo = rnd.choices(tipos, pesos)[0]
+                criado = inicio + passo * i
+                devolucao = None
+                if tipo in ('EMPRESTIMO', 'DEVOLVIDO'):
+                    devolucao = (criado + timedelta(days=rnd.randint(3, 45))).date()
+                linhas.append(Movimento(
+                    material=mats[rnd.randrange(materiais)],
+                    tipo=tipo,
+                    quantidade=rnd.randint(1, 20),
+                    nota=f'requisição {i}',
+                    data_devolucao=devolucao,
+                    criado=criado,
+                    atualizado=criado,
+                ))
+            Movimento.objects.bulk_create(linhas)
+            for mv in linhas:
+                MovimentoDiario.somar(variacoes, mv.material_id, mv.tipo, mv.quantidade, mv.criado)
+    # bulk_create não passa por Movimento.save(): o consolidado diário vai explícito
+    MovimentoDiario.objects.acumular(variacoes)
+    return mats
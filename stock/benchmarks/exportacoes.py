@@ -0,0 +1,47 @@
+from io import BytesIO
+
+import openpyxl
+
+from stock import exports
+from stock.models import Movimento
+
+from . import benchmark, medir_em_processo
+from .dados import semear
+
+CABECALHO = ['id', 'data', 'usuario', 'material_nome', 'tipo', 'quantidade', 'nota']
+
+
+def _xlsx_anterior():
+    # implementação anterior: Workbook normal + BytesIO + stream.read()
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'Movimentos'
+    ws.append(CABECALHO)
+    for mv in Movimento.objects.select_related('material', 'usuario').order_by('-criado'):
+        ws.append([
+            mv.id, mv.criado.strftime('%d/%m/%Y'), mv.usuario.username if mv.usuario else '',
+            mv.material.nome if mv.material else '', mv.tipo, mv.quantidade, mv.nota,
+        ])
+    stream = BytesIO()
+    wb.save(stream)
+    stream.seek(0)
+    return len(stream.read())
+
+
+def _xlsx_write_only():
+    qs = Movimento.objects.order_by('-criado')
+    resp = exports.xlsx_response('movimentos.xlsx', 'Movimentos', CABECALHO, exports.linhas_movimentos(qs))
+    tamanho = sum(len(pedaco) for pedaco in resp.streaming_content)
+    resp.close()
+    return tamanho
+
+
+@benchmark('exportacao_xlsx')
+def exportacao_xlsx(n=100000):
+    """Pico de RSS e tempo do XLSX de movimentos: implementação anterior x write-only."""
+    semear(materiais=200, movimentos=n)
+    return {
+        'n': n,
+        'anterior': medir_em_processo(_xlsx_anterior),
+        'write_only': medir_em_processo(_xlsx_write_only),
+    }
@@ -0,0 +1,35 @@
+import csv
+import io
+
+from stock import importacao
+from stock.models import Material
+
+from . import benchmark, cronometro
+
+
+def _planilha(n, inicio=0):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    writer.writerow(['Nome', 'Descrição', 'Quantidade', 'Quantidade ideal'])
+    for i in range(inicio, inicio + n):
+        writer.writerow([f'Material {i:06d}', f'Item importado {i}', i % 500, (i * 7) % 60])
+    return io.BytesIO(buffer.getvalue().encode('utf-8'))
+
+
+@benchmark('importacao')
+def importacao_materiais(n=100000):
+    """Importação de n materiais novos por CSV e reimportação da mesma planilha com metade dos saldos alterados."""
+    resultado = {'n': n}
+    with cronometro() as t:
+        criacao = importacao.importar_materiais(importacao.ler_planilha(_planilha(n), 'materiais.csv'))
+    resultado['criacao_s'] = round(t['s'], 2)
+    resultado['criacao_linhas_s'] = criacao['linhas_por_segundo']
+
+    # metade dos materiais com saldo diferente: bulk_update + movimentos de ajuste
+    Material.objects.filter(pk__in=Material.objects.order_by('pk').values('pk')[:n // 2]).update(quantidade=1000)
+    with cronometro() as t:
+        atualizacao = importacao.importar_materiais(importacao.ler_planilha(_planilha(n), 'materiais.csv'))
+    resultado['atualizacao_s'] = round(t['s'], 2)
+    resultado['atualizacao_linhas_s'] = atualizacao['linhas_por_segundo']
+    resultado['atualizados'] = atualizacao['atualizados']
+    return resultado
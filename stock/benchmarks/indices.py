@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from stock.models import Material, Movimento
+
+from . import benchmark, cronometro
+from .dados import semear
+
+
+def _views():
+    hoje = timezone.localdate()
+    periodo = {'start': (hoje - timedelta(days=30)).isoformat(), 'end': hoje.isoformat()}
+    return [
+        ('dashboard', {}),
+        ('alertas_completos', {}),
+        ('emprestimos_list', {}),
+        ('export_emprestimos', {}),
+        ('export_movements_csv', periodo),
+        ('export_alertas_csv', {}),
+    ]
+
+
+def medir_views(client, views, repeticoes=3):
+    """Melhor tempo (ms) de cada view, consumindo a resposta inteira."""
+    tempos = {}
+    for nome, params in views:
+        melhor = None
+        for _ in range(repeticoes):
+            with cronometro() as t:
+                resp = client.get(reverse(nome), params)
+                if resp.streaming:
+                    b''.join(resp.streaming_content)
+            melhor = t['s'] if melhor is None else min(melhor, t['s'])
+        tempos[nome] = round(melhor * 1000, 1)
+    return tempos
+
+
+def _indices():
+    return [(model, index) for model in (Material, Movimento) for index in model._meta.indexes]
+
+
+@benchmark('indices')
+def indices(n=1000000):
+    """Latência das views quentes com e sem os índices da migração 0009."""
+    semear(materiais=2000, movimentos=n)
+    usuario, _ = get_user_model().objects.get_or_create(username='benchmark')
+    client = Client()
+    client.force_login(usuario)
+
+    views = _views()
+    com_indices = medir_views(client, views)
+    with connection.schema_editor() as editor:
+        for model, index in _indices():
+            editor.remove_index(model, index)
+    sem_indices = medir_views(client, views)
+    with connection.schema_editor() as editor:
+        for model, index in _indices():
+            editor.add_index(model, index)
+
+    return {
+        'n': n,
+        'views_ms': {
+            nome: {'sem_indices': sem_indices[nome], 'com_indices': com_indices[nome]}
+            for nome, _ in views
+        },
+    }
@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+
+from stock.forms import MovimentoForm
+from stock.models import Material, Movimento
+from stock.services import registrar_movimentos_lote
+
+from . import benchmark, cronometro
+
+
+def _linhas(materiais, n):
+    return [
+        {'material': materiais[i % len(materiais)].pk, 'tipo': 'ENTRADA', 'quantidade': 1 + i % 5, 'nota': f'NF {i}'}
+        for i in range(n)
+    ]
+
+
+@benchmark('movimentos_lote')
+def movimentos_lote(n=2000, materiais=50):
+    """Compara o caminho de movimento_create (um a um) com o lote."""
+    usuario, _ = get_user_model().objects.get_or_create(username='benchmark')
+    mats = Material.objects.bulk_create(Material(nome=f'Material {i}') for i in range(materiais))
+    linhas = _linhas(mats, n)
+
+    with cronometro() as individual:
+        for linha in linhas:
+            form = MovimentoForm(linha)
+            form.is_valid()
+            mv = form.save(commit=False)
+            mv.usuario = usuario
+            mv.save()
+
+    with cronometro() as lote:
+        aplicado, _ = registrar_movimentos_lote(linhas, usuario=usuario)
+
+    esperado = 2 * sum(linha['quantidade'] for linha in linhas)
+    total = sum(Material.objects.values_list('quantidade', flat=True))
+    return {
+        'n': n,
+        'materiais': materiais,
+        'individual_s': round(individual['s'], 4),
+        'lote_s': round(lote['s'], 4),
+        'individual_mov_s': round(n / individual['s']),
+        'lote_mov_s': round(n / lote['s']),
+        'speedup': round(individual['s'] / lote['s'], 1),
+        'consistente': aplicado and total == esperado and Movimento.objects.count() == 2 * n,
+    }
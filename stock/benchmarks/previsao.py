@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from stock import previsao
+from stock.models import Movimento
+
+from . import benchmark, cronometro
+from .dados import semear
+
+
+@benchmark('previsao')
+def previsao_consumo(n=1000000):
+    """Tempo de prever() (sem cache) para 5000 materiais e n movimentos no último ano."""
+    semear(materiais=5000, movimentos=n, dias=365)
+    hoje = timezone.localdate()
+    na_janela = Movimento.objects.filter(
+        tipo='SAIDA', criado__gte=timezone.now() - timedelta(days=previsao.JANELA_DIAS),
+    ).count()
+    tempos = []
+    for _ in range(3):
+        with cronometro() as t:
+            resultado = previsao.prever(hoje)
+        tempos.append(t['s'])
+    return {
+        'n': n,
+        'materiais': len(resultado),
+        'saidas_na_janela': na_janela,
+        'prever_s': round(min(tempos), 3),
+    }
@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from stock.models import Movimento, efeito_estoque_sql
+from stock.services import gerar_snapshots, marcos, saldos_em
+
+from . import benchmark, cronometro
+from .dados import semear
+
+
+def _replay(momento):
+    # sem snapshots: soma todos os movimentos desde a criação de cada material
+    return dict(
+        Movimento.objects.filter(criado__lte=momento).order_by().values('material')
+        .annotate(saldo=Sum(efeito_estoque_sql())).values_list('material', 'saldo')
+    )
+
+
+def _melhor_ms(func, *args, repeticoes=3):
+    melhor = None
+    for _ in range(repeticoes):
+        with cronometro() as t:
+            func(*args)
+        melhor = t['s'] if melhor is None else min(melhor, t['s'])
+    return round(melhor * 1000, 1)
+
+
+@benchmark('saldos')
+def saldos(n=1000000):
+    """Saldo de todos os materiais numa data passada: replay do histórico x snapshot mensal."""
+    dias = 3 * 365
+    semear(materiais=500, movimentos=n, dias=dias)
+    agora = timezone.now()
+    with cronometro() as t:
+        checkpoints = gerar_snapshots(marcos(agora - timedelta(days=dias), agora, 'mensal'))
+
+    # um checkpoint no meio do histórico e instantes cada vez mais distantes dele
+    base = list(marcos(agora - timedelta(days=dias // 2), agora, 'mensal'))[0]
+    consultas = {}
+    for apos in (1, 7, 14, 28):
+        momento = base + timedelta(days=apos)
+        consultas[f'{apos}d'] = {
+            'movimentos_desde_snapshot': Movimento.objects.filter(criado__gt=base, criado__lte=momento).count(),
+            'movimentos_desde_o_inicio': Movimento.objects.filter(criado__lte=momento).count(),
+            'snapshot_ms': _melhor_ms(saldos_em, momento),
+            'replay_ms': _melhor_ms(_replay, momento),
+        }
+    return {
+        'n': n,
+        'snapshots': checkpoints,
+        'gerar_snapshots_s': round(t['s'], 2),
+        'apos_checkpoint': consultas,
+    }
@@ -0,0 +1,100 @@
+import tempfile
+import tracemalloc
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import benchmark, cronometro
+from .dados import semear
+
+
+def entradas():
+    """(nome, rota, parâmetros GET) das páginas, APIs e exportações medidas pela suíte."""
+    hoje = timezone.localdate()
+    periodo = {'start': (hoje - timedelta(days=90)).isoformat(), 'end': hoje.isoformat()}
+    lista = [
+        ('dashboard', 'dashboard', {}),
+        ('materials_list', 'materials_list', {}),
+        ('emprestimos_list', 'emprestimos_list', {}),
+        ('alertas_completos', 'alertas_completos', {}),
+        ('api_materials', 'api_materials', {}),
+        ('api_dashboard', 'api_dashboard', {}),
+        ('movimento_form', 'movimento_add', {}),
+        ('api_materials_lookup', 'api_materials_lookup', {'q': 'material 00'}),
+    ]
+    for fmt in ('csv', 'xlsx'):
+        lista += [
+            (f'export_materiais_{fmt}', 'export_materials_csv', {'format': fmt}),
+            (f'export_movimentos_{fmt}', 'export_movements_csv', {'format': fmt, **periodo}),
+            (f'export_emprestimos_{fmt}', 'export_emprestimos', {'format': fmt}),
+            (f'export_alertas_{fmt}', 'export_alertas_csv', {'format': fmt}),
+        ]
+    return lista
+
+
+def _get(client, rota, params):
+    # caches frios: mede a geração, não a leitura do cache
+    cache.clear()
+    resp = client.get(reverse(rota), params)
+    if resp.streaming:
+        b''.join(resp.streaming_content)
+    return resp
+
+
+def medir(func, repeticoes=3):
+    """
+    Melhor tempo (ms) de `func` em `repeticoes` execuções, consultas SQL e
+    pico de memória alocada em Python (tracemalloc, KB) numa execução à parte
+    para não distorcer o tempo.
+    """
+    melhor = None
+    for _ in range(repeticoes):
+        with cronometro() as t:
+            func()
+        melhor = t['s'] if melhor is None else min(melhor, t['s'])
+    with CaptureQueriesContext(connection) as consultas:
+        tracemalloc.start()
+        try:
+            func()
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {'ms': round(melhor * 1000, 1), 'consultas': len(consultas), 'pico_kb': round(pico / 1024)}
+
+
+@benchmark('suite')
+def suite(n=100000, materiais=1000, imagens=100, criacoes=50):
+    """Tempo, consultas e pico de memória das páginas, APIs, exportações e criação de movimentos."""
+    with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+        mats = semear(materiais=materiais, movimentos=n, imagens=min(imagens, materiais))
+        usuario, _ = get_user_model().objects.get_or_create(username='benchmark')
+        client = Client()
+        client.force_login(usuario)
+
+        resultado = {'n': n, 'materiais': materiais, 'entradas': {}}
+        for nome, rota, params in entradas():
+            resultado['entradas'][nome] = medir(lambda: _get(client, rota, params))
+
+        # criação pelo formulário: cada chamada grava `criacoes` movimentos; ms por movimento
+        sequencia = iter(range(10 ** 9))
+
+        def criar():
+            for _ in range(criacoes):
+                i = next(sequencia)
+                client.post(reverse('movimento_add'), {
+                    'material': mats[i % len(mats)].pk, 'tipo': 'ENTRADA', 'quantidade': 1, 'nota': f'bench {i}',
+                })
+
+        medida = medir(criar)
+        resultado['entradas']['movimento_create'] = {
+            'ms': round(medida['ms'] / criacoes, 2),
+            'consultas': medida['consultas'] // criacoes,
+            'pico_kb': medida['pico_kb'],
+        }
+    return resultado
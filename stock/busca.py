@@ -0,0 +1,140 @@
+"""
+Busca textual de materiais (nome e descrição).
+
+No SQLite usa um índice FTS5 (TABELA) de conteúdo externo sobre
+stock_material, com o tokenizador unicode61 sem acentos: "eletrico" acha
+"Elétrico" e maiúsculas não importam. Cada palavra digitada vale como
+prefixo ("cab ele" acha "Cabo elétrico") e todas precisam aparecer. O
+resultado é ordenado por bm25, com o nome pesando mais que a descrição.
+
+O índice é mantido por triggers no próprio banco, então vale também para as
+gravações que não passam por Material.save() (bulk_create da importação,
+QuerySet.update, exclusões em massa). Migrações que recriam stock_material
+apagam os triggers: instalar() roda de novo em todo post_migrate. O comando
+reconstruir_busca refaz o índice inteiro.
+
+Em outros bancos a busca cai para icontains por palavra, sem ranking. As
+consultas vão para o banco do queryset filtrado (ou o de leitura de
+Material, pelo roteador): dentro de roteamento.relatorios(), a réplica.
+"""
+import re
+
+from django.db import connection as conexao_padrao, connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Material
+
+TABELA = 'stock_material_busca'
+# pesos do bm25 por coluna (nome, descricao)
+PESOS = (10.0, 1.0)
+MAX_TERMOS = 8
+LIMITE_PADRAO = 20
+LIMITE_MAX = 100
+
+_TERMO = re.compile(r'\w+')
+
+SQL_INSTALAR = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA} USING fts5(
+        nome, descricao,
+        content='stock_material', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABELA}_ai AFTER INSERT ON stock_material BEGIN
+        INSERT INTO {TABELA}(rowid, nome, descricao) VALUES (new.id, new.nome, new.descricao);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABELA}_ad AFTER DELETE ON stock_material BEGIN
+        INSERT INTO {TABELA}({TABELA}, rowid, nome, descricao) VALUES ('delete', old.id, old.nome, old.descricao);
+    END""",
+    # só quando o texto muda: ajustes de quantidade não tocam no índice
+    f"""CREATE TRIGGER IF NOT EXISTS {TABELA}_au AFTER UPDATE OF nome, descricao ON stock_material BEGIN
+        INSERT INTO {TABELA}({TABELA}, rowid, nome, descricao) VALUES ('delete', old.id, old.nome, old.descricao);
+        INSERT INTO {TABELA}(rowid, nome, descricao) VALUES (new.id, new.nome, new.descricao);
+    END""",
+]
+
+SQL_REMOVER = [
+    f'DROP TRIGGER IF EXISTS {TABELA}_ai',
+    f'DROP TRIGGER IF EXISTS {TABELA}_ad',
+    f'DROP TRIGGER IF EXISTS {TABELA}_au',
+    f'DROP TABLE IF EXISTS {TABELA}',
+]
+
+
+def disponivel(connection=None):
+    return (connection or conexao_padrao).vendor == 'sqlite'
+
+
+def instalar(connection=None):
+    """Cria a tabela FTS5 e os triggers que faltarem (idempotente)."""
+    connection = connection or conexao_padrao
+    if not disponivel(connection):
+        return False
+    with connection.cursor() as cursor:
+        for sql in SQL_INSTALAR:
+            cursor.execute(sql)
+    return True
+
+
+def reconstruir(connection=None):
+    """Refaz o índice a partir de stock_material. Devolve o número de materiais indexados."""
+    connection = connection or conexao_padrao
+    if not instalar(connection):
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABELA}({TABELA}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {TABELA}({TABELA}) VALUES ('optimize')")
+        cursor.execute('SELECT COUNT(*) FROM stock_material')
+        return cursor.fetchone()[0]
+
+
+def termos(texto):
+    return _TERMO.findall(texto or '')[:MAX_TERMOS]
+
+
+def expressao(texto):
+    """
+    Expressão MATCH do FTS5: cada palavra entre aspas (a sintaxe do FTS5 não
+    vaza da entrada do usuário) e como prefixo. '' se não houver palavras.
+    """
+    return ' '.join(f'"{termo}"*' for termo in termos(texto))
+
+
+def _alias_leitura(using=None):
+    return using or router.db_for_read(Material)
+
+
+def filtrar(queryset, texto):
+    """Restringe um queryset de Material aos que casam com `texto` (sem mudar a ordenação)."""
+    if not termos(texto):
+        return queryset.none()
+    if not disponivel(connections[queryset.db]):
+        for termo in termos(texto):
+            queryset = queryset.filter(Q(nome__icontains=termo) | Q(descricao__icontains=termo))
+        return queryset
+    return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {TABELA} WHERE {TABELA} MATCH %s', [expressao(texto)]))
+
+
+def ranquear(texto, limite=LIMITE_PADRAO, using=None):
+    """Ids dos materiais que casam com `texto`, do mais ao menos relevante."""
+    if not termos(texto):
+        return []
+    alias = _alias_leitura(using)
+    if not disponivel(connections[alias]):
+        materiais = Material.objects.using(alias).order_by('nome', 'id')
+        return list(filtrar(materiais, texto).values_list('id', flat=True)[:limite])
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {TABELA} WHERE {TABELA} MATCH %s '
+            f'ORDER BY bm25({TABELA}, {PESOS[0]}, {PESOS[1]}), rowid LIMIT %s',
+            [expressao(texto), limite],
+        )
+        return [linha[0] for linha in cursor.fetchall()]
+
+
+def buscar(texto, limite=LIMITE_PADRAO, using=None):
+    """Materiais que casam com `texto`, em ordem de relevância."""
+    alias = _alias_leitura(using)
+    ids = ranquear(texto, limite, alias)
+    encontrados = Material.objects.using(alias).in_bulk(ids)
+    return [encontrados[pk] for pk in ids if pk in encontrados]
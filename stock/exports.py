@@ -0,0 +1,280 @@
+"""
+Exportações de relatórios (CSV e XLSX) com memória constante.
+
+As linhas vêm de querysets com values_list() + iterator(), então nem as
+instâncias de modelo nem o arquivo inteiro ficam em memória. O CSV é
+enviado em streaming; o XLSX é gravado em modo write-only num arquivo
+temporário (em memória enquanto pequeno) e servido direto dele.
+"""
+import csv
+import hashlib
+import heapq
+import re
+import tempfile
+from datetime import datetime, time, timedelta
+
+import openpyxl
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from . import arquivo
+from .models import STATUS_EMPRESTIMO, ArquivoMovimentos, Material, Movimento
+
+CHUNK_SIZE = 2000          # linhas buscadas por ida ao banco
+BUFFER_BYTES = 64 * 1024   # tamanho aproximado de cada pedaço enviado
+XLSX_SPOOL_BYTES = 4 * 1024 * 1024  # acima disso o XLSX vai para disco
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class _Eco:
+    """Pseudo-arquivo: csv.writer devolve a linha formatada em vez de gravar."""
+
+    def write(self, value):
+        return value
+
+
+def iterar_csv(cabecalho, linhas, buffer_bytes=BUFFER_BYTES):
+    """Gera o CSV (BOM + linhas terminadas em \\r\\n) em pedaços de ~buffer_bytes."""
+    writer = csv.writer(_Eco(), lineterminator='\r\n')
+    buffer = ['\ufeff', writer.writerow(cabecalho)]
+    tamanho = 0
+    for linha in linhas:
+        texto = writer.writerow(linha)
+        buffer.append(texto)
+        tamanho += len(texto)
+        if tamanho >= buffer_bytes:
+            yield ''.join(buffer)
+            buffer = []
+            tamanho = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def gravar_csv(destino, cabecalho, linhas):
+    """Grava o CSV (bytes UTF-8) em um arquivo binário já aberto."""
+    for pedaco in iterar_csv(cabecalho, linhas):
+        destino.write(pedaco.encode('utf-8'))
+
+
+def gravar_xlsx(destino, titulo, cabecalho, linhas):
+    """Grava a planilha em modo write-only em um arquivo binário já aberto."""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(titulo)
+    ws.append(cabecalho)
+    for linha in linhas:
+        ws.append(linha)
+    wb.save(destino)
+
+
+def csv_response(filename, cabecalho, linhas):
+    response = StreamingHttpResponse(iterar_csv(cabecalho, linhas), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def xlsx_response(filename, titulo, cabecalho, linhas):
+    arquivo = tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_BYTES)
+    gravar_xlsx(arquivo, titulo, cabecalho, linhas)
+    arquivo.seek(0)
+    # FileResponse lê o arquivo em blocos e o fecha ao final da resposta
+    return FileResponse(arquivo, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+
+
+def _data(valor, formato):
+    return valor.strftime(formato) if valor else ''
+
+
+# --- linhas de cada relatório -------------------------------------------------
+
+MATERIAIS_CAMPOS = ('id', 'nome', 'descricao', 'quantidade', 'minimo')
+
+
+def linhas_materiais(qs):
+    return qs.values_list(*MATERIAIS_CAMPOS).iterator(chunk_size=CHUNK_SIZE)
+
+
+def linhas_movimentos(qs, arquivados=()):
+    """
+    Linhas do relatório de movimentos. `arquivados` (tuplas de
+    arquivo.movimentos_arquivados, também em ordem decrescente de data) é
+    intercalado com a tabela sem carregar nenhum dos dois em memória.
+    """
+    campos = ('id', 'criado', 'usuario__username', 'material_id', 'material__nome', 'tipo', 'quantidade', 'nota')
+    tuplas = qs.values_list(*campos).iterator(chunk_size=CHUNK_SIZE)
+    if arquivados:
+        tuplas = heapq.merge(tuplas, (linha[:len(campos)] for linha in arquivados),
+                             key=lambda linha: linha[1], reverse=True)
+    for pk, criado, usuario, material_id, material_nome, tipo, quantidade, nota in tuplas:
+        if material_id is not None:
+            nota_csv = nota or ''
+        else:
+            material_nome = ''
+            nota_csv = ''
+            if nota:
+                # tenta extrair motivo da nota estruturada "nome=...; motivo=..."
+                m_motivo = re.search(r'motivo=([^;]+)', nota)
+                nota_csv = m_motivo.group(1).strip() if m_motivo else nota
+        yield [pk, _data(criado, '%d/%m/%Y'), usuario or '', material_nome or '', tipo, quantidade, nota_csv]
+
+
+def linhas_emprestimos(qs, hoje=None):
+    # status calculado no banco (CASE/WHEN) com um único "hoje" para todo o relatório
+    campos = ('id', 'criado', 'usuario__username', 'material__nome', 'quantidade', 'data_devolucao', 'nota', 'status')
+    for pk, criado, usuario, material_nome, quantidade, data_devolucao, nota, status in (
+        qs.com_status(hoje).values_list(*campos).iterator(chunk_size=CHUNK_SIZE)
+    ):
+        yield [
+            pk,
+            _data(criado, '%Y-%m-%d'),
+            usuario or '',
+            material_nome if material_nome is not None else (nota or ''),
+            quantidade,
+            _data(data_devolucao, '%Y-%m-%d'),
+            nota,
+            STATUS_EMPRESTIMO[status][0],
+        ]
+
+
+# --- catálogo de relatórios -----------------------------------------------------
+
+class Relatorio:
+    def __init__(self, arquivo, titulo, cabecalho_csv, cabecalho_xlsx, queryset, linhas, arquivados=None):
+        self.arquivo = arquivo
+        self.titulo = titulo
+        self.cabecalhos = {'csv': cabecalho_csv, 'xlsx': cabecalho_xlsx}
+        self.queryset = queryset
+        self.linhas = linhas
+        self.arquivados = arquivados  # (inicio, fim) -> linhas do arquivo frio, se o relatório as inclui
+
+    def gerar(self, inicio=None, fim=None):
+        qs = self.queryset(inicio, fim)
+        if self.arquivados:
+            return self.linhas(qs, self.arquivados(inicio, fim))
+        return self.linhas(qs)
+
+
+def _qs_materiais(inicio=None, fim=None):
+    return Material.objects.all().order_by('nome')
+
+
+def _qs_alertas(inicio=None, fim=None):
+    return Material.objects.em_alerta().order_by('nome')
+
+
+def _qs_emprestimos(inicio=None, fim=None):
+    return Movimento.objects.emprestimos().order_by('data_devolucao')
+
+
+def inicio_do_dia(data):
+    """Meia-noite local de `data` como datetime aware."""
+    return timezone.make_aware(datetime.combine(data, time.min))
+
+
+def filtrar_periodo(qs, inicio=None, fim=None, campo='criado'):
+    """
+    Equivale a campo__date__gte/lte, mas compara o datetime direto com os
+    limites do dia (sem função sobre a coluna), o que permite usar o índice.
+    """
+    if inicio:
+        qs = qs.filter(**{f'{campo}__gte': inicio_do_dia(inicio)})
+    if fim:
+        qs = qs.filter(**{f'{campo}__lt': inicio_do_dia(fim + timedelta(days=1))})
+    return qs
+
+
+def _qs_movimentos(inicio=None, fim=None):
+    return filtrar_periodo(Movimento.objects.all().order_by('-criado'), inicio, fim)
+
+
+def _arquivados_movimentos(inicio=None, fim=None):
+    # só abre os blocos do período pedido; sem período, todos
+    return arquivo.movimentos_arquivados(
+        inicio_do_dia(inicio) if inicio else None,
+        inicio_do_dia(fim + timedelta(days=1)) if fim else None,
+    )
+
+
+_CABECALHO_EMPRESTIMOS = ['ID', 'Data movimento', 'Usuário', 'Material', 'Quantidade',
+                          'Data prevista devolução', 'Nota', 'Status']
+# material_id removido do cabeçalho
+_CABECALHO_MOVIMENTOS = ['id', 'data', 'usuario', 'material_nome', 'tipo', 'quantidade', 'nota']
+
+RELATORIOS = {
+    'materiais': Relatorio(
+        'materiais', 'Materiais',
+        ['ID', 'Nome', 'Descrição', 'Quantidade', 'Quantidade ideal'],
+        ['ID', 'Nome', 'Descrição', 'Quantidade', 'Mínimo'],
+        _qs_materiais, linhas_materiais,
+    ),
+    'alertas': Relatorio(
+        'materiais_alerta', 'Alertas',
+        ['ID', 'Nome', 'Descrição', 'Quantidade Atual', 'Quantidade ideal'],
+        ['ID', 'Nome', 'Descrição', 'Quantidade Atual', 'Mínimo Necessário'],
+        _qs_alertas, linhas_materiais,
+    ),
+    'emprestimos': Relatorio(
+        'emprestimos', 'Empréstimos', _CABECALHO_EMPRESTIMOS, _CABECALHO_EMPRESTIMOS,
+        _qs_emprestimos, linhas_emprestimos,
+    ),
+    'movimentos': Relatorio(
+        'movimentos', 'Movimentos', _CABECALHO_MOVIMENTOS, _CABECALHO_MOVIMENTOS,
+        _qs_movimentos, linhas_movimentos, _arquivados_movimentos,
+    ),
+}
+FORMATOS = ('csv', 'xlsx')
+
+
+def nome_arquivo(relatorio, formato):
+    return f'{RELATORIOS[relatorio].arquivo}.{formato}'
+
+
+def responder(relatorio, formato, inicio=None, fim=None):
+    """Resposta HTTP (CSV em streaming ou XLSX write-only) de um relatório."""
+    rel = RELATORIOS[relatorio]
+    linhas = rel.gerar(inicio, fim)
+    if formato == 'xlsx':
+        return xlsx_response(nome_arquivo(relatorio, 'xlsx'), rel.titulo, rel.cabecalhos['xlsx'], linhas)
+    return csv_response(nome_arquivo(relatorio, 'csv'), rel.cabecalhos['csv'], linhas)
+
+
+def _com_progresso(linhas, progresso):
+    for n, linha in enumerate(linhas, 1):
+        if n % CHUNK_SIZE == 0:
+            progresso()
+        yield linha
+
+
+def gravar(relatorio, formato, destino, inicio=None, fim=None, progresso=None):
+    """
+    Grava o relatório em um arquivo binário (usado pelas exportações em
+    segundo plano). `progresso`, se dado, é chamado a cada CHUNK_SIZE linhas.
+    """
+    rel = RELATORIOS[relatorio]
+    linhas = rel.gerar(inicio, fim)
+    if progresso:
+        linhas = _com_progresso(linhas, progresso)
+    if formato == 'xlsx':
+        gravar_xlsx(destino, rel.titulo, rel.cabecalhos['xlsx'], linhas)
+    else:
+        gravar_csv(destino, rel.cabecalhos['csv'], linhas)
+
+
+def assinatura(relatorio, inicio=None, fim=None):
+    """
+    Impressão digital barata dos dados de um relatório: muda sempre que uma
+    linha do relatório (ou um material citado nele) é criada, alterada ou
+    removida. Usada para reaproveitar arquivos já gerados. Só lê os
+    contadores de versão (índices e chaves primárias), sem agregar as linhas
+    do relatório: qualquer escrita em materiais ou movimentos invalida.
+    """
+    rel = RELATORIOS[relatorio]
+    # nomes de material aparecem também nos relatórios de movimentos
+    partes = [relatorio, inicio, fim, Material.objects.versao()]
+    if rel.queryset(inicio, fim).model is Movimento:
+        partes.append(Movimento.objects.versao())
+    if rel.arquivados:
+        partes.append(ArquivoMovimentos.objects.order_by('-pk').values_list('pk', flat=True).first())
+    if relatorio == 'emprestimos':
+        # o status (Atrasado/Em andamento) depende do dia
+        partes.append(timezone.localdate())
+    return hashlib.sha1(repr(partes).encode('utf-8')).hexdigest()
@@ -1,4 +1,5 @@
 from django import forms
+from django.urls import reverse
 from .models import Material, Movimento
 
 class MaterialForm(forms.ModelForm):
@@ -12,6 +13,43 @@ class MaterialForm(forms.ModelForm):
             'imagem': forms.ClearableFileInput(attrs={'accept': 'image/*'})
         }
 
+def validar_movimento(cleaned):
+    """Regras de negócio comuns a MovimentoForm e MovimentoLoteForm."""
+    tipo = cleaned.get('tipo')
+    data_dev = cleaned.get('data_devolucao')
+    if tipo == 'EMPRESTIMO' and not data_dev:
+        raise forms.ValidationError('Para Empréstimo é necessário informar a data prevista de devolução.')
+    return cleaned
+
+
+class MaterialAutocomplete(forms.Select):
+    """
+    Select de material que renderiza só a opção escolhida: as demais são
+    buscadas em api_materials_lookup enquanto o usuário digita. O HTML e as
+    consultas do formulário não crescem com o catálogo; no POST o
+    ModelChoiceField valida apenas o id enviado.
+    """
+
+    def __init__(self, attrs=None, limite=20):
+        super().__init__({'class': 'material-autocomplete', **(attrs or {})})
+        self.limite = limite
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs'].update({'data-url': reverse('api_materials_lookup'), 'data-limite': self.limite})
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        ids = [v for v in value if v and str(v).isdigit()]
+        opcoes = [self.create_option(name, '', self.choices.field.empty_label or '', not ids, 0)]
+        if ids:
+            for i, obj in enumerate(self.choices.queryset.filter(pk__in=ids), 1):
+                opcoes.append(self.create_option(
+                    name, self.choices.field.prepare_value(obj), self.choices.field.label_from_instance(obj), True, i,
+                ))
+        return [(None, opcoes, 0)]
+
+
 class MovimentoForm(forms.ModelForm):
     data_devolucao = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
 
@@ -19,13 +57,49 @@ class MovimentoForm(forms.ModelForm):
         model = Movimento
         fields = ['material', 'tipo', 'quantidade', 'nota', 'data_devolucao']
         widgets = {
+            'material': MaterialAutocomplete(),
             'nota': forms.TextInput(attrs={'class': 'form-control'}),
         }
 
     def clean(self):
-        cleaned = super().clean()
-        tipo = cleaned.get('tipo')
-        data_dev = cleaned.get('data_devolucao')
-        if tipo == 'EMPRESTIMO' and not data_dev:
-            raise forms.ValidationError('Para Empréstimo é necessário informar a data prevista de devolução.')
-        return cleaned
+        return validar_movimento(super().clean())
+
+
+class MovimentoLoteForm(forms.Form):
+    """
+    Valida uma linha de lote com as mesmas regras de MovimentoForm, mas recebe
+    o material como id: a existência é conferida em uma única consulta para o
+    lote inteiro (ver stock.services.registrar_movimentos_lote).
+    """
+    material = forms.IntegerField(min_value=1)
+    tipo = forms.ChoiceField(choices=Movimento.MATERIAL_TIPOS)
+    quantidade = forms.IntegerField()
+    nota = forms.CharField(max_length=200, required=False)
+    data_devolucao = forms.DateField(required=False)
+
+    def clean(self):
+        return validar_movimento(super().clean())
+
+
+class MaterialImportForm(forms.Form):
+    """
+    Regras de uma linha da importação de materiais. stock.importacao aplica
+    os campos (base_fields) direto, sem instanciar o form a cada linha.
+    Quantidade e mínimo em branco mantêm o valor atual do material (ou 0 se
+    ele for novo).
+    """
+    nome = forms.CharField(max_length=200)
+    descricao = forms.CharField(required=False)
+    quantidade = forms.IntegerField(min_value=0, required=False)
+    minimo = forms.IntegerField(min_value=0, required=False)
+
+
+class ImportacaoUploadForm(forms.Form):
+    arquivo = forms.FileField(label='Planilha (.csv ou .xlsx)')
+    simular = forms.BooleanField(label='Apenas simular (não grava nada)', required=False)
+
+    def clean_arquivo(self):
+        arquivo = self.cleaned_data['arquivo']
+        if not arquivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Envie um arquivo .csv ou .xlsx.')
+        return arquivo
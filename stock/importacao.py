@@ -0,0 +1,245 @@
+"""
+Importação em massa de materiais e saldos iniciais a partir de CSV ou XLSX.
+
+A planilha é lida em streaming (CSV linha a linha, XLSX com openpyxl em modo
+read_only) e processada em lotes: cada lote consulta os materiais existentes
+pelo nome em uma única consulta, grava criações com bulk_create e alterações
+com um UPDATE em executemany, e registra os movimentos de saldo com bulk_create, tudo na
+mesma transação. Como essas gravações em massa não passam por save(), a
+versão de sincronização, o alerta materializado (com os períodos de alerta)
+e o consolidado diário são mantidos aqui explicitamente.
+"""
+import csv
+import io
+import time
+import unicodedata
+from collections import defaultdict
+from itertools import chain, islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.forms.utils import ErrorList
+from django.utils import timezone
+
+from .forms import MaterialImportForm
+from .models import Material, Movimento, MovimentoDiario, PeriodoAlerta, ultima_versao
+
+LOTE_PADRAO = 1000
+NOTA_IMPORTACAO = 'Importação de materiais'
+
+# cabeçalhos aceitos (sem acento, minúsculos) -> campo; inclui os da exportação de materiais
+CABECALHOS = {
+    'nome': 'nome',
+    'material': 'nome',
+    'descricao': 'descricao',
+    'quantidade': 'quantidade',
+    'quantidade atual': 'quantidade',
+    'saldo': 'quantidade',
+    'minimo': 'minimo',
+    'minimo necessario': 'minimo',
+    'quantidade ideal': 'minimo',
+}
+
+
+def _chave(texto):
+    texto = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode()
+    return ' '.join(texto.lower().split())
+
+
+def _celula(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor).strip()
+
+
+def _linhas_csv(arquivo):
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    primeira = texto.readline()
+    # planilhas em português costumam sair com ';' (vírgula é o separador decimal)
+    delimitador = ';' if primeira.count(';') > primeira.count(',') else ','
+    try:
+        yield from csv.reader(chain([primeira], texto), delimiter=delimitador)
+    finally:
+        texto.detach()
+
+
+def _linhas_xlsx(arquivo):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        yield from wb.active.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def ler_planilha(arquivo, nome):
+    """
+    Gera (número da linha, dict com os campos reconhecidos) para cada linha
+    não vazia de `arquivo` (binário); o formato vem da extensão de `nome`.
+    Colunas desconhecidas (ex.: ID) são ignoradas. ValueError se o formato
+    não for suportado ou não houver coluna de nome.
+    """
+    if nome.lower().endswith('.xlsx'):
+        linhas = _linhas_xlsx(arquivo)
+    elif nome.lower().endswith('.csv'):
+        linhas = _linhas_csv(arquivo)
+    else:
+        raise ValueError('Formato não suportado (use .csv ou .xlsx).')
+
+    colunas = None
+    for numero, linha in enumerate(linhas, 1):
+        valores = [_celula(v) for v in linha]
+        if not any(valores):
+            continue
+        if colunas is None:
+            colunas = {i: CABECALHOS[_chave(v)] for i, v in enumerate(valores) if _chave(v) in CABECALHOS}
+            if 'nome' not in colunas.values():
+                raise ValueError('A primeira linha deve ter o cabeçalho com a coluna "Nome".')
+            continue
+        yield numero, {campo: valores[i] for i, campo in colunas.items() if i < len(valores)}
+
+
+def importar_materiais(linhas, usuario=None, simular=False, lote=LOTE_PADRAO):
+    """
+    Cria ou atualiza materiais (chave: nome exato) a partir de (número, dict)
+    como os de ler_planilha(). Material novo com quantidade gera um movimento
+    ADICAO; material existente cujo saldo muda gera ADICAO ou SAIDA com a
+    diferença. Os movimentos não ajustam o estoque de novo: o saldo gravado
+    já é o da planilha.
+
+    Cada lote é uma transação; linhas inválidas, nomes repetidos na planilha
+    e nomes que já existem mais de uma vez no cadastro são reportados em
+    'erros' e não impedem as demais. Com simular=True nada é gravado.
+    """
+    resultado = {'linhas': 0, 'criados': 0, 'atualizados': 0, 'inalterados': 0, 'movimentos': 0, 'erros': []}
+    vistos = {}
+    inicio = time.monotonic()
+    linhas = iter(linhas)
+    while True:
+        bloco = list(islice(linhas, max(1, lote)))
+        if not bloco:
+            break
+        resultado['linhas'] += len(bloco)
+        validas = _validar(bloco, vistos, resultado['erros'])
+        if not validas:
+            continue
+        if simular:
+            _aplicar(validas, usuario, resultado, gravar=False)
+        else:
+            with transaction.atomic():
+                _aplicar(validas, usuario, resultado, gravar=True)
+    resultado['segundos'] = round(time.monotonic() - inicio, 3)
+    resultado['linhas_por_segundo'] = round(resultado['linhas'] / resultado['segundos']) if resultado['segundos'] else 0
+    return resultado
+
+
+def _validar(bloco, vistos, erros):
+    # os campos de MaterialImportForm aplicados direto: instanciar um Form por
+    # linha copia todos os campos e widgets, o que domina o tempo em 100 mil linhas
+    campos = MaterialImportForm.base_fields
+    validas = []
+    for numero, dados in bloco:
+        limpos, invalidos = {}, {}
+        for nome, campo in campos.items():
+            try:
+                limpos[nome] = campo.clean(dados.get(nome, ''))
+            except ValidationError as exc:
+                invalidos[nome] = ErrorList(exc.error_list).get_json_data()
+        if not invalidos:
+            if limpos['nome'] in vistos:
+                invalidos['nome'] = [{'message': f"Nome repetido na planilha (linha {vistos[limpos['nome']]}).",
+                                      'code': 'repetido'}]
+            else:
+                vistos[limpos['nome']] = numero
+        if invalidos:
+            erros.append({'linha': numero, 'erros': invalidos})
+            continue
+        validas.append((numero, limpos))
+    return validas
+
+
+def _aplicar(validas, usuario, resultado, gravar):
+    existentes = defaultdict(list)
+    nomes = [dados['nome'] for _, dados in validas]
+    for mat in Material.objects.filter(nome__in=nomes).only('nome', 'descricao', 'quantidade', 'minimo', 'alerta_desde'):
+        existentes[mat.nome].append(mat)
+
+    agora = timezone.now()
+    novos, alterados, movimentos = [], [], []
+    abrir, fechar = [], []
+    for numero, dados in validas:
+        encontrados = existentes.get(dados['nome'], [])
+        if len(encontrados) > 1:
+            resultado['erros'].append({'linha': numero, 'erros': {'nome': [{
+                'message': f'Há {len(encontrados)} materiais com este nome; ajuste o cadastro antes de importar.',
+                'code': 'ambiguo',
+            }]}})
+            continue
+
+        if not encontrados:
+            quantidade = dados['quantidade'] or 0
+            minimo = dados['minimo'] or 0
+            novos.append(Material(
+                nome=dados['nome'], descricao=dados['descricao'], quantidade=quantidade, minimo=minimo,
+                alerta_desde=agora if quantidade < minimo else None,
+            ))
+            continue
+
+        mat = encontrados[0]
+        descricao = dados['descricao'] or mat.descricao
+        quantidade = mat.quantidade if dados['quantidade'] is None else dados['quantidade']
+        minimo = mat.minimo if dados['minimo'] is None else dados['minimo']
+        if (descricao, quantidade, minimo) == (mat.descricao, mat.quantidade, mat.minimo):
+            resultado['inalterados'] += 1
+            continue
+        delta = quantidade - mat.quantidade
+        if delta:
+            movimentos.append(Movimento(material_id=mat.pk, usuario=usuario, tipo='ADICAO' if delta > 0 else 'SAIDA',
+                                        quantidade=abs(delta), nota=NOTA_IMPORTACAO))
+        estava, esta = mat.alerta_desde is not None, quantidade < minimo
+        if esta and not estava:
+            mat.alerta_desde = agora
+            abrir.append(mat.pk)
+        elif estava and not esta:
+            mat.alerta_desde = None
+            fechar.append(mat.pk)
+        mat.descricao, mat.quantidade, mat.minimo, mat.atualizado = descricao, quantidade, minimo, agora
+        alterados.append(mat)
+
+    resultado['criados'] += len(novos)
+    resultado['atualizados'] += len(alterados)
+    resultado['movimentos'] += len(movimentos) + sum(1 for mat in novos if mat.quantidade > 0)
+    if not gravar:
+        return
+
+    # versões distintas e crescentes: a sincronização pagina por versão
+    base = ultima_versao()
+    for i, mat in enumerate(chain(novos, alterados), 1):
+        mat.versao = base + i
+    Material.objects.bulk_create(novos)
+    Material.objects.gravar_campos(alterados, ['descricao', 'quantidade', 'minimo', 'alerta_desde', 'atualizado', 'versao'])
+
+    for mat in novos:
+        if mat.quantidade > 0:
+            movimentos.append(Movimento(material_id=mat.pk, usuario=usuario, tipo='ADICAO',
+                                        quantidade=mat.quantidade, nota=NOTA_IMPORTACAO))
+        if mat.alerta_desde is not None:
+            abrir.append(mat.pk)
+    Movimento.objects.bulk_create(movimentos)
+    PeriodoAlerta.objects.bulk_create([PeriodoAlerta(material_id=pk, inicio=agora) for pk in abrir])
+    if fechar:
+        PeriodoAlerta.objects.filter(material_id__in=fechar, fim__isnull=True).update(fim=agora)
+
+    variacoes = MovimentoDiario.variacoes()
+    for mv in movimentos:
+        MovimentoDiario.somar(variacoes, mv.material_id, mv.tipo, mv.quantidade, mv.criado)
+    MovimentoDiario.objects.acumular(variacoes)
+
+
+def mensagens_erro(erro):
+    """Textos ('campo: mensagem') de um item de resultado['erros']."""
+    return [f"{campo}: {e['message']}" if campo != '__all__' else e['message']
+            for campo, lista in erro['erros'].items() for e in lista]
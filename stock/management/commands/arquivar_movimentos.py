@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from stock.services import arquivar_movimentos
+
+
+class Command(BaseCommand):
+    help = (
+        "Move movimentos antigos para o arquivo frio (blocos mensais gzip em ARQUIVO_MOVIMENTOS_ROOT).\n"
+        "Empréstimos ficam na tabela. As exportações por período continuam incluindo os arquivados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--antes-de",
+            help="Arquiva movimentos anteriores a esta data (AAAA-MM-DD)",
+        )
+        parser.add_argument(
+            "--dias",
+            type=int,
+            default=365,
+            help="Sem --antes-de: mantém na tabela os últimos N dias (padrão: 365)",
+        )
+
+    def handle(self, *args, **options):
+        if options.get("antes_de"):
+            ate = parse_date(options["antes_de"])
+            if ate is None:
+                raise CommandError("Data inválida em --antes-de (use AAAA-MM-DD).")
+        else:
+            ate = timezone.localdate() - timedelta(days=options["dias"])
+
+        blocos, movimentos = arquivar_movimentos(ate)
+        if not movimentos:
+            self.stdout.write(self.style.SUCCESS(f"Nenhum movimento anterior a {ate:%d/%m/%Y} para arquivar."))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"{movimentos} movimentos anteriores a {ate:%d/%m/%Y} arquivados em {blocos} blocos."
+        ))
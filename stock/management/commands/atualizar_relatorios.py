@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from stock import roteamento
+
+
+class Command(BaseCommand):
+    help = (
+        "Atualiza a cópia SQLite usada pelos relatórios (RELATORIOS_DB) a partir do banco\n"
+        "principal, com a API de backup do SQLite. Agende no cron (ex.: a cada 5 minutos):\n"
+        "se a cópia ficar mais velha que RELATORIOS_DEFASAGEM_MAX, exportações e APIs\n"
+        "analíticas voltam a ler do banco principal."
+    )
+
+    def handle(self, *args, **options):
+        if not roteamento.configurado():
+            raise CommandError("Banco de relatórios não configurado (defina RELATORIOS_DB).")
+        inicio = time.perf_counter()
+        try:
+            tamanho = roteamento.atualizar()
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Cópia de relatórios atualizada: {tamanho / 1024 / 1024:.1f} MB em {time.perf_counter() - inicio:.1f}s."
+        ))
@@ -0,0 +1,90 @@
+import json
+import platform
+import sqlite3
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from stock.benchmarks import carregar, comparar
+
+
+class Command(BaseCommand):
+    help = (
+        "Executa benchmarks de desempenho em um banco de teste descartável.\n"
+        "Sem argumentos lista os benchmarks disponíveis. Com --saida grava os resultados em\n"
+        "JSON; com --comparar confronta com um resultado anterior e termina com erro se\n"
+        "houver regressão acima da tolerância."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("nomes", nargs="*", help="Benchmarks a executar")
+        parser.add_argument("--n", type=int, help="Tamanho da carga (padrão de cada benchmark)")
+        parser.add_argument("--saida", help="Grava os resultados neste arquivo JSON")
+        parser.add_argument("--comparar", help="Arquivo JSON de uma execução anterior (base)")
+        parser.add_argument(
+            "--tolerancia",
+            type=float,
+            default=0.25,
+            help="Piora relativa aceita em tempos e memória (padrão: 0.25 = 25%%)",
+        )
+
+    def handle(self, *args, **options):
+        benchmarks = carregar()
+        nomes = options["nomes"]
+        if not nomes:
+            for nome, func in sorted(benchmarks.items()):
+                self.stdout.write(f"{nome}: {(func.__doc__ or '').strip()}")
+            return
+        desconhecidos = [n for n in nomes if n not in benchmarks]
+        if desconhecidos:
+            raise CommandError(f"Benchmark desconhecido: {', '.join(desconhecidos)}")
+
+        base = None
+        if options["comparar"]:
+            try:
+                with open(options["comparar"], encoding="utf-8") as f:
+                    base = json.load(f)["resultados"]
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f"Base de comparação inválida: {exc}")
+
+        params = {}
+        if options["n"]:
+            params["n"] = options["n"]
+
+        resultados = {}
+        # mesmo ambiente do test runner (ALLOWED_HOSTS com testserver, e-mail em memória...)
+        setup_test_environment(debug=False)
+        nome_original = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            for nome in nomes:
+                resultados[nome] = benchmarks[nome](**params)
+                self.stdout.write(json.dumps({"benchmark": nome, **resultados[nome]}, ensure_ascii=False))
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+            teardown_test_environment()
+
+        if options["saida"]:
+            with open(options["saida"], "w", encoding="utf-8") as f:
+                json.dump({
+                    "criado": timezone.now().isoformat(timespec="seconds"),
+                    "ambiente": {
+                        "python": platform.python_version(),
+                        "django": django.get_version(),
+                        "sqlite": sqlite3.sqlite_version,
+                        "maquina": platform.node(),
+                    },
+                    "resultados": resultados,
+                }, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {options['saida']}"))
+
+        if base is not None:
+            regressoes = comparar(base, resultados, options["tolerancia"])
+            for nome, metrica, antes, depois in regressoes:
+                self.stdout.write(self.style.ERROR(f"{nome} {metrica}: {antes} -> {depois}"))
+            if regressoes:
+                raise CommandError(f"{len(regressoes)} regressões de desempenho em relação a {options['comparar']}.")
+            self.stdout.write(self.style.SUCCESS("Sem regressões em relação à base."))
@@ -1,13 +1,28 @@
-from django.core.management.base import BaseCommand
+import time
+
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from stock.exports import inicio_do_dia
+from stock.models import Movimento, MovimentoDiario
+
+TIPOS = [tipo for tipo, _ in Movimento.MATERIAL_TIPOS] + ["DEVOLVIDO"]
+
 
-from stock.models import Movimento
+def _duracao(segundos):
+    minutos, segundos = divmod(int(segundos), 60)
+    horas, minutos = divmod(minutos, 60)
+    return f"{horas:d}:{minutos:02d}:{segundos:02d}"
 
 
 class Command(BaseCommand):
     help = (
-        "Remove todos os registros de Movimento sem alterar as quantidades de Material.\n"
-        "Use --fast para usar deleção em massa (mais rápida)."
+        "Remove registros de Movimento sem alterar as quantidades de Material.\n"
+        "A remoção é feita em lotes por faixa de id, cada lote na sua transação: o banco não fica\n"
+        "bloqueado durante toda a operação e, se ela for interrompida, basta rodar de novo com os\n"
+        "mesmos filtros para continuar de onde parou. Use --before/--tipo para remover só parte.\n"
+        "Use --fast para apagar tudo em um único comando (mais rápido, mas bloqueia o banco)."
     )
 
     def add_arguments(self, parser):
@@ -19,14 +34,43 @@ class Command(BaseCommand):
         parser.add_argument(
             "--fast",
             action="store_true",
-            help="Usa QuerySet.delete() (rápido, ignora delete() customizado)",
+            help="Apaga todos os movimentos com um único DELETE (não aceita filtros)",
+        )
+        parser.add_argument(
+            "--before",
+            help="Só movimentos criados antes desta data (AAAA-MM-DD)",
+        )
+        parser.add_argument(
+            "--tipo",
+            action="append",
+            choices=TIPOS,
+            help="Só movimentos deste tipo (pode repetir)",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=5000,
+            help="Movimentos removidos por transação (padrão: 5000)",
         )
 
     def handle(self, *args, **options):
         confirm = options.get("yes", False)
         fast = options.get("fast", False)
+        lote = max(1, options.get("lote") or 5000)
 
-        total = Movimento.objects.count()
+        qs = Movimento.objects.all()
+        if options.get("before"):
+            antes = parse_date(options["before"])
+            if antes is None:
+                raise CommandError("Data inválida em --before (use AAAA-MM-DD).")
+            qs = qs.filter(criado__lt=inicio_do_dia(antes))
+        if options.get("tipo"):
+            qs = qs.filter(tipo__in=options["tipo"])
+        filtrado = bool(options.get("before") or options.get("tipo"))
+        if fast and filtrado:
+            raise CommandError("--fast apaga todos os movimentos; não use com --before/--tipo.")
+
+        total = qs.count()
         if total == 0:
             self.stdout.write(self.style.SUCCESS("Nenhum movimento para remover."))
             return
@@ -44,15 +88,52 @@ class Command(BaseCommand):
 
         if fast:
             # Deleção em massa: não chama Model.delete(), portanto não ajusta materiais
-            deleted, _ = Movimento.objects.all().delete()
+            # (o consolidado diário é esvaziado junto)
+            with transaction.atomic():
+                deleted, _ = Movimento.objects.all().delete()
+                MovimentoDiario.objects.all().delete()
             self.stdout.write(self.style.SUCCESS(f"Movimentos removidos (método rápido): {deleted}"))
             return
 
-        # Caminho seguro: itera e garante adjust_material=False por instância
-        removed = 0
-        with transaction.atomic():
-            for mv in Movimento.objects.iterator(chunk_size=1000):
-                mv.delete(adjust_material=False)
-                removed += 1
-        self.stdout.write(self.style.SUCCESS(f"Movimentos removidos: {removed}"))
+        removidos = 0
+        ultimo = 0
+        inicio = time.monotonic()
+        try:
+            while True:
+                # próximo lote de ids, lido na mesma transação que o remove: o consolidado
+                # é descontado exatamente das linhas apagadas. O DELETE em massa não passa
+                # por Movimento.delete(), então as quantidades dos materiais não mudam
+                with transaction.atomic():
+                    linhas = list(
+                        qs.filter(pk__gt=ultimo).order_by("pk")
+                        .values_list("pk", "material_id", "tipo", "quantidade", "criado")[:lote]
+                    )
+                    if not linhas:
+                        break
+                    ids = [linha[0] for linha in linhas]
+                    variacoes = MovimentoDiario.variacoes()
+                    for _, material_id, tipo, quantidade, criado in linhas:
+                        MovimentoDiario.somar(variacoes, material_id, tipo, quantidade, criado, sinal=-1)
+                    apagados = 0
+                    for i in range(0, len(ids), 900):
+                        apagados += Movimento.objects.filter(pk__in=ids[i:i + 900]).delete()[0]
+                    MovimentoDiario.objects.acumular(variacoes)
+                ultimo = ids[-1]
+                removidos += apagados
 
+                decorrido = time.monotonic() - inicio
+                taxa = removidos / decorrido if decorrido else 0
+                eta = (total - removidos) / taxa if taxa else 0
+                self.stdout.write(
+                    f"{removidos}/{total} ({100 * removidos / total:.1f}%) - "
+                    f"{taxa:.0f} mov/s - restante {_duracao(eta)} - até id {ultimo}"
+                )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(
+                f"Interrompido após {removidos} movimentos (lotes concluídos foram gravados). "
+                "Rode de novo com os mesmos filtros para continuar."
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Movimentos removidos: {removidos} em {_duracao(time.monotonic() - inicio)}"
+        ))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from stock.services import reconstruir_consolidado
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula o consolidado diário de movimentos (material, dia, tipo) a partir dos\n"
+        "movimentos e regrava a tabela (carga inicial). Use --verificar para só relatar diferenças."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verificar",
+            action="store_true",
+            help="Apenas relata as divergências, sem regravar",
+        )
+
+    def handle(self, *args, **options):
+        verificar = options.get("verificar", False)
+        divergentes = reconstruir_consolidado(corrigir=not verificar)
+
+        if not divergentes:
+            self.stdout.write(self.style.SUCCESS("Consolidado diário consistente."))
+            return
+        for material_id, dia, tipo in divergentes[:20]:
+            self.stdout.write(self.style.WARNING(f"divergente: material {material_id}, {dia:%d/%m/%Y}, {tipo}"))
+        if len(divergentes) > 20:
+            self.stdout.write(self.style.WARNING(f"... e mais {len(divergentes) - 20}"))
+        if verificar:
+            self.stdout.write(self.style.WARNING(f"{len(divergentes)} linhas divergentes (nada alterado)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{len(divergentes)} linhas divergentes corrigidas."))
@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from stock import miniaturas
+from stock.models import Material
+
+
+def _gerar(material_id):
+    try:
+        return material_id, miniaturas.gerar(material_id), None
+    except Exception as exc:  # imagem corrompida ou ilegível: segue com as demais
+        return material_id, None, exc
+
+
+def _gerar_em_thread(material_id):
+    try:
+        return _gerar(material_id)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera as miniaturas (WebP e JPEG) das imagens de material que ainda não têm.\n"
+        "Novos uploads já são processados em segundo plano; use este comando após a\n"
+        "implantação ou para refazer tudo (--todas). --limpar-orfas apaga miniaturas\n"
+        "que nenhum material usa mais."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--todas",
+            action="store_true",
+            help="Processa também as imagens que já têm miniaturas (gera só os arquivos que faltarem)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=miniaturas.WORKERS,
+            help=f"Threads de processamento (padrão: {miniaturas.WORKERS})",
+        )
+        parser.add_argument(
+            "--limpar-orfas",
+            action="store_true",
+            help="Apaga as miniaturas cujo hash nenhum material usa",
+        )
+
+    def handle(self, *args, **options):
+        qs = Material.objects.exclude(imagem='').exclude(imagem__isnull=True)
+        if not options["todas"]:
+            qs = qs.filter(imagem_hash='')
+        ids = list(qs.order_by("pk").values_list("pk", flat=True))
+
+        geradas = falhas = 0
+        workers = max(1, options["workers"])
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # com um worker só, processa na própria thread (e conexão) do comando
+            resultados = pool.map(_gerar_em_thread, ids) if workers > 1 else map(_gerar, ids)
+            for material_id, hash_imagem, erro in resultados:
+                if erro is not None:
+                    falhas += 1
+                    self.stdout.write(self.style.ERROR(f"Material {material_id}: {erro}"))
+                elif hash_imagem:
+                    geradas += 1
+        estilo = self.style.WARNING if falhas else self.style.SUCCESS
+        self.stdout.write(estilo(f"Miniaturas processadas: {geradas} imagens, {falhas} com erro."))
+
+        if options["limpar_orfas"]:
+            storage = Material._meta.get_field("imagem").storage
+            orfas = miniaturas.orfas()
+            for nome in orfas:
+                storage.delete(nome)
+            self.stdout.write(self.style.SUCCESS(f"Miniaturas órfãs removidas: {len(orfas)}"))
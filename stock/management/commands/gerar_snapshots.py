@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from stock.exports import inicio_do_dia
+from stock.models import SaldoSnapshot
+from stock.services import gerar_snapshots, marcos
+
+
+class Command(BaseCommand):
+    help = (
+        "Grava snapshots de saldo de todos os materiais (checkpoints diários ou mensais),\n"
+        "usados pelas consultas de saldo em uma data passada. Agende diariamente; use\n"
+        "--desde para preencher o histórico."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--periodo",
+            choices=["diario", "mensal"],
+            default="diario",
+            help="Intervalo entre checkpoints (padrão: diario)",
+        )
+        parser.add_argument(
+            "--desde",
+            help="Data inicial AAAA-MM-DD (padrão: depois do último snapshot, ou só o checkpoint mais recente)",
+        )
+
+    def handle(self, *args, **options):
+        periodo = options["periodo"]
+        agora = timezone.now()
+        if options.get("desde"):
+            dia = parse_date(options["desde"])
+            if dia is None:
+                raise CommandError("Data inválida em --desde (use AAAA-MM-DD).")
+            desde = inicio_do_dia(dia)
+        else:
+            ultimo = SaldoSnapshot.objects.order_by("-momento").values_list("momento", flat=True).first()
+            desde = ultimo or agora
+        momentos = list(marcos(desde, agora, periodo))
+        if not momentos and not options.get("desde"):
+            # sem histórico: só o checkpoint mais recente (hoje ou dia 1º do mês)
+            hoje = timezone.localdate()
+            if periodo == "mensal":
+                hoje = hoje.replace(day=1)
+            momentos = [inicio_do_dia(hoje)]
+
+        criados = gerar_snapshots(momentos)
+        self.stdout.write(self.style.SUCCESS(f"{criados} snapshots gravados em {len(momentos)} checkpoints."))
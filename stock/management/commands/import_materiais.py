@@ -0,0 +1,66 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from stock.importacao import LOTE_PADRAO, importar_materiais, ler_planilha, mensagens_erro
+
+ERROS_EXIBIDOS = 50
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa materiais e saldos iniciais de uma planilha .csv ou .xlsx.\n"
+        "Colunas: Nome (obrigatória), Descrição, Quantidade e Mínimo/Quantidade ideal; o arquivo\n"
+        "gerado pela exportação de materiais é aceito como está. Materiais são casados pelo nome:\n"
+        "os existentes são atualizados, os demais criados. Mudanças de saldo geram movimentos.\n"
+        "Linhas com erro são listadas e não impedem as demais. Use --dry-run para só validar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("arquivo", help="Caminho da planilha (.csv ou .xlsx)")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Valida e conta o que seria feito, sem gravar nada",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=LOTE_PADRAO,
+            help=f"Linhas gravadas por transação (padrão: {LOTE_PADRAO})",
+        )
+        parser.add_argument(
+            "--usuario",
+            help="Username registrado nos movimentos gerados",
+        )
+
+    def handle(self, *args, **options):
+        usuario = None
+        if options.get("usuario"):
+            usuario = get_user_model().objects.filter(username=options["usuario"]).first()
+            if usuario is None:
+                raise CommandError(f"Usuário inexistente: {options['usuario']}")
+
+        try:
+            with open(options["arquivo"], "rb") as arquivo:
+                resultado = importar_materiais(
+                    ler_planilha(arquivo, options["arquivo"]),
+                    usuario=usuario,
+                    simular=options["dry_run"],
+                    lote=options["lote"],
+                )
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        for erro in resultado["erros"][:ERROS_EXIBIDOS]:
+            self.stdout.write(self.style.ERROR(f"Linha {erro['linha']}: {'; '.join(mensagens_erro(erro))}"))
+        if len(resultado["erros"]) > ERROS_EXIBIDOS:
+            self.stdout.write(self.style.ERROR(f"... e mais {len(resultado['erros']) - ERROS_EXIBIDOS} linhas com erro."))
+
+        prefixo = "Simulação (nada foi gravado): " if options["dry_run"] else ""
+        estilo = self.style.WARNING if resultado["erros"] else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f"{prefixo}{resultado['linhas']} linhas em {resultado['segundos']:.1f}s "
+            f"({resultado['linhas_por_segundo']} linhas/s): {resultado['criados']} criados, "
+            f"{resultado['atualizados']} atualizados, {resultado['inalterados']} inalterados, "
+            f"{resultado['movimentos']} movimentos, {len(resultado['erros'])} com erro."
+        ))
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from stock.models import Exportacao
+from stock.services import processar_exportacao, reenfileirar_exportacoes_travadas
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker local das exportações em segundo plano: gera os relatórios PENDENTES.\n"
+        "Fica em execução consultando a fila; use --uma-vez para esvaziar a fila e sair.\n"
+        "Pedidos PROCESSANDO há muito tempo (worker que caiu) voltam para a fila."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--uma-vez",
+            action="store_true",
+            help="Processa os pedidos pendentes e encerra",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=2.0,
+            help="Segundos entre consultas à fila quando ela está vazia (padrão: 2)",
+        )
+
+    def handle(self, *args, **options):
+        uma_vez = options.get("uma_vez", False)
+        intervalo = options.get("intervalo", 2.0)
+
+        while True:
+            reenfileirados = reenfileirar_exportacoes_travadas()
+            if reenfileirados:
+                self.stdout.write(self.style.WARNING(f"{reenfileirados} exportação(ões) travada(s) devolvida(s) à fila."))
+            pendentes = list(Exportacao.objects.filter(status="PENDENTE").order_by("criado")[:10])
+            for exportacao in pendentes:
+                try:
+                    if processar_exportacao(exportacao):
+                        self.stdout.write(self.style.SUCCESS(f"Exportação {exportacao.pk} concluída: {exportacao.arquivo.name}"))
+                except Exception as exc:
+                    self.stderr.write(self.style.ERROR(f"Exportação {exportacao.pk} falhou: {exc}"))
+            if not pendentes:
+                if uma_vez:
+                    return
+                time.sleep(intervalo)
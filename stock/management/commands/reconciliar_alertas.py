@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from stock.services import reconciliar_alertas
+
+
+DESCRICOES = {
+    "sem_alerta": "abaixo do mínimo sem alerta",
+    "alerta_indevido": "em alerta acima do mínimo",
+    "periodo_indevido": "período de alerta aberto indevidamente",
+    "sem_periodo": "em alerta sem período aberto",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula os alertas de estoque (quantidade < mínimo) do zero e informa as divergências\n"
+        "em relação ao conjunto mantido a cada movimento. Use --verificar para só relatar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verificar",
+            action="store_true",
+            help="Apenas relata as divergências, sem corrigir",
+        )
+
+    def handle(self, *args, **options):
+        verificar = options.get("verificar", False)
+        divergencias = reconciliar_alertas(corrigir=not verificar)
+
+        total = sum(len(ids) for ids in divergencias.values())
+        if total == 0:
+            self.stdout.write(self.style.SUCCESS("Alertas consistentes."))
+            return
+
+        for tipo, ids in divergencias.items():
+            if ids:
+                amostra = ", ".join(str(pk) for pk in ids[:20]) + (" ..." if len(ids) > 20 else "")
+                self.stdout.write(self.style.WARNING(f"{DESCRICOES[tipo]}: {len(ids)} (materiais {amostra})"))
+        if verificar:
+            self.stdout.write(self.style.WARNING(f"{total} divergências encontradas (nada alterado)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{total} divergências corrigidas."))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from stock import busca
+
+
+class Command(BaseCommand):
+    help = (
+        "Recria o índice de busca (FTS5) de materiais a partir da tabela de materiais,\n"
+        "incluindo os triggers que o mantêm. O índice se mantém sozinho; use após\n"
+        "restaurar um backup ou se a busca parecer desatualizada."
+    )
+
+    def handle(self, *args, **options):
+        if not busca.disponivel():
+            raise CommandError("O índice de busca só existe no SQLite; neste banco a busca usa icontains.")
+        inicio = time.perf_counter()
+        total = busca.reconstruir()
+        self.stdout.write(self.style.SUCCESS(
+            f"Índice de busca reconstruído: {total} materiais em {time.perf_counter() - inicio:.1f}s."
+        ))
@@ -0,0 +1,113 @@
+import json
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+ORDENACOES = ("p95", "p99", "n", "consultas")
+
+
+def percentil(ordenados, p):
+    """Percentil por posição (nearest-rank) de uma lista já ordenada."""
+    if not ordenados:
+        return None
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def agregar(linhas):
+    """Registros da instrumentação (dicts) -> estatísticas por view."""
+    por_view = defaultdict(list)
+    for registro in linhas:
+        por_view[registro.get("view") or "(sem rota)"].append(registro)
+    resultado = []
+    for view, registros in por_view.items():
+        ms = sorted(r["ms"] for r in registros)
+        consultas = sorted(r["consultas"] for r in registros)
+        db_ms = sorted(r["db_ms"] for r in registros)
+        tamanhos = [r["bytes"] for r in registros if r.get("bytes") is not None]
+        resultado.append({
+            "view": view,
+            "n": len(registros),
+            "p50": percentil(ms, 50),
+            "p95": percentil(ms, 95),
+            "p99": percentil(ms, 99),
+            "consultas_media": round(sum(consultas) / len(consultas), 1),
+            "consultas_p95": percentil(consultas, 95),
+            "db_p95": percentil(db_ms, 95),
+            "kb_medio": round(sum(tamanhos) / len(tamanhos) / 1024, 1) if tamanhos else None,
+            "n_mais_1": sum(1 for r in registros if r.get("repetidas")),
+            "erros": sum(1 for r in registros if r.get("status", 200) >= 500),
+        })
+    return resultado
+
+
+class Command(BaseCommand):
+    help = (
+        "Resume o log da instrumentação de desempenho (INSTRUMENTACAO_ARQUIVO) por view:\n"
+        "p50/p95/p99 do tempo total, consultas por requisição, tempo de banco, tamanho da\n"
+        "resposta e quantas requisições tiveram consultas repetidas (possível N+1)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "arquivo",
+            nargs="?",
+            help="Arquivo JSON lines (padrão: INSTRUMENTACAO_ARQUIVO)",
+        )
+        parser.add_argument(
+            "--desde",
+            help="Só registros a partir desta data (AAAA-MM-DD)",
+        )
+        parser.add_argument(
+            "--ordenar",
+            choices=ORDENACOES,
+            default="p95",
+            help="Ordena as views por este campo, do maior para o menor (padrão: p95)",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Saída em JSON em vez de tabela",
+        )
+
+    def handle(self, *args, **options):
+        caminho = options.get("arquivo") or getattr(settings, "INSTRUMENTACAO_ARQUIVO", None)
+        if not caminho:
+            raise CommandError("Informe o arquivo ou configure INSTRUMENTACAO_ARQUIVO.")
+        desde = None
+        if options.get("desde"):
+            desde = parse_date(options["desde"])
+            if desde is None:
+                raise CommandError("Data inválida em --desde (use AAAA-MM-DD).")
+
+        try:
+            with open(caminho, encoding="utf-8") as f:
+                linhas = [json.loads(linha) for linha in f if linha.strip()]
+        except FileNotFoundError:
+            raise CommandError(f"Arquivo não encontrado: {caminho}")
+        if desde:
+            # ts em ISO 8601: a comparação de texto pela data basta
+            linhas = [r for r in linhas if r["ts"][:10] >= desde.isoformat()]
+
+        chave = {"consultas": "consultas_media"}.get(options["ordenar"], options["ordenar"])
+        resultado = sorted(agregar(linhas), key=lambda v: v[chave], reverse=True)
+        if options["json"]:
+            self.stdout.write(json.dumps(resultado, ensure_ascii=False, indent=2))
+            return
+        if not resultado:
+            self.stdout.write(self.style.WARNING("Nenhum registro no período."))
+            return
+
+        self.stdout.write(
+            f"{'view':<32} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+            f"{'consultas':>9} {'c. p95':>7} {'db p95':>8} {'KB':>8} {'N+1':>5} {'5xx':>4}"
+        )
+        for v in resultado:
+            self.stdout.write(
+                f"{v['view'][:32]:<32} {v['n']:>6} {v['p50']:>9.1f} {v['p95']:>9.1f} {v['p99']:>9.1f} "
+                f"{v['consultas_media']:>9} {v['consultas_p95']:>7} {v['db_p95']:>8.1f} "
+                f"{'-' if v['kb_medio'] is None else v['kb_medio']:>8} {v['n_mais_1']:>5} {v['erros']:>4}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"{len(linhas)} requisições, {len(resultado)} views."))
@@ -0,0 +1,116 @@
+"""
+Instrumentação de desempenho por requisição.
+
+Para uma amostra das requisições (INSTRUMENTACAO_AMOSTRAGEM) mede o tempo
+total, a quantidade e o tempo das consultas SQL, as consultas repetidas
+(indício de N+1) e o tamanho da resposta, identificando a view pelo nome da
+URL. Cada medição vira uma linha JSON em INSTRUMENTACAO_ARQUIVO (agregada
+pelo comando relatorio_desempenho) e um cabeçalho Server-Timing, visível nas
+ferramentas do navegador.
+
+As consultas são capturadas com connection.execute_wrapper, sem depender de
+DEBUG. Requisições fora da amostra passam direto; com amostragem 0 o
+middleware nem é carregado.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger('stock.desempenho')
+
+SQL_MAX = 300  # caracteres de SQL guardados por consulta repetida
+
+
+class _Consultas:
+    """execute_wrapper que conta e cronometra as consultas, agrupadas pelo SQL (sem parâmetros)."""
+
+    def __init__(self):
+        self.total = 0
+        self.segundos = 0.0
+        self.por_sql = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos += time.perf_counter() - inicio
+            self.total += 1
+            self.por_sql[sql] += 1
+
+
+class InstrumentacaoMiddleware:
+    _lock = threading.Lock()
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.amostragem = getattr(settings, 'INSTRUMENTACAO_AMOSTRAGEM', 0)
+        if not self.amostragem:
+            raise MiddlewareNotUsed
+        self.arquivo = getattr(settings, 'INSTRUMENTACAO_ARQUIVO', None)
+        self.repeticoes = getattr(settings, 'INSTRUMENTACAO_REPETICOES', 5)
+
+    def __call__(self, request):
+        if self.amostragem < 1 and random.random() >= self.amostragem:
+            return self.get_response(request)
+
+        consultas = _Consultas()
+        inicio = time.perf_counter()
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(consultas))
+            response = self.get_response(request)
+        segundos = time.perf_counter() - inicio
+
+        repetidas = [
+            {'sql': sql[:SQL_MAX], 'vezes': vezes}
+            for sql, vezes in consultas.por_sql.most_common(3) if vezes >= self.repeticoes
+        ]
+        match = request.resolver_match
+        registro = {
+            'ts': timezone.now().isoformat(timespec='seconds'),
+            'view': match.view_name if match else None,
+            'metodo': request.method,
+            'status': response.status_code,
+            'ms': round(segundos * 1000, 2),
+            'consultas': consultas.total,
+            'db_ms': round(consultas.segundos * 1000, 2),
+            # respostas em streaming: o corpo (e as consultas feitas ao gerá-lo) fica fora da medição
+            'bytes': len(response.content) if not response.streaming else _int(response.get('Content-Length')),
+            'repetidas': repetidas,
+        }
+        if repetidas:
+            logger.warning('%s: consulta repetida %d vezes (possível N+1): %s',
+                           registro['view'] or request.path, repetidas[0]['vezes'], repetidas[0]['sql'])
+        self._gravar(registro)
+        response['Server-Timing'] = (
+            f'db;dur={registro["db_ms"]};desc="{consultas.total} consultas", total;dur={registro["ms"]}'
+        )
+        return response
+
+    def _gravar(self, registro):
+        if not self.arquivo:
+            return
+        linha = json.dumps(registro, ensure_ascii=False) + '\n'
+        try:
+            with self._lock:
+                Path(self.arquivo).parent.mkdir(parents=True, exist_ok=True)
+                with open(self.arquivo, 'a', encoding='utf-8') as f:
+                    f.write(linha)
+        except OSError:
+            # a instrumentação nunca derruba a requisição
+            logger.exception('Falha ao gravar %s', self.arquivo)
+
+
+def _int(valor):
+    return int(valor) if valor and str(valor).isdigit() else None
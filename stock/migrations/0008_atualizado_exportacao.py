@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:49
+
+import django.db.models.deletion
+import stock.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0007_merge_20251024_0943'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='material',
+            name='atualizado',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='movimento',
+            name='atualizado',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.CreateModel(
+            name='Exportacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('relatorio', models.CharField(choices=[('materiais', 'Materiais'), ('alertas', 'Alertas'), ('emprestimos', 'Empréstimos'), ('movimentos', 'Movimentos')], max_length=20)),
+                ('formato', models.CharField(choices=[('csv', 'CSV'), ('xlsx', 'Excel (.xlsx)')], default='csv', max_length=4)),
+                ('inicio', models.DateField(blank=True, null=True)),
+                ('fim', models.DateField(blank=True, null=True)),
+                ('assinatura', models.CharField(max_length=40)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('CONCLUIDA', 'Concluída'), ('ERRO', 'Erro')], default='PENDENTE', max_length=12)),
+                ('arquivo', models.FileField(blank=True, storage=stock.models.exportacoes_storage, upload_to='%Y/%m/')),
+                ('erro', models.TextField(blank=True)),
+                ('criado', models.DateTimeField(auto_now_add=True)),
+                ('concluido', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['relatorio', 'formato', 'inicio', 'fim', 'assinatura'], name='exportacao_chave_idx'), models.Index(fields=['status', 'criado'], name='exportacao_fila_idx')],
+            },
+        ),
+    ]
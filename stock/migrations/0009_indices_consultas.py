@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0008_atualizado_exportacao'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['nome', 'id'], name='material_nome_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(condition=models.Q(('quantidade__lt', models.F('minimo'))), fields=['nome'], name='material_alerta_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimento',
+            index=models.Index(fields=['criado'], name='movimento_criado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimento',
+            index=models.Index(condition=models.Q(('tipo', 'EMPRESTIMO'), ('tipo', 'DEVOLVIDO'), _connector='OR'), fields=['data_devolucao'], name='movimento_emprestimos_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimento',
+            index=models.Index(condition=models.Q(('tipo', 'EMPRESTIMO')), fields=['data_devolucao'], name='movimento_emp_aberto_idx'),
+        ),
+    ]
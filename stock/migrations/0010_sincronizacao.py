@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:57
+
+from django.db import migrations, models
+
+
+def versoes_iniciais(apps, schema_editor):
+    # materiais existentes entram na primeira sincronização (cursor zero)
+    Material = apps.get_model('stock', 'Material')
+    Material.objects.update(versao=models.F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0009_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialRemovido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('material_id', models.BigIntegerField()),
+                ('nome', models.CharField(max_length=200)),
+                ('removido', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='material',
+            name='versao',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(versoes_iniciais, migrations.RunPython.noop),
+    ]
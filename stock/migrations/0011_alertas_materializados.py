@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def alertas_iniciais(apps, schema_editor):
+    # o início real é desconhecido: os alertas já existentes contam a partir da migração
+    Material = apps.get_model('stock', 'Material')
+    PeriodoAlerta = apps.get_model('stock', 'PeriodoAlerta')
+    agora = timezone.now()
+    abaixo = Material.objects.filter(quantidade__lt=models.F('minimo'))
+    PeriodoAlerta.objects.bulk_create(
+        PeriodoAlerta(material_id=pk, inicio=agora) for pk in abaixo.values_list('pk', flat=True)
+    )
+    abaixo.update(alerta_desde=agora)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0010_sincronizacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeriodoAlerta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('fim', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-inicio'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='material',
+            name='material_alerta_idx',
+        ),
+        migrations.AddField(
+            model_name='material',
+            name='alerta_desde',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(condition=models.Q(('alerta_desde__isnull', False)), fields=['nome'], name='material_alerta_idx'),
+        ),
+        migrations.AddField(
+            model_name='periodoalerta',
+            name='material',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='periodos_alerta', to='stock.material'),
+        ),
+        migrations.AddIndex(
+            model_name='periodoalerta',
+            index=models.Index(condition=models.Q(('fim__isnull', True)), fields=['material'], name='periodo_alerta_aberto_idx'),
+        ),
+        migrations.RunPython(alertas_iniciais, migrations.RunPython.noop),
+    ]
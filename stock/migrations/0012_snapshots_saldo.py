@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0011_alertas_materializados'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('momento', models.DateTimeField()),
+                ('quantidade', models.IntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='movimento',
+            index=models.Index(fields=['material', 'criado'], name='movimento_material_criado_idx'),
+        ),
+        migrations.AddField(
+            model_name='saldosnapshot',
+            name='material',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='stock.material'),
+        ),
+        migrations.AddIndex(
+            model_name='saldosnapshot',
+            index=models.Index(fields=['momento'], name='snapshot_momento_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='saldosnapshot',
+            constraint=models.UniqueConstraint(fields=('material', 'momento'), name='snapshot_material_momento_uniq'),
+        ),
+    ]
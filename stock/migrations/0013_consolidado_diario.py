@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def carga_inicial(apps, schema_editor):
+    Movimento = apps.get_model('stock', 'Movimento')
+    MovimentoDiario = apps.get_model('stock', 'MovimentoDiario')
+    linhas = (
+        Movimento.objects.filter(material__isnull=False).order_by()
+        .annotate(dia=TruncDate('criado'))
+        .values('material_id', 'dia', 'tipo')
+        .annotate(soma=models.Sum(Coalesce('quantidade', 0)), n=models.Count('id'))
+    )
+    MovimentoDiario.objects.bulk_create(
+        (MovimentoDiario(material_id=l['material_id'], dia=l['dia'], tipo=l['tipo'],
+                         quantidade=l['soma'], total=l['n']) for l in linhas.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0012_snapshots_saldo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimentoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('tipo', models.CharField(max_length=12)),
+                ('quantidade', models.BigIntegerField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consolidado_diario', to='stock.material')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dia'], name='movimento_diario_dia_idx')],
+                'constraints': [models.UniqueConstraint(fields=('material', 'dia', 'tipo'), name='movimento_diario_chave_uniq')],
+            },
+        ),
+        migrations.RunPython(carga_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:16
+
+import stock.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0013_consolidado_diario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArquivoMovimentos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('inicio', models.DateTimeField()),
+                ('fim', models.DateTimeField()),
+                ('corte', models.DateTimeField()),
+                ('linhas', models.IntegerField()),
+                ('arquivo', models.FileField(storage=stock.models.arquivo_movimentos_storage, upload_to='%Y/')),
+                ('criado', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-fim'],
+            },
+        ),
+    ]
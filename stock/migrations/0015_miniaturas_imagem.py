@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0014_arquivo_movimentos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='material',
+            name='imagem_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16),
+        ),
+    ]
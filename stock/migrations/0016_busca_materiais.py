@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# DDL congelada aqui (não importa stock.busca): mudanças futuras no módulo
+# não alteram o que esta migração faz.
+SQL_CRIAR = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS stock_material_busca USING fts5(
+        nome, descricao,
+        content='stock_material', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS stock_material_busca_ai AFTER INSERT ON stock_material BEGIN
+        INSERT INTO stock_material_busca(rowid, nome, descricao) VALUES (new.id, new.nome, new.descricao);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS stock_material_busca_ad AFTER DELETE ON stock_material BEGIN
+        INSERT INTO stock_material_busca(stock_material_busca, rowid, nome, descricao)
+        VALUES ('delete', old.id, old.nome, old.descricao);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS stock_material_busca_au AFTER UPDATE OF nome, descricao ON stock_material BEGIN
+        INSERT INTO stock_material_busca(stock_material_busca, rowid, nome, descricao)
+        VALUES ('delete', old.id, old.nome, old.descricao);
+        INSERT INTO stock_material_busca(rowid, nome, descricao) VALUES (new.id, new.nome, new.descricao);
+    END""",
+    # indexa os materiais que já existem
+    "INSERT INTO stock_material_busca(stock_material_busca) VALUES ('rebuild')",
+]
+
+SQL_REMOVER = [
+    'DROP TRIGGER IF EXISTS stock_material_busca_ai',
+    'DROP TRIGGER IF EXISTS stock_material_busca_ad',
+    'DROP TRIGGER IF EXISTS stock_material_busca_au',
+    'DROP TABLE IF EXISTS stock_material_busca',
+]
+
+
+def _executar(comandos):
+    def executar(apps, schema_editor):
+        # FTS5 só existe no SQLite; nos outros bancos a busca usa icontains
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in comandos:
+            schema_editor.execute(sql)
+    return executar
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0015_miniaturas_imagem'),
+    ]
+
+    operations = [
+        migrations.RunPython(_executar(SQL_CRIAR), _executar(SQL_REMOVER)),
+    ]
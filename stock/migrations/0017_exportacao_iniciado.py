@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0016_busca_materiais'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportacao',
+            name='iniciado',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
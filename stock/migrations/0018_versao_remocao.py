@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0017_exportacao_iniciado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='materialremovido',
+            name='versao',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+    ]
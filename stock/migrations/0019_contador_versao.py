@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0018_versao_remocao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Contador',
+            fields=[
+                ('nome', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('valor', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
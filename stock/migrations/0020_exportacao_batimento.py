@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+def batimento_inicial(apps, schema_editor):
+    # pedidos já em processamento contam a partir de quando foram assumidos
+    Exportacao = apps.get_model('stock', 'Exportacao')
+    Exportacao.objects.filter(status='PROCESSANDO').update(batimento=models.F('iniciado'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0019_contador_versao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportacao',
+            name='batimento',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(batimento_inicial, migrations.RunPython.noop),
+    ]
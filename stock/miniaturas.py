@@ -0,0 +1,160 @@
+"""
+Miniaturas das imagens de material.
+
+Para cada imagem são geradas versões reduzidas (MINIATURAS) em WebP e JPEG,
+gravadas na mesma pasta da original com o hash do conteúdo no nome: o
+navegador pode guardá-las para sempre (a URL muda quando a imagem muda) e
+imagens iguais compartilham os arquivos. A geração roda em um pool de
+threads depois do commit, fora da requisição; até terminar, thumb_url e
+preview_url apontam para a original. O comando gerar_miniaturas processa as
+imagens já existentes.
+"""
+import hashlib
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import FORMATOS_MINIATURA, MINIATURAS, Material, caminho_miniatura, proxima_versao
+
+logger = logging.getLogger(__name__)
+
+PASTA = Material._meta.get_field('imagem').upload_to.rstrip('/')
+WORKERS = 2
+QUALIDADE = {'webp': 80, 'jpg': 82}
+# nomes gerados por caminho_miniatura(), para achar arquivos órfãos
+NOME_MINIATURA = re.compile(
+    rf"^([0-9a-f]{{16}})_({'|'.join(MINIATURAS)})\.({'|'.join(FORMATOS_MINIATURA)})$"
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _storage():
+    return Material._meta.get_field('imagem').storage
+
+
+def _codificar(img, formato):
+    buffer = BytesIO()
+    if formato == 'jpg':
+        img.convert('RGB').save(buffer, 'JPEG', quality=QUALIDADE['jpg'], optimize=True, progressive=True)
+    else:
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA')
+        img.save(buffer, 'WEBP', quality=QUALIDADE['webp'], method=4)
+    return buffer.getvalue()
+
+
+def _gravar_faltantes(storage, nome_imagem, dados, hash_imagem):
+    """Gera, a partir de `dados`, as miniaturas de `hash_imagem` que não existem no storage."""
+    original = None
+    for tamanho, lado in MINIATURAS.items():
+        nomes = {fmt: caminho_miniatura(nome_imagem, hash_imagem, tamanho, fmt) for fmt in FORMATOS_MINIATURA}
+        faltando = [fmt for fmt, nome in nomes.items() if not storage.exists(nome)]
+        if not faltando:
+            continue
+        if original is None:
+            # exif_transpose: fotos de celular vêm com a orientação só no EXIF
+            original = ImageOps.exif_transpose(Image.open(BytesIO(dados)))
+        img = original.copy()
+        img.thumbnail((lado, lado), Image.LANCZOS)
+        for fmt in faltando:
+            storage.save(nomes[fmt], ContentFile(_codificar(img, fmt)))
+
+
+def gerar(material_id):
+    """
+    Gera as miniaturas que faltam para a imagem atual do material e grava o
+    hash em Material.imagem_hash (com nova versão, para invalidar os caches
+    da API). Devolve o hash, ou None se o material não tiver imagem.
+    """
+    mat = Material.objects.filter(pk=material_id).only('imagem', 'imagem_hash').first()
+    if mat is None or not mat.imagem:
+        return None
+    storage = mat.imagem.storage
+    with mat.imagem.open('rb') as f:
+        dados = f.read()
+    hash_imagem = hashlib.sha256(dados).hexdigest()[:16]
+    _gravar_faltantes(storage, mat.imagem.name, dados, hash_imagem)
+
+    # descartar() confere e apaga sob o mesmo lock de escrita (BEGIN IMMEDIATE): se
+    # ele removeu este hash depois da geração acima, os arquivos são refeitos antes
+    # de o material passar a apontar para eles
+    with transaction.atomic():
+        _gravar_faltantes(storage, mat.imagem.name, dados, hash_imagem)
+        # só grava se a imagem não foi trocada enquanto as miniaturas eram geradas
+        Material.objects.filter(pk=material_id, imagem=mat.imagem.name).exclude(imagem_hash=hash_imagem).update(
+            imagem_hash=hash_imagem, atualizado=timezone.now(), versao=proxima_versao(),
+        )
+    if mat.imagem_hash and mat.imagem_hash != hash_imagem:
+        descartar(mat.imagem_hash)
+    return hash_imagem
+
+
+def descartar(hash_imagem):
+    """Apaga as miniaturas de `hash_imagem` se nenhum material usa mais esse conteúdo."""
+    if not hash_imagem:
+        return 0
+    storage = _storage()
+    apagadas = 0
+    # conferência e remoção na mesma transação que gerar() usa para gravar o hash
+    with transaction.atomic():
+        if Material.objects.filter(imagem_hash=hash_imagem).exists():
+            return 0
+        for tamanho in MINIATURAS:
+            for fmt in FORMATOS_MINIATURA:
+                nome = caminho_miniatura(f'{PASTA}/', hash_imagem, tamanho, fmt)
+                if storage.exists(nome):
+                    storage.delete(nome)
+                    apagadas += 1
+    return apagadas
+
+
+def orfas():
+    """Nomes das miniaturas na pasta de imagens cujo hash nenhum material usa."""
+    storage = _storage()
+    try:
+        _, arquivos = storage.listdir(PASTA)
+    except FileNotFoundError:
+        return []
+    usados = set(Material.objects.exclude(imagem_hash='').values_list('imagem_hash', flat=True))
+    return [
+        f'{PASTA}/{nome}' for nome in arquivos
+        if (m := NOME_MINIATURA.match(nome)) and m.group(1) not in usados
+    ]
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='miniaturas')
+    return _pool
+
+
+def _em_segundo_plano(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Falha ao processar miniaturas (%s%r)', func.__name__, args)
+    finally:
+        # cada thread do pool tem a própria conexão
+        connection.close()
+
+
+def agendar(material_id):
+    """Gera as miniaturas no pool depois do commit da transação atual."""
+    transaction.on_commit(lambda: _executor().submit(_em_segundo_plano, gerar, material_id))
+
+
+def agendar_descarte(hash_imagem):
+    """descartar() no pool depois do commit (quando a troca ou exclusão já está gravada)."""
+    if hash_imagem:
+        transaction.on_commit(lambda: _executor().submit(_em_segundo_plano, descartar, hash_imagem))
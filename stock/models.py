@@ -1,8 +1,283 @@
+import os
+import posixpath
+from collections import defaultdict
+
 from django.db import models
 from django.conf import settings
-from django.db import transaction
+from django.core.files.storage import FileSystemStorage
+from django.db import connections, router, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+# tipos de movimento que somam ou subtraem do estoque
+TIPOS_POSITIVOS = ('ENTRADA', 'ADICAO')
+TIPOS_NEGATIVOS = ('SAIDA',)  # EMPRESTIMO não altera quantidade
+
+# miniaturas das imagens de material: nome -> maior lado em pixels (ver stock.miniaturas)
+MINIATURAS = {'thumb': 160, 'preview': 800}
+FORMATOS_MINIATURA = ('webp', 'jpg')
+
+
+def caminho_miniatura(imagem, hash_imagem, tamanho, formato='webp'):
+    """Nome no storage da miniatura: mesma pasta da imagem original, nomeada pelo hash do conteúdo."""
+    return posixpath.join(posixpath.dirname(imagem), f'{hash_imagem}_{tamanho}.{formato}')
+
+
+def url_miniatura(storage, imagem, hash_imagem, tamanho='thumb', formato='webp'):
+    """
+    URL da miniatura de `imagem` (nome no storage); enquanto ela ainda não foi
+    gerada (hash vazio), a URL da própria imagem original. None sem imagem.
+    """
+    if not imagem:
+        return None
+    if not hash_imagem:
+        return storage.url(imagem)
+    return storage.url(caminho_miniatura(imagem, hash_imagem, tamanho, formato))
+
+
+def _sql_ultima_versao():
+    # máximo entre materiais e remoções: excluir o material de maior versão não
+    # faz a próxima versão voltar para trás (abaixo do cursor de um cliente)
+    return (
+        f'SELECT MAX(v) FROM (SELECT COALESCE(MAX(versao), 0) AS v FROM {Material._meta.db_table} '
+        f'UNION ALL SELECT COALESCE(MAX(versao), 0) FROM {MaterialRemovido._meta.db_table}) AS versoes'
+    )
+
+
+def ultima_versao():
+    """Maior versão de sincronização já usada (materiais e remoções)."""
+    with connections[Material.objects.db].cursor() as cursor:
+        cursor.execute(_sql_ultima_versao())
+        return cursor.fetchone()[0]
+
+
+def proxima_versao():
+    """
+    Expressão SQL com a próxima versão de sincronização de Material (última
+    versão usada + 1), avaliada dentro do próprio INSERT/UPDATE. Como o SQLite
+    serializa as escritas, as versões crescem na ordem de commit.
+    """
+    return RawSQL(f'({_sql_ultima_versao()}) + 1', [])
+
+
+class MaterialQuerySet(models.QuerySet):
+    def versao(self):
+        """
+        Token barato que muda a cada criação, alteração (inclusive de estoque)
+        ou exclusão de material: a última versão de sincronização, lida nos
+        índices de versao (sem varrer a tabela).
+        """
+        return str(ultima_versao())
+
+    def em_alerta(self):
+        """Materiais abaixo do mínimo, pelo campo mantido em cada escrita (índice parcial)."""
+        return self.filter(alerta_desde__isnull=False)
+
+    def gravar_campos(self, materiais, campos):
+        """
+        Como bulk_update(materiais, campos), mas com um UPDATE parametrizado
+        por material enviado via executemany: o bulk_update do Django monta
+        um CASE WHEN por campo e lote, e compilar essas expressões domina o
+        tempo em lotes grandes. Assim como bulk_update, não aplica auto_now
+        nem passa por save().
+        """
+        if not materiais:
+            return
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        meta = self.model._meta
+        fields = [meta.get_field(nome) for nome in campos]
+        params = [
+            [f.get_db_prep_save(getattr(mat, f.attname), connection) for f in fields] + [mat.pk]
+            for mat in materiais
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'UPDATE {qn(meta.db_table)} SET {", ".join(f"{qn(f.column)} = %s" for f in fields)} '
+                f'WHERE {qn(meta.pk.column)} = %s',
+                params,
+            )
+
+    def ajustar(self, material_id, delta):
+        """
+        Aplica `delta` em quantidade com um único UPDATE no banco
+        (quantidade = quantidade + delta) e devolve o novo saldo,
+        ou None se o material não existir. O mesmo UPDATE mantém
+        `alerta_desde`; os períodos de alerta só são gravados quando
+        o saldo cruza o mínimo.
+        """
+        agora = timezone.now()
+        connection = connections[self.db]
+        if connection.features.can_return_columns_from_insert:
+            # SQLite >= 3.35 e PostgreSQL: UPDATE ... RETURNING em uma ida ao banco
+            qn = connection.ops.quote_name
+            table = qn(self.model._meta.db_table)
+            col = qn(self.model._meta.get_field('quantidade').column)
+            minimo = qn(self.model._meta.get_field('minimo').column)
+            atualizado = self.model._meta.get_field('atualizado')
+            alerta = qn(self.model._meta.get_field('alerta_desde').column)
+            versao = qn(self.model._meta.get_field('versao').column)
+            pk = qn(self.model._meta.pk.column)
+            agora_db = atualizado.get_db_prep_value(agora, connection)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {table} SET {col} = {col} + %s, {qn(atualizado.column)} = %s, '
+                    f'{alerta} = CASE WHEN {col} + %s < {minimo} THEN COALESCE({alerta}, %s) ELSE NULL END, '
+                    f'{versao} = ({proxima_versao().sql}) WHERE {pk} = %s RETURNING {col}, {minimo}',
+                    [delta, agora_db, delta, agora_db, material_id],
+                )
+                row = cursor.fetchone()
+            if row is None:
+                return None
+            saldo, minimo = row
+        else:
+            abaixo = models.Q(quantidade__lt=models.F('minimo') - delta)
+            if not self.filter(pk=material_id).update(
+                quantidade=models.F('quantidade') + delta,
+                atualizado=agora,
+                alerta_desde=models.Case(
+                    models.When(abaixo, then=Coalesce('alerta_desde', models.Value(agora))),
+                    default=None,
+                ),
+                versao=proxima_versao(),
+            ):
+                return None
+            saldo, minimo = self.filter(pk=material_id).values_list('quantidade', 'minimo').get()
+        PeriodoAlerta.registrar_transicao(material_id, saldo - delta < minimo, saldo < minimo, agora)
+        return saldo
+
+
+# empréstimos (abertos ou devolvidos). Escrito como OR, e não tipo__in, porque o
+# SQLite só usa o índice parcial movimento_emprestimos_idx com essa forma.
+EMPRESTIMOS_Q = models.Q(tipo='EMPRESTIMO') | models.Q(tipo='DEVOLVIDO')
+
+
+# status de empréstimo: código -> (rótulo, cor, classe do badge Bootstrap)
+STATUS_EMPRESTIMO = {
+    'concluido': ('Concluído', '#28a745', 'bg-success'),  # verde
+    'atrasado': ('Atrasado', '#FF3333', 'bg-danger'),  # vermelho
+    # amarelo com texto escuro para melhor contraste
+    'andamento': ('Em andamento', '#ffc107', 'bg-warning text-dark'),
+    'sem_data': ('Sem data', '#6c757d', 'bg-secondary'),  # cinza
+    '-': ('-', '#adb5bd', 'bg-secondary'),  # cinza claro
+}
+
+
+def condicoes_status(hoje):
+    """
+    Condições (mutuamente exclusivas) de cada status de empréstimo para o dia
+    `hoje`. Fonte única para a anotação SQL, os filtros e o cálculo em Python.
+    """
+    return [
+        ('concluido', models.Q(tipo='DEVOLVIDO')),
+        ('sem_data', models.Q(tipo='EMPRESTIMO', data_devolucao__isnull=True)),
+        ('atrasado', models.Q(tipo='EMPRESTIMO', data_devolucao__lt=hoje)),
+        ('andamento', models.Q(tipo='EMPRESTIMO', data_devolucao__gte=hoje)),
+    ]
+
+
+def efeito_estoque_sql():
+    """Movimento.efeito_estoque como expressão SQL (para somar deltas no banco)."""
+    return models.Case(
+        models.When(tipo__in=TIPOS_POSITIVOS, then=models.F('quantidade')),
+        models.When(tipo__in=TIPOS_NEGATIVOS, then=-models.F('quantidade')),
+        default=models.Value(0),
+    )
+
+
+CONTADOR_MOVIMENTOS = 'movimentos'
+
+
+class Contador(models.Model):
+    """
+    Contadores de versão (um por nome), incrementados a cada escrita do que
+    representam. Servem de chave de cache sem agregar a tabela inteira.
+    """
+    nome = models.CharField(max_length=40, primary_key=True)
+    valor = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.nome}: {self.valor}"
+
+    @classmethod
+    def incrementar(cls, nome):
+        # um comando só, criando a linha na primeira vez (INSERT ... ON CONFLICT DO UPDATE)
+        connection = connections[router.db_for_write(cls)]
+        qn = connection.ops.quote_name
+        table, chave, valor = qn(cls._meta.db_table), qn('nome'), qn('valor')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({chave}, {valor}) VALUES (%s, 1) '
+                f'ON CONFLICT ({chave}) DO UPDATE SET {valor} = {table}.{valor} + 1',
+                [nome],
+            )
+
+    @classmethod
+    def atual(cls, nome):
+        return cls.objects.filter(pk=nome).values_list('valor', flat=True).first() or 0
+
+
+class MovimentoQuerySet(models.QuerySet):
+    def emprestimos(self):
+        return self.filter(EMPRESTIMOS_Q)
+
+    def versao(self):
+        """
+        Como MaterialQuerySet.versao: muda a cada movimento criado, alterado ou
+        excluído. Lê o Contador de movimentos (uma linha pela chave primária).
+        """
+        return str(Contador.atual(CONTADOR_MOVIMENTOS))
+
+    # escritas em massa também contam como nova versão (save() e delete() do
+    # modelo incrementam por conta própria)
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=router.db_for_write(self.model), savepoint=False):
+            criados = super().bulk_create(objs, *args, **kwargs)
+            if criados:
+                Contador.incrementar(CONTADOR_MOVIMENTOS)
+        return criados
+
+    def update(self, **kwargs):
+        with transaction.atomic(using=router.db_for_write(self.model), savepoint=False):
+            linhas = super().update(**kwargs)
+            if linhas:
+                Contador.incrementar(CONTADOR_MOVIMENTOS)
+        return linhas
+
+    def delete(self):
+        with transaction.atomic(using=router.db_for_write(self.model), savepoint=False):
+            apagados, por_modelo = super().delete()
+            if apagados:
+                Contador.incrementar(CONTADOR_MOVIMENTOS)
+        return apagados, por_modelo
+
+    def com_status(self, hoje=None):
+        """Anota `status` (código de STATUS_EMPRESTIMO) com CASE/WHEN para um único `hoje`."""
+        hoje = hoje or timezone.now().date()
+        return self.annotate(status=models.Case(
+            *[models.When(q, then=models.Value(codigo)) for codigo, q in condicoes_status(hoje)],
+            default=models.Value('-'),
+            output_field=models.CharField(),
+        ))
+
+    def filtrar_status(self, codigo, hoje=None):
+        """
+        Equivalente a com_status(hoje).filter(status=codigo), mas escrito sobre as
+        colunas para que o banco use os índices parciais de empréstimo.
+        """
+        hoje = hoje or timezone.now().date()
+        for cod, q in condicoes_status(hoje):
+            if cod == codigo:
+                return self.filter(q)
+        return self.exclude(EMPRESTIMOS_Q) if codigo == '-' else self.none()
+
+    def contar_status(self, hoje=None):
+        """{código: quantidade} em uma consulta agrupada pela anotação."""
+        linhas = self.com_status(hoje).order_by().values('status').annotate(n=models.Count('id'))
+        return {linha['status']: linha['n'] for linha in linhas}
+
+
 class Material(models.Model):
     nome = models.CharField(max_length=200)
     descricao = models.TextField(blank=True)
@@ -10,10 +285,80 @@ class Material(models.Model):
     quantidade = models.IntegerField(default=0)
     minimo = models.IntegerField(default=0)
     criado = models.DateTimeField(auto_now_add=True)
+    atualizado = models.DateTimeField(auto_now=True)
+    # versão de sincronização, crescente a cada escrita (ver api_sync)
+    versao = models.BigIntegerField(default=0, db_index=True, editable=False)
+    # desde quando está abaixo do mínimo (None = fora de alerta); mantido por save() e ajustar()
+    alerta_desde = models.DateTimeField(null=True, blank=True, editable=False)
+    # hash do conteúdo da imagem cujas miniaturas já foram geradas (vazio = ainda não geradas)
+    imagem_hash = models.CharField(max_length=16, blank=True, default='', editable=False)
+
+    objects = MaterialQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # listagens e exportações ordenadas por nome (id desempata)
+            models.Index(fields=['nome', 'id'], name='material_nome_idx'),
+            # alertas: só os materiais em alerta entram no índice
+            models.Index(fields=['nome'], condition=models.Q(alerta_desde__isnull=False),
+                         name='material_alerta_idx'),
+        ]
 
     def __str__(self):
         return f"{self.nome} ({self.quantidade})"
 
+    @property
+    def thumb_url(self):
+        return url_miniatura(self.imagem.storage, self.imagem.name, self.imagem_hash, 'thumb')
+
+    @property
+    def preview_url(self):
+        return url_miniatura(self.imagem.storage, self.imagem.name, self.imagem_hash, 'preview')
+
+    def save(self, *args, **kwargs):
+        agora = timezone.now()
+        estava = self.alerta_desde is not None
+        esta = self.quantidade < self.minimo
+        self.alerta_desde = (self.alerta_desde or agora) if esta else None
+        self.versao = proxima_versao()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'versao', 'alerta_desde'}
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            PeriodoAlerta.registrar_transicao(self.pk, estava, esta, agora)
+        # o valor gravado é lido do banco só se for acessado
+        del self.__dict__['versao']
+
+
+class PeriodoAlerta(models.Model):
+    """Histórico de alertas: cada intervalo em que o material ficou abaixo do mínimo."""
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, related_name='periodos_alerta')
+    inicio = models.DateTimeField()
+    fim = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-inicio']
+        indexes = [
+            models.Index(fields=['material'], condition=models.Q(fim__isnull=True),
+                         name='periodo_alerta_aberto_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.material_id}: {self.inicio:%d/%m/%Y %H:%M} - {self.fim or 'em aberto'}"
+
+    @property
+    def duracao(self):
+        return (self.fim or timezone.now()) - self.inicio
+
+    @classmethod
+    def registrar_transicao(cls, material_id, estava, esta, quando):
+        """Abre ou fecha o período quando o material entra ou sai de alerta."""
+        if esta and not estava:
+            cls.objects.create(material_id=material_id, inicio=quando)
+        elif estava and not esta:
+            cls.objects.filter(material_id=material_id, fim__isnull=True).update(fim=quando)
+
 class Movimento(models.Model):
     MATERIAL_TIPOS = [
         ('ENTRADA', 'Entrada'),
@@ -29,94 +374,320 @@ class Movimento(models.Model):
     nota = models.CharField(max_length=200, blank=True)
     data_devolucao = models.DateField(null=True, blank=True)
     criado = models.DateTimeField(auto_now_add=True)
+    atualizado = models.DateTimeField(auto_now=True)
+
+    objects = MovimentoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # exportação de movimentos: ordem por criado e filtros de período
+            models.Index(fields=['criado'], name='movimento_criado_idx'),
+            # emprestimos_list / export_emprestimos: EMPRESTIMO+DEVOLVIDO por data de devolução
+            models.Index(fields=['data_devolucao'], condition=EMPRESTIMOS_Q, name='movimento_emprestimos_idx'),
+            # dashboard: empréstimos em aberto por data de devolução
+            models.Index(fields=['data_devolucao'], condition=models.Q(tipo='EMPRESTIMO'),
+                         name='movimento_emp_aberto_idx'),
+            # saldos históricos: movimentos de um material depois de um snapshot
+            models.Index(fields=['material', 'criado'], name='movimento_material_criado_idx'),
+        ]
+
+    @staticmethod
+    def efeito_estoque(tipo, quantidade):
+        """Variação assinada que um movimento aplica em Material.quantidade."""
+        if not quantidade:
+            return 0
+        if tipo in TIPOS_POSITIVOS:
+            return quantidade
+        if tipo in TIPOS_NEGATIVOS:
+            return -quantidade
+        # EMPRESTIMO, DEVOLVIDO e DELETE não alteram quantidade
+        return 0
+
+    def _aplicar_deltas(self, deltas):
+        # um UPDATE por material afetado; atualiza a instância em memória
+        for material_id, delta in deltas.items():
+            if not delta:
+                continue
+            saldo = Material.objects.ajustar(material_id, delta)
+            if saldo is not None and material_id == self.material_id and Movimento.material.is_cached(self):
+                self.material.quantidade = saldo
 
     def save(self, *args, **kwargs):
         # ajustar comportamento de alteração de quantidade via kwargs
         adjust = kwargs.pop('adjust_material', True)
-        positive = ('ENTRADA', 'ADICAO')
-        negative = ('SAIDA',)  # EMPRESTIMO não altera quantidade
         with transaction.atomic():
+            prev = None
             if self.pk:
-                prev = Movimento.objects.select_for_update().get(pk=self.pk)
-                if adjust:
-                    # reverter efeito do movimento anterior (se houver material)
-                    if prev.material:
-                        if prev.tipo in positive:
-                            prev.material.quantidade -= prev.quantidade
-                        elif prev.tipo in negative:
-                            prev.material.quantidade += prev.quantidade
-                        prev.material.save()
-                    # aplicar efeito do novo movimento (se houver material)
-                    if self.material:
-                        if self.tipo in positive:
-                            self.material.quantidade += self.quantidade
-                        elif self.tipo in negative:
-                            self.material.quantidade -= self.quantidade
-                        # EMPRESTIMO e DELETE não alteram quantidade
-                        self.material.save()
-            else:
-                # criação: aplicar efeito quando aplicável
-                if adjust and self.material:
-                    if self.tipo in positive:
-                        self.material.quantidade += self.quantidade
-                    elif self.tipo in negative:
-                        self.material.quantidade -= self.quantidade
-                    # EMPRESTIMO e DELETE não alteram quantidade
-                    self.material.save()
+                # estado anterior: reverte o efeito no estoque e no consolidado diário
+                prev = (
+                    Movimento.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values_list('material_id', 'tipo', 'quantidade', 'criado')
+                    .first()
+                )
+            if adjust:
+                deltas = defaultdict(int)
+                if prev and prev[0]:
+                    deltas[prev[0]] -= self.efeito_estoque(prev[1], prev[2])
+                # aplicar efeito do novo movimento (se houver material)
+                if self.material_id:
+                    deltas[self.material_id] += self.efeito_estoque(self.tipo, self.quantidade)
+                self._aplicar_deltas(deltas)
 
             super().save(*args, **kwargs)
+            Contador.incrementar(CONTADOR_MOVIMENTOS)
+
+            variacoes = MovimentoDiario.variacoes()
+            if prev:
+                MovimentoDiario.somar(variacoes, *prev, sinal=-1)
+            MovimentoDiario.somar(variacoes, self.material_id, self.tipo, self.quantidade, self.criado)
+            MovimentoDiario.objects.acumular(variacoes)
 
     def delete(self, *args, **kwargs):
         adjust = kwargs.pop('adjust_material', True)
-        positive = ('ENTRADA', 'ADICAO')
-        negative = ('SAIDA',)  # EMPRESTIMO não altera quantidade
         with transaction.atomic():
-            if adjust and self.material:
-                if self.tipo in positive:
-                    self.material.quantidade -= self.quantidade
-                elif self.tipo in negative:
-                    self.material.quantidade += self.quantidade
-                # EMPRESTIMO and DELETE: nada a reverter na quantidade
-                self.material.save()
-            super().delete(*args, **kwargs)
+            if adjust and self.material_id:
+                self._aplicar_deltas({self.material_id: -self.efeito_estoque(self.tipo, self.quantidade)})
+            variacoes = MovimentoDiario.variacoes()
+            MovimentoDiario.somar(variacoes, self.material_id, self.tipo, self.quantidade, self.criado, sinal=-1)
+            MovimentoDiario.objects.acumular(variacoes)
+            Contador.incrementar(CONTADOR_MOVIMENTOS)
+            return super().delete(*args, **kwargs)
 
-    @property
-    def status_display(self):
-        if self.tipo == 'DEVOLVIDO':
-            return 'Concluído'
-        if self.tipo == 'EMPRESTIMO':
-            if self.data_devolucao:
-                if self.data_devolucao < timezone.now().date():
-                    return 'Atrasado'
+    @staticmethod
+    def codigo_status(tipo, data_devolucao, hoje):
+        """Mesmo resultado da anotação de MovimentoQuerySet.com_status, em Python."""
+        if tipo == 'DEVOLVIDO':
+            return 'concluido'
+        if tipo == 'EMPRESTIMO':
+            if data_devolucao:
+                if data_devolucao < hoje:
+                    return 'atrasado'
                 else:
-                    return 'Em andamento'
-            return 'Sem data'
+                    return 'andamento'
+            return 'sem_data'
         return '-'
 
+    @staticmethod
+    def calcular_status(tipo, data_devolucao, hoje):
+        return STATUS_EMPRESTIMO[Movimento.codigo_status(tipo, data_devolucao, hoje)][0]
+
+    def _status(self):
+        # usa a anotação de com_status() quando presente (sem timezone.now() por linha)
+        codigo = self.__dict__.get('status')
+        if codigo is None:
+            codigo = self.codigo_status(self.tipo, self.data_devolucao, timezone.now().date())
+        return STATUS_EMPRESTIMO[codigo]
+
+    @property
+    def status_display(self):
+        return self._status()[0]
+
     @property
     def status_color(self):
-        if self.tipo == 'DEVOLVIDO':
-            return '#28a745'  # verde
-        if self.tipo == 'EMPRESTIMO':
-            if self.data_devolucao:
-                if self.data_devolucao < timezone.now().date():
-                    return '#FF3333'  # vermelho
-                else:
-                    return '#ffc107'  # amarelo
-            return '#6c757d'  # cinza
-        return '#adb5bd'  # cinza claro
+        return self._status()[1]
 
     @property
     def status_badge_class(self):
         # Classes de badge Bootstrap para melhor visibilidade
-        if self.tipo == 'DEVOLVIDO':
-            return 'bg-success'
-        if self.tipo == 'EMPRESTIMO':
-            if self.data_devolucao:
-                if self.data_devolucao < timezone.now().date():
-                    return 'bg-danger'
-                else:
-                    # Amarelo com texto escuro para melhor contraste
-                    return 'bg-warning text-dark'
-            return 'bg-secondary'
-        return 'bg-secondary'
+        return self._status()[2]
+
+
+class MaterialRemovido(models.Model):
+    """Registro (tombstone) de material excluído, para a sincronização incremental."""
+    material_id = models.BigIntegerField()
+    nome = models.CharField(max_length=200)
+    removido = models.DateTimeField(auto_now_add=True)
+    # a remoção também consome uma versão (ver proxima_versao)
+    versao = models.BigIntegerField(default=0, db_index=True, editable=False)
+
+    def __str__(self):
+        return f"{self.nome} (#{self.material_id})"
+
+
+class SaldoSnapshot(models.Model):
+    """Saldo de um material num instante (checkpoint), base das consultas de saldo histórico."""
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, related_name='snapshots')
+    momento = models.DateTimeField()
+    quantidade = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['material', 'momento'], name='snapshot_material_momento_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['momento'], name='snapshot_momento_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.material_id} em {self.momento:%d/%m/%Y %H:%M}: {self.quantidade}"
+
+
+class MovimentoDiarioQuerySet(models.QuerySet):
+    def acumular(self, variacoes, lote=500):
+        """
+        Soma as variações ({(material_id, dia, tipo): [quantidade, total]}) nas
+        linhas do consolidado com INSERT ... ON CONFLICT DO UPDATE: um comando
+        por lote de chaves, sem ler as linhas antes.
+        """
+        linhas = [(*chave, q, n) for chave, (q, n) in variacoes.items() if q or n]
+        if not linhas:
+            return
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        meta = self.model._meta
+        table = qn(meta.db_table)
+        colunas = [meta.get_field(nome).column for nome in ('material', 'dia', 'tipo', 'quantidade', 'total')]
+        dia = meta.get_field('dia')
+        with connection.cursor() as cursor:
+            for inicio in range(0, len(linhas), lote):
+                parte = linhas[inicio:inicio + lote]
+                params = []
+                for material_id, data, tipo, quantidade, total in parte:
+                    params += [material_id, dia.get_db_prep_value(data, connection), tipo, quantidade, total]
+                cursor.execute(
+                    f'INSERT INTO {table} ({", ".join(qn(c) for c in colunas)}) '
+                    f'VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(parte))} '
+                    f'ON CONFLICT ({", ".join(qn(c) for c in colunas[:3])}) DO UPDATE SET '
+                    + ', '.join(f'{qn(c)} = {table}.{qn(c)} + excluded.{qn(c)}' for c in colunas[3:]),
+                    params,
+                )
+
+    def periodo(self, inicio=None, fim=None):
+        qs = self
+        if inicio:
+            qs = qs.filter(dia__gte=inicio)
+        if fim:
+            qs = qs.filter(dia__lte=fim)
+        return qs
+
+
+class MovimentoDiario(models.Model):
+    """
+    Consolidado diário de movimentos por (material, dia, tipo): soma das
+    quantidades e número de movimentos. Mantido por Movimento.save/delete e
+    pelo lote; relatórios por período leem daqui em vez dos movimentos.
+    Movimentos sem material não entram.
+    """
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, related_name='consolidado_diario')
+    dia = models.DateField()
+    tipo = models.CharField(max_length=12)
+    quantidade = models.BigIntegerField(default=0)
+    total = models.IntegerField(default=0)
+
+    objects = MovimentoDiarioQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['material', 'dia', 'tipo'], name='movimento_diario_chave_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['dia'], name='movimento_diario_dia_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.material_id} {self.dia:%d/%m/%Y} {self.tipo}: {self.quantidade} ({self.total})"
+
+    @staticmethod
+    def variacoes():
+        return defaultdict(lambda: [0, 0])
+
+    @staticmethod
+    def somar(variacoes, material_id, tipo, quantidade, criado, sinal=1):
+        """Acrescenta (ou, com sinal=-1, retira) um movimento das variações."""
+        if material_id and criado:
+            v = variacoes[(material_id, timezone.localdate(criado), tipo)]
+            v[0] += sinal * (quantidade or 0)
+            v[1] += sinal
+
+
+class ExportacoesStorage(FileSystemStorage):
+    """Arquivos de exportação ficam fora de MEDIA_ROOT (não são públicos)."""
+
+    @property
+    def base_location(self):
+        return getattr(settings, 'EXPORTACOES_ROOT', settings.BASE_DIR / 'exportacoes')
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+
+_exportacoes_storage = ExportacoesStorage()
+
+
+def exportacoes_storage():
+    return _exportacoes_storage
+
+
+class Exportacao(models.Model):
+    """Relatório gerado em segundo plano (ver comando processar_exportacoes)."""
+    RELATORIOS = [
+        ('materiais', 'Materiais'),
+        ('alertas', 'Alertas'),
+        ('emprestimos', 'Empréstimos'),
+        ('movimentos', 'Movimentos'),
+    ]
+    FORMATOS = [('csv', 'CSV'), ('xlsx', 'Excel (.xlsx)')]
+    STATUS = [
+        ('PENDENTE', 'Pendente'),
+        ('PROCESSANDO', 'Processando'),
+        ('CONCLUIDA', 'Concluída'),
+        ('ERRO', 'Erro'),
+    ]
+    relatorio = models.CharField(max_length=20, choices=RELATORIOS)
+    formato = models.CharField(max_length=4, choices=FORMATOS, default='csv')
+    inicio = models.DateField(null=True, blank=True)
+    fim = models.DateField(null=True, blank=True)
+    assinatura = models.CharField(max_length=40)
+    status = models.CharField(max_length=12, choices=STATUS, default='PENDENTE')
+    arquivo = models.FileField(upload_to='%Y/%m/', storage=exportacoes_storage, blank=True)
+    erro = models.TextField(blank=True)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    criado = models.DateTimeField(auto_now_add=True)
+    # quando um worker assumiu o pedido (PROCESSANDO); identifica quem pode concluí-lo
+    iniciado = models.DateTimeField(null=True, blank=True)
+    # último sinal de vida do worker durante a geração; parado há muito tempo = worker morreu
+    batimento = models.DateTimeField(null=True, blank=True)
+    concluido = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['relatorio', 'formato', 'inicio', 'fim', 'assinatura'], name='exportacao_chave_idx'),
+            models.Index(fields=['status', 'criado'], name='exportacao_fila_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.relatorio}.{self.formato} ({self.get_status_display()})"
+
+
+class ArquivoMovimentosStorage(ExportacoesStorage):
+    """Blocos de movimentos arquivados (ver stock.arquivo), também fora de MEDIA_ROOT."""
+
+    @property
+    def base_location(self):
+        return getattr(settings, 'ARQUIVO_MOVIMENTOS_ROOT', settings.BASE_DIR / 'arquivo_movimentos')
+
+
+_arquivo_movimentos_storage = ArquivoMovimentosStorage()
+
+
+def arquivo_movimentos_storage():
+    return _arquivo_movimentos_storage
+
+
+class ArquivoMovimentos(models.Model):
+    """Bloco mensal de movimentos arquivados (gzip/CSV); ver comando arquivar_movimentos."""
+    mes = models.DateField()
+    inicio = models.DateTimeField()  # criado do movimento mais antigo do bloco
+    fim = models.DateTimeField()     # criado do mais recente
+    corte = models.DateTimeField()   # corte usado no arquivamento que gerou o bloco
+    linhas = models.IntegerField()
+    arquivo = models.FileField(upload_to='%Y/', storage=arquivo_movimentos_storage)
+    criado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-fim']
+
+    def __str__(self):
+        return f"{self.mes:%m/%Y}: {self.linhas} movimentos"
@@ -0,0 +1,104 @@
+"""
+Paginação por cursor (keyset) para as listagens.
+
+Em vez de OFFSET, cada página começa logo depois da última linha da página
+anterior: WHERE (campo, id) > (último valor, último id) ORDER BY campo, id
+LIMIT n. O custo de uma página não depende de quantas linhas vieram antes,
+e os índices (campo, id) / parciais por data são usados diretamente.
+"""
+import base64
+import binascii
+import json
+
+from django.db import connections
+from django.db.models import Q
+
+TAMANHO_PADRAO = 25
+TAMANHO_MAXIMO = 100
+
+
+class Pagina:
+    def __init__(self, itens, proximo=None, anterior=None, tamanho=TAMANHO_PADRAO):
+        self.itens = itens
+        self.proximo = proximo    # cursor da próxima página (ou None)
+        self.anterior = anterior  # cursor da página anterior (ou None)
+        self.tamanho = tamanho
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+
+def tamanho_pagina(valor, padrao=TAMANHO_PADRAO):
+    try:
+        return max(1, min(int(valor), TAMANHO_MAXIMO))
+    except (TypeError, ValueError):
+        return padrao
+
+
+def _codificar(valor, pk, para_tras):
+    dados = json.dumps([valor, pk, 'p' if para_tras else 'n'], default=str)
+    return base64.urlsafe_b64encode(dados.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decodificar(cursor):
+    """Devolve (valor, pk, para_tras) ou None se o cursor for inválido."""
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        valor, pk, direcao = json.loads(bruto)
+        return valor, int(pk), direcao == 'p'
+    except (ValueError, TypeError, binascii.Error):
+        return None
+
+
+def _depois_de(campo, valor, pk, crescente, nulos_antes):
+    """Q das linhas que vêm depois de (valor, pk) na ordem (campo, id)."""
+    op = 'gt' if crescente else 'lt'
+    if valor is None:
+        depois = Q(**{f'{campo}__isnull': True, f'pk__{op}': pk})
+        if nulos_antes:
+            depois |= Q(**{f'{campo}__isnull': False})
+        return depois
+    depois = Q(**{f'{campo}__{op}': valor}) | Q(**{campo: valor, f'pk__{op}': pk})
+    if nulos_antes:
+        # termo redundante que dá ao banco uma faixa do índice para percorrer
+        return Q(**{f'{campo}__{op}e': valor}) & depois
+    return depois | Q(**{f'{campo}__isnull': True})
+
+
+def paginar(qs, campo, cursor=None, tamanho=TAMANHO_PADRAO, descendente=False):
+    """Uma página de `qs` ordenada por (campo, id), a partir de `cursor`."""
+    field = qs.model._meta.get_field(campo)
+    nulos_maiores = connections[qs.db].features.nulls_order_largest
+    posicao = _decodificar(cursor) if cursor else None
+    para_tras = bool(posicao and posicao[2])
+
+    crescente = descendente == para_tras
+    # em ordem crescente o NULL vem antes, exceto nos bancos em que é o maior valor
+    nulos_antes = crescente != nulos_maiores
+    if posicao:
+        valor = field.to_python(posicao[0]) if posicao[0] is not None else None
+        qs = qs.filter(_depois_de(campo, valor, posicao[1], crescente, nulos_antes))
+    sinal = '' if crescente else '-'
+    itens = list(qs.order_by(f'{sinal}{campo}', f'{sinal}pk')[:tamanho + 1])
+
+    mais = len(itens) > tamanho
+    itens = itens[:tamanho]
+    if para_tras:
+        itens.reverse()
+    tem_proxima = mais if not para_tras else True
+    tem_anterior = mais if para_tras else posicao is not None
+    if not itens:
+        return Pagina(itens, tamanho=tamanho)
+
+    def cursor_de(obj, tras):
+        return _codificar(field.value_to_string(obj) if getattr(obj, campo) is not None else None, obj.pk, tras)
+
+    return Pagina(
+        itens,
+        proximo=cursor_de(itens[-1], False) if tem_proxima else None,
+        anterior=cursor_de(itens[0], True) if tem_anterior else None,
+        tamanho=tamanho,
+    )
@@ -0,0 +1,95 @@
+"""
+Consumo e previsão de ruptura de estoque.
+
+As saídas (SAIDA) da janela analisada vêm do consolidado diário como
+colunas (values_list) e viram uma matriz materiais x dias em NumPy; taxas diárias,
+médias móveis e dias até o mínimo são calculados de uma vez para todos os
+materiais, sem laço em Python por material ou por movimento.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Material, MovimentoDiario
+
+JANELA_DIAS = 90
+MEDIAS_MOVEIS = (7, 30)
+CACHE_SEGUNDOS = 24 * 60 * 60
+HORIZONTE_DIAS = 10 * 365
+
+
+def _colunas(qs, *campos):
+    """values_list() -> um array NumPy por campo (vazios se não houver linhas)."""
+    linhas = list(qs.values_list(*campos))
+    if not linhas:
+        return [np.empty(0, dtype=object) for _ in campos]
+    return [np.asarray(coluna, dtype=object) for coluna in zip(*linhas)]
+
+
+def consumo_diario(ids, hoje, janela=JANELA_DIAS):
+    """
+    Matriz len(ids) x janela com o total de SAIDA de cada material (ids em
+    ordem crescente) por dia da janela que termina em `hoje` (coluna -1 = hoje).
+    """
+    inicio = hoje - timedelta(days=janela - 1)
+    material, dia, quantidade = _colunas(
+        MovimentoDiario.objects.filter(tipo='SAIDA', dia__gte=inicio, dia__lte=hoje).order_by(),
+        'material_id', 'dia', 'quantidade',
+    )
+    if not len(material):
+        return np.zeros((len(ids), janela))
+    dia = (dia.astype('datetime64[D]') - np.datetime64(inicio, 'D')).astype(np.int64)
+    linha = np.searchsorted(ids, material.astype(np.int64))
+    # bincount no índice achatado soma as saídas de cada (material, dia)
+    return np.bincount(linha * janela + dia, weights=quantidade.astype(np.float64),
+                       minlength=len(ids) * janela).reshape(len(ids), janela)
+
+
+def prever(hoje, janela=JANELA_DIAS):
+    """
+    Previsão para todos os materiais, ordenada pelos que chegam primeiro ao
+    mínimo. A taxa usada é a média móvel mais longa (30 dias); materiais sem
+    saídas na janela ficam sem previsão (None).
+    """
+    pk, quantidade, minimo, nome = _colunas(Material.objects.order_by('pk'), 'pk', 'quantidade', 'minimo', 'nome')
+    pk, quantidade, minimo = pk.astype(np.int64), quantidade.astype(np.int64), minimo.astype(np.int64)
+    matriz = consumo_diario(pk, hoje, janela)
+
+    taxa_janela = matriz.mean(axis=1)
+    medias = {d: matriz[:, -d:].mean(axis=1) for d in MEDIAS_MOVEIS if d <= janela}
+    taxa = medias[max(medias)] if medias else taxa_janela
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dias_minimo = np.where(taxa > 0, np.maximum(quantidade - minimo, 0) / taxa, np.inf)
+        dias_zerar = np.where(taxa > 0, np.maximum(quantidade, 0) / taxa, np.inf)
+
+    resultado = []
+    for i in np.lexsort((pk, dias_minimo)).tolist():
+        finito = bool(np.isfinite(dias_minimo[i]))
+        resultado.append({
+            'material_id': int(pk[i]),
+            'nome': nome[i],
+            'quantidade': int(quantidade[i]),
+            'minimo': int(minimo[i]),
+            'taxa_diaria': round(float(taxa_janela[i]), 3),
+            'medias_moveis': {f'{d}d': round(float(m[i]), 3) for d, m in medias.items()},
+            'dias_ate_minimo': round(float(dias_minimo[i]), 1) if finito else None,
+            'dias_ate_zerar': round(float(dias_zerar[i]), 1) if finito else None,
+            # acima de HORIZONTE_DIAS a data não tem significado prático
+            'data_minimo': (hoje + timedelta(days=int(dias_minimo[i]))
+                            if finito and dias_minimo[i] <= HORIZONTE_DIAS else None),
+        })
+    return resultado
+
+
+def previsao_do_dia(hoje=None):
+    """prever() em cache até o fim do dia (a chave leva a data)."""
+    hoje = hoje or timezone.localdate()
+    chave = f'previsao:{hoje}'
+    resultado = cache.get(chave)
+    if resultado is None:
+        resultado = prever(hoje)
+        cache.set(chave, resultado, CACHE_SEGUNDOS)
+    return resultado
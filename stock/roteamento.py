@@ -0,0 +1,163 @@
+"""
+Banco de relatórios (réplica só de leitura).
+
+Quando settings.DATABASES tem o alias RELATORIOS_ALIAS, as leituras feitas
+dentro de relatorios() (ou de uma view decorada com leitura_relatorios) vão
+para ele, tirando as exportações e consultas analíticas do banco usado pelo
+balcão. Escritas e migrações vão sempre para o banco principal.
+
+A réplica pode ser um segundo arquivo SQLite, copiado do principal com a API
+de backup do SQLite pelo comando atualizar_relatorios, ou qualquer banco que o
+Django acesse (ex.: réplica do PostgreSQL). Se a cópia SQLite estiver mais
+velha que RELATORIOS_DEFASAGEM_MAX segundos, as leituras voltam para o
+banco principal até a próxima atualização.
+"""
+import contextvars
+import functools
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+RELATORIOS_ALIAS = 'relatorios'
+
+_em_relatorio = contextvars.ContextVar('em_relatorio', default=False)
+
+
+def configurado():
+    return RELATORIOS_ALIAS in settings.DATABASES
+
+
+def _arquivo_sqlite():
+    # settings_dict da conexão: nos testes o alias espelha o banco de teste
+    config = connections[RELATORIOS_ALIAS].settings_dict
+    if config['ENGINE'] != 'django.db.backends.sqlite3':
+        return None
+    return str(config['NAME'])
+
+
+def defasagem():
+    """
+    Idade em segundos da cópia SQLite (pela data do arquivo, que é trocado a
+    cada atualização); None se não houver cópia. Réplicas de outros bancos
+    são mantidas pelo próprio banco e contam como em dia (0).
+    """
+    arquivo = _arquivo_sqlite()
+    if arquivo is None:
+        return 0
+    try:
+        return time.time() - os.path.getmtime(arquivo)
+    except OSError:
+        return None
+
+
+def disponivel():
+    if not configurado():
+        return False
+    idade = defasagem()
+    limite = getattr(settings, 'RELATORIOS_DEFASAGEM_MAX', None)
+    return idade is not None and (limite is None or idade <= limite)
+
+
+def em_relatorio():
+    return _em_relatorio.get()
+
+
+@contextmanager
+def relatorios():
+    """Leituras dentro do bloco usam o banco de relatórios (se disponível)."""
+    token = _em_relatorio.set(True)
+    try:
+        yield
+    finally:
+        _em_relatorio.reset(token)
+
+
+def _iterar_em_relatorio(iteravel):
+    # o corpo de respostas em streaming é gerado depois que a view retorna:
+    # cada pedaço é produzido dentro do contexto de relatório
+    iterador = iter(iteravel)
+    while True:
+        with relatorios():
+            try:
+                pedaco = next(iterador)
+            except StopIteration:
+                return
+        yield pedaco
+
+
+def leitura_relatorios(view):
+    """Decorator para views somente leitura de relatórios e análises."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with relatorios():
+            response = view(request, *args, **kwargs)
+        if getattr(response, 'streaming', False) and not getattr(response, 'file_to_stream', None):
+            response.streaming_content = _iterar_em_relatorio(response.streaming_content)
+        return response
+    return wrapper
+
+
+class RelatoriosRouter:
+    """Leituras em contexto de relatório vão para a réplica; escritas e migrações, nunca."""
+
+    def db_for_read(self, model, **hints):
+        if em_relatorio() and disponivel():
+            return RELATORIOS_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # a réplica tem os mesmos dados do principal
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == RELATORIOS_ALIAS:
+            return False
+        return None
+
+
+def copiar_sqlite(origem, destino):
+    """
+    Copia o banco SQLite `origem` para `destino` com a API de backup (uma
+    leitura consistente, sem bloquear as escritas no modo WAL). A cópia é
+    feita num arquivo temporário, passada para o journal clássico (sem
+    arquivos -wal ao lado) e só então substitui `destino` de uma vez:
+    conexões abertas continuam lendo a cópia anterior até fecharem.
+    """
+    pasta = os.path.dirname(os.path.abspath(destino))
+    os.makedirs(pasta, exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=pasta, suffix='.sqlite3.tmp')
+    os.close(fd)
+    try:
+        fonte = sqlite3.connect(origem)
+        copia = sqlite3.connect(temporario)
+        try:
+            fonte.backup(copia)
+            copia.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            copia.close()
+            fonte.close()
+        os.replace(temporario, destino)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    return os.path.getsize(destino)
+
+
+def atualizar():
+    """Atualiza a cópia SQLite de relatórios a partir do banco principal. Devolve o tamanho em bytes."""
+    destino = _arquivo_sqlite()
+    origem = connections[DEFAULT_DB_ALIAS].settings_dict
+    if destino is None or origem['ENGINE'] != 'django.db.backends.sqlite3':
+        raise ValueError('A cópia por backup só vale para SQLite; outras réplicas são mantidas pelo próprio banco.')
+    # conexões persistentes deste processo apontariam para o arquivo substituído
+    connections[RELATORIOS_ALIAS].close()
+    return copiar_sqlite(str(origem['NAME']), destino)
@@ -4,9 +4,10 @@ from .models import Material
 
 class MaterialSerializer(serializers.ModelSerializer):
     imagem_url = serializers.SerializerMethodField()
+    thumb_url = serializers.SerializerMethodField()
     class Meta:
         model = Material
-        fields = ['id', 'nome', 'quantidade', 'imagem_url']
+        fields = ['id', 'nome', 'quantidade', 'imagem_url', 'thumb_url']
 
     def get_imagem_url(self, obj):
         request = self.context.get('request')
@@ -16,3 +17,10 @@ class MaterialSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(url)
             return url
         return None
+
+    def get_thumb_url(self, obj):
+        request = self.context.get('request')
+        url = obj.thumb_url
+        if url and request is not None:
+            return request.build_absolute_uri(url)
+        return url
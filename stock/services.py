@@ -0,0 +1,699 @@
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.core.files import File
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.forms.utils import ErrorList
+from django.utils import timezone
+
+from . import arquivo, exports
+from .forms import MovimentoLoteForm, validar_movimento
+from .models import (
+    EMPRESTIMOS_Q, STATUS_EMPRESTIMO, ArquivoMovimentos, Exportacao, Material, MaterialRemovido, Movimento,
+    MovimentoDiario, PeriodoAlerta, SaldoSnapshot, efeito_estoque_sql, proxima_versao, url_miniatura,
+)
+
+
+def _validar_linha_lote(linha):
+    """
+    (dados limpos, erros) de uma linha de lote com os campos e o clean() de
+    MovimentoLoteForm aplicados direto: instanciar um Form por linha copia
+    campos e widgets, o que dominava o tempo do lote. Os erros têm o formato
+    de Form.errors.get_json_data().
+    """
+    if not isinstance(linha, dict):
+        linha = {}
+    dados, erros = {}, {}
+    for nome, campo in MovimentoLoteForm.base_fields.items():
+        try:
+            dados[nome] = campo.clean(linha.get(nome))
+        except ValidationError as exc:
+            erros[nome] = ErrorList(exc.error_list).get_json_data()
+    try:
+        validar_movimento(dados)
+    except ValidationError as exc:
+        erros[NON_FIELD_ERRORS] = ErrorList(exc.error_list).get_json_data()
+    return dados, erros
+
+
+def registrar_movimentos_lote(linhas, usuario=None, parcial=False, batch_size=500):
+    """
+    Registra uma lista de movimentos (dicts com material, tipo, quantidade,
+    nota, data_devolucao) em uma única transação.
+
+    Cada linha é validada com as regras de MovimentoLoteForm; os materiais são
+    conferidos com uma consulta só (dentro da transação, para que um material
+    excluído no meio do caminho vire erro da linha), os movimentos gravados
+    com bulk_create e o estoque ajustado com um UPDATE agregado por material.
+
+    Por padrão o lote é tudo-ou-nada: se alguma linha for inválida nada é
+    gravado. Com parcial=True as linhas válidas são aplicadas mesmo assim.
+
+    Devolve (aplicado, resultados), com um dict por linha cujo status é
+    'criado' (com id e saldo final do material após o lote), 'erro' (com os
+    erros de validação) ou 'nao_aplicado' (linha válida em lote rejeitado).
+    """
+    validadas = [_validar_linha_lote(linha) for linha in linhas]
+    saldos = {}
+    with transaction.atomic():
+        # FOR UPDATE (onde houver) impede que os materiais sejam excluídos até o commit
+        existentes = set(
+            Material.objects.select_for_update()
+            .filter(pk__in={dados['material'] for dados, erros in validadas if not erros})
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        resultados = []
+        movimentos = []
+        for i, (dados, erros) in enumerate(validadas):
+            if not erros and dados['material'] not in existentes:
+                erros = {'material': [{'message': 'Material inexistente.', 'code': ''}]}
+            if erros:
+                resultados.append({'linha': i, 'status': 'erro', 'erros': erros})
+                continue
+            movimentos.append(Movimento(
+                material_id=dados['material'],
+                usuario=usuario,
+                tipo=dados['tipo'],
+                quantidade=dados['quantidade'],
+                nota=dados['nota'] or '',
+                data_devolucao=dados['data_devolucao'],
+            ))
+            resultados.append({'linha': i, 'status': 'valido'})
+
+        com_erro = len(movimentos) != len(validadas)
+        if not movimentos or (com_erro and not parcial):
+            for r in resultados:
+                if r['status'] == 'valido':
+                    r['status'] = 'nao_aplicado'
+            return False, resultados
+
+        deltas = defaultdict(int)
+        for mv in movimentos:
+            deltas[mv.material_id] += Movimento.efeito_estoque(mv.tipo, mv.quantidade)
+
+        Movimento.objects.bulk_create(movimentos, batch_size=batch_size)
+        for material_id, delta in deltas.items():
+            if delta:
+                saldos[material_id] = Material.objects.ajustar(material_id, delta)
+        variacoes = MovimentoDiario.variacoes()
+        for mv in movimentos:
+            MovimentoDiario.somar(variacoes, mv.material_id, mv.tipo, mv.quantidade, mv.criado)
+        MovimentoDiario.objects.acumular(variacoes, lote=batch_size)
+    faltando = [mid for mid in deltas if mid not in saldos]
+    if faltando:
+        # materiais sem variação (ex.: só EMPRESTIMO): saldo atual em uma consulta
+        saldos.update(Material.objects.filter(pk__in=faltando).values_list('pk', 'quantidade'))
+
+    aplicados = iter(movimentos)
+    for r in resultados:
+        if r['status'] == 'valido':
+            mv = next(aplicados)
+            r.update(status='criado', id=mv.pk, material=mv.material_id, saldo=saldos.get(mv.material_id))
+    return True, resultados
+
+
+NOTA_EDICAO = 'Ajuste na edição do material'
+
+
+def salvar_material_editado(form, usuario=None):
+    """
+    Grava o MaterialForm de edição sem sobrescrever a quantidade: se ela foi
+    alterada, a diferença para o saldo atual vira um movimento ADICAO/SAIDA
+    (como na importação), então saldos históricos, snapshots e o consolidado
+    diário continuam batendo com o estoque. Devolve o material.
+    """
+    with transaction.atomic():
+        atual = Material.objects.select_for_update().values_list('quantidade', flat=True).get(pk=form.instance.pk)
+        mat = form.save(commit=False)
+        delta = mat.quantidade - atual if 'quantidade' in form.changed_data else 0
+        mat.quantidade = atual
+        mat.save()
+        if delta:
+            Movimento(material=mat, usuario=usuario, tipo='ADICAO' if delta > 0 else 'SAIDA',
+                      quantidade=abs(delta), nota=NOTA_EDICAO).save()
+    return mat
+
+
+# pedido PROCESSANDO sem batimento há mais que isso: o worker provavelmente morreu no meio
+EXPORTACAO_TRAVADA_MINUTOS = 30
+# intervalo mínimo entre dois batimentos do worker enquanto gera o arquivo
+EXPORTACAO_BATIMENTO_SEGUNDOS = 60
+
+
+class ExportacaoReassumida(Exception):
+    """O pedido voltou para a fila e foi assumido por outro worker durante a geração."""
+
+
+def _limite_travadas():
+    return timezone.now() - timedelta(minutes=EXPORTACAO_TRAVADA_MINUTOS)
+
+
+def solicitar_exportacao(relatorio, formato='csv', inicio=None, fim=None, usuario=None):
+    """
+    Devolve a Exportacao que atende o pedido: um arquivo já gerado com os
+    mesmos filtros e dados inalterados, um pedido igual ainda na fila (ou em
+    processamento, com batimento nos últimos EXPORTACAO_TRAVADA_MINUTOS), ou
+    um novo pedido PENDENTE para o comando processar_exportacoes.
+    """
+    if relatorio != 'movimentos':
+        # só o relatório de movimentos aceita período
+        inicio = fim = None
+    chave = dict(relatorio=relatorio, formato=formato, inicio=inicio, fim=fim)
+    assinatura = exports.assinatura(relatorio, inicio, fim)
+    reaproveitaveis = (
+        models.Q(status__in=['PENDENTE', 'CONCLUIDA'])
+        | models.Q(status='PROCESSANDO', batimento__gte=_limite_travadas())
+    )
+    existente = (
+        Exportacao.objects.filter(reaproveitaveis, assinatura=assinatura, **chave)
+        .order_by('-criado')
+        .first()
+    )
+    if existente:
+        return existente
+    return Exportacao.objects.create(assinatura=assinatura, usuario=usuario, **chave)
+
+
+def processar_exportacao(exportacao):
+    """
+    Gera o arquivo de uma Exportacao PENDENTE. Devolve False se outro worker
+    já a assumiu. Durante a geração renova o batimento (a cada
+    EXPORTACAO_BATIMENTO_SEGUNDOS), então um pedido longo não é tido como
+    travado. Status e arquivo só mudam enquanto o pedido ainda for deste
+    worker (mesmo `iniciado`): se ele voltou à fila e foi assumido por outro,
+    o arquivo gerado aqui é descartado. Ao concluir, apaga os arquivos
+    anteriores com os mesmos filtros.
+    """
+    iniciado = timezone.now()
+    if not Exportacao.objects.filter(pk=exportacao.pk, status='PENDENTE').update(
+        status='PROCESSANDO', iniciado=iniciado, batimento=iniciado,
+    ):
+        return False
+    exportacao.status = 'PROCESSANDO'
+    exportacao.iniciado = exportacao.batimento = iniciado
+    deste_worker = Exportacao.objects.filter(pk=exportacao.pk, status='PROCESSANDO', iniciado=iniciado)
+    ultimo_batimento = time.monotonic()
+
+    def batimento():
+        nonlocal ultimo_batimento
+        if time.monotonic() - ultimo_batimento < EXPORTACAO_BATIMENTO_SEGUNDOS:
+            return
+        ultimo_batimento = time.monotonic()
+        if not deste_worker.update(batimento=timezone.now()):
+            raise ExportacaoReassumida(exportacao.pk)
+
+    try:
+        # a assinatura gravada é a dos dados no momento da geração
+        assinatura = exports.assinatura(exportacao.relatorio, exportacao.inicio, exportacao.fim)
+        with tempfile.TemporaryFile() as tmp:
+            exports.gravar(exportacao.relatorio, exportacao.formato, tmp, exportacao.inicio, exportacao.fim,
+                           progresso=batimento)
+            tmp.seek(0)
+            nome = f'{exportacao.relatorio}_{exportacao.pk}.{exportacao.formato}'
+            exportacao.arquivo.save(nome, File(tmp), save=False)
+    except ExportacaoReassumida:
+        return False
+    except Exception as exc:
+        exportacao.status = 'ERRO'
+        exportacao.erro = str(exc)
+        exportacao.concluido = timezone.now()
+        deste_worker.update(status='ERRO', erro=exportacao.erro, concluido=exportacao.concluido)
+        raise
+    concluido = timezone.now()
+    if not deste_worker.update(assinatura=assinatura, status='CONCLUIDA', arquivo=exportacao.arquivo.name,
+                               concluido=concluido):
+        exportacao.arquivo.delete(save=False)
+        return False
+    exportacao.assinatura = assinatura
+    exportacao.status = 'CONCLUIDA'
+    exportacao.concluido = concluido
+
+    # só as concluídas antes desta: com dois pedidos terminando juntos, o mais novo fica
+    antigas = Exportacao.objects.filter(
+        relatorio=exportacao.relatorio, formato=exportacao.formato,
+        inicio=exportacao.inicio, fim=exportacao.fim, status='CONCLUIDA', concluido__lt=concluido,
+    ).exclude(pk=exportacao.pk)
+    for antiga in antigas:
+        antiga.arquivo.delete(save=False)
+        antiga.delete()
+    return True
+
+
+def reenfileirar_exportacoes_travadas():
+    """
+    Devolve à fila (PENDENTE) os pedidos PROCESSANDO sem batimento há mais
+    de EXPORTACAO_TRAVADA_MINUTOS, deixados por um worker que caiu. Devolve
+    quantos foram reenfileirados.
+    """
+    # sem `batimento`: assumidos antes de o campo existir
+    travadas = models.Q(batimento__lt=_limite_travadas()) | models.Q(batimento__isnull=True)
+    return Exportacao.objects.filter(travadas, status='PROCESSANDO').update(
+        status='PENDENTE', iniciado=None, batimento=None,
+    )
+
+
+SYNC_LIMITE_PADRAO = 500
+
+
+def cursor_sync(materiais=0, removidos=0, movimentos=0):
+    return f'{materiais}.{removidos}.{movimentos}'
+
+
+def ler_cursor_sync(cursor):
+    """'m.r.v' -> (versão de material, id de remoção, id de movimento). ValueError se inválido."""
+    if not cursor:
+        return 0, 0, 0
+    partes = [int(p) for p in cursor.split('.')]
+    if len(partes) != 3 or min(partes) < 0:
+        raise ValueError(cursor)
+    return tuple(partes)
+
+
+def sincronizar(cursor=None, limite=SYNC_LIMITE_PADRAO):
+    """
+    O que mudou desde `cursor`: materiais criados/alterados (pela versão),
+    materiais removidos (tombstones) e movimentos novos (pelo id), até `limite`
+    itens de cada tipo. O cursor devolvido é monotônico; se `completo` for False
+    ainda há alterações e o cliente deve pedir de novo com o novo cursor.
+    """
+    m_cursor, r_cursor, v_cursor = ler_cursor_sync(cursor)
+    # Sem transação: com BEGIN IMMEDIATE ela tomaria o lock de escrita só para ler.
+    # Cada tabela avança pelo seu cursor, então leituras em instantes diferentes não
+    # perdem nada. Os movimentos vêm primeiro: um material citado por eles já existe
+    # quando os materiais são lidos, e aparece nesta página ou na próxima.
+    movimentos = list(
+        Movimento.objects.filter(id__gt=v_cursor).order_by('id')
+        .values('id', 'material_id', 'usuario__username', 'tipo', 'quantidade', 'nota',
+                'data_devolucao', 'criado')[:limite]
+    )
+    materiais = list(
+        Material.objects.filter(versao__gt=m_cursor).order_by('versao')
+        .values('id', 'nome', 'descricao', 'quantidade', 'minimo', 'imagem', 'imagem_hash', 'atualizado',
+                'versao')[:limite]
+    )
+    removidos = list(
+        MaterialRemovido.objects.filter(id__gt=r_cursor).order_by('id')
+        .values('id', 'material_id', 'nome', 'removido')[:limite]
+    )
+
+    storage = Material._meta.get_field('imagem').storage
+    for m in materiais:
+        imagem, hash_imagem = m.pop('imagem'), m.pop('imagem_hash')
+        m['imagem_url'] = storage.url(imagem) if imagem else None
+        m['thumb_url'] = url_miniatura(storage, imagem, hash_imagem)
+    for mv in movimentos:
+        mv['usuario'] = mv.pop('usuario__username')
+
+    return {
+        'materiais': materiais,
+        'removidos': removidos,
+        'movimentos': movimentos,
+        'cursor': cursor_sync(
+            materiais[-1]['versao'] if materiais else m_cursor,
+            removidos[-1]['id'] if removidos else r_cursor,
+            movimentos[-1]['id'] if movimentos else v_cursor,
+        ),
+        'completo': max(len(materiais), len(removidos), len(movimentos)) < limite,
+    }
+
+
+# linhas da tabela de estoque do dashboard; a lista completa fica na página de materiais
+DASHBOARD_ESTOQUE_LINHAS = 20
+
+FAIXAS_ESTOQUE = [
+    ('abaixo', 'Abaixo do mínimo'),
+    ('atencao', 'Até 2× o mínimo'),
+    ('folga', 'Acima de 2× o mínimo'),
+]
+
+
+def faixas_estoque():
+    """
+    Série do gráfico do dashboard em uma consulta agregada: por faixa de
+    estoque (em relação ao mínimo), quantos materiais e as somas de
+    quantidade e mínimo. Todas as faixas aparecem, mesmo vazias.
+    """
+    faixa = models.Case(
+        models.When(quantidade__lt=models.F('minimo'), then=models.Value('abaixo')),
+        models.When(quantidade__lt=models.F('minimo') * 2, then=models.Value('atencao')),
+        default=models.Value('folga'),
+    )
+    somas = {
+        linha['faixa']: linha
+        for linha in Material.objects.order_by().annotate(faixa=faixa).values('faixa').annotate(
+            materiais=models.Count('id'), quantidade=models.Sum('quantidade'), minimo=models.Sum('minimo'),
+        )
+    }
+    return [
+        {
+            'faixa': codigo,
+            'nome': nome,
+            'materiais': somas.get(codigo, {}).get('materiais', 0),
+            'quantidade': somas.get(codigo, {}).get('quantidade') or 0,
+            'minimo': somas.get(codigo, {}).get('minimo') or 0,
+        }
+        for codigo, nome in FAIXAS_ESTOQUE
+    ]
+
+
+def resumo_dashboard(hoje, top=5, linhas_estoque=DASHBOARD_ESTOQUE_LINHAS):
+    """
+    Tudo o que o dashboard mostra, em cinco consultas fixas: alertas (total e
+    os `top` primeiros por nome), empréstimos (contagem por status e os `top`
+    próximos a vencer), os `linhas_estoque` primeiros materiais por nome e a
+    série agregada do gráfico de estoque. Nada cresce com o catálogo.
+    """
+    # total vem junto de cada linha por uma janela COUNT(*) OVER ()
+    alertas = list(
+        Material.objects.em_alerta()
+        .annotate(total=models.Window(models.Count('id')))
+        .order_by('nome').values('id', 'nome', 'quantidade', 'minimo', 'total')[:top]
+    )
+    total_alertas = alertas[0]['total'] if alertas else 0
+    for a in alertas:
+        del a['total']
+
+    contagem = {codigo: 0 for codigo in STATUS_EMPRESTIMO}
+    contagem.update(Movimento.objects.emprestimos().contar_status(hoje))
+    proximos = [
+        {
+            'id': mv.pk,
+            'material': mv.material.nome if mv.material else None,
+            'nota': mv.nota,
+            'usuario': mv.usuario.username if mv.usuario else None,
+            'quantidade': mv.quantidade,
+            'data_devolucao': mv.data_devolucao,
+            'status': mv.status,
+        }
+        for mv in Movimento.objects.filter(tipo='EMPRESTIMO').com_status(hoje)
+        .select_related('material', 'usuario').order_by('data_devolucao')[:top]
+    ]
+
+    storage = Material._meta.get_field('imagem').storage
+    estoque = [
+        {
+            'id': m['id'],
+            'nome': m['nome'],
+            'quantidade': m['quantidade'],
+            'minimo': m['minimo'],
+            'imagem_url': storage.url(m['imagem']) if m['imagem'] else None,
+            'preview_url': url_miniatura(storage, m['imagem'], m['imagem_hash'], 'preview'),
+        }
+        for m in Material.objects.order_by('nome')
+        .values('id', 'nome', 'quantidade', 'minimo', 'imagem', 'imagem_hash')[:linhas_estoque]
+    ]
+    faixas = faixas_estoque()
+
+    return {
+        'alertas': {'total': total_alertas, 'top': alertas},
+        'emprestimos': {
+            'por_status': contagem,
+            'abertos': sum(n for codigo, n in contagem.items() if codigo != 'concluido'),
+            'proximos': proximos,
+        },
+        'estoque': {
+            'total': sum(f['materiais'] for f in faixas),
+            'top': estoque,
+            'faixas': faixas,
+        },
+    }
+
+
+def _corrigir_alerta(pks, alerta_desde, agora):
+    # um UPDATE por material, cada um com a sua versão de sincronização (como
+    # Material.objects.ajustar): cache do dashboard, ETag do catálogo e clientes
+    # de sincronização passam a ver a correção
+    for pk in pks:
+        Material.objects.filter(pk=pk).update(alerta_desde=alerta_desde, atualizado=agora, versao=proxima_versao())
+
+
+def reconciliar_alertas(corrigir=True):
+    """
+    Recalcula o conjunto de alertas a partir de quantidade < mínimo e compara
+    com o mantido incrementalmente (alerta_desde e períodos em aberto).
+    Devolve {tipo de divergência: [ids de material]}; com `corrigir`, acerta tudo.
+    Sem `corrigir` só lê, fora de transação (que tomaria o lock de escrita).
+    """
+    abaixo = models.Q(quantidade__lt=models.F('minimo'))
+    agora = timezone.now()
+    with transaction.atomic() if corrigir else nullcontext():
+        divergencias = {
+            'sem_alerta': list(Material.objects.filter(abaixo, alerta_desde__isnull=True).values_list('pk', flat=True)),
+            'alerta_indevido': list(Material.objects.exclude(abaixo).em_alerta().values_list('pk', flat=True)),
+            'periodo_indevido': list(
+                PeriodoAlerta.objects.filter(fim__isnull=True)
+                .exclude(material__quantidade__lt=models.F('material__minimo'))
+                .values_list('material_id', flat=True).distinct()
+            ),
+            'sem_periodo': list(
+                Material.objects.filter(abaixo).exclude(models.Exists(
+                    PeriodoAlerta.objects.filter(material=models.OuterRef('pk'), fim__isnull=True)
+                )).values_list('pk', flat=True)
+            ),
+        }
+        if corrigir:
+            _corrigir_alerta(divergencias['sem_alerta'], agora, agora)
+            _corrigir_alerta(divergencias['alerta_indevido'], None, agora)
+            PeriodoAlerta.objects.filter(material_id__in=divergencias['periodo_indevido'], fim__isnull=True).update(fim=agora)
+            PeriodoAlerta.objects.bulk_create(
+                PeriodoAlerta(material_id=pk, inicio=desde)
+                for pk, desde in Material.objects.filter(pk__in=divergencias['sem_periodo'])
+                .values_list('pk', 'alerta_desde')
+            )
+    return divergencias
+
+
+def _soma_efeitos(**filtros):
+    """Subconsulta: soma dos efeitos de estoque dos movimentos do material externo."""
+    return Coalesce(
+        models.Subquery(
+            Movimento.objects.filter(material=models.OuterRef('pk'), **filtros)
+            .order_by().values('material').annotate(soma=models.Sum(efeito_estoque_sql())).values('soma')
+        ),
+        0,
+    )
+
+
+def saldos_em(momento, materiais=None):
+    """
+    {material_id: saldo} no instante `momento`. Cada material parte do
+    snapshot mais recente até `momento` e soma só os movimentos posteriores a
+    ele; sem snapshot, parte do saldo atual e desconta os movimentos depois de
+    `momento`. Pressupõe que o estoque só muda por movimentos: a edição de
+    material e a importação registram a diferença como ADICAO/SAIDA; só
+    UPDATEs feitos por fora da aplicação escapam do histórico.
+
+    Antes do corte do arquivamento os movimentos já não estão na tabela: sem
+    snapshot anterior, o material parte do snapshot seguinte, e a diferença
+    até o snapshot usado é completada com os blocos arquivados do período.
+    """
+    corte = arquivado_ate()
+    arquivado = corte is not None and momento < corte
+    anterior = SaldoSnapshot.objects.filter(material=models.OuterRef('pk'), momento__lte=momento).order_by('-momento')
+    posterior = SaldoSnapshot.objects.filter(material=models.OuterRef('pk'), momento__gt=momento).order_by('momento')
+    qs = Material.objects.filter(criado__lte=momento).annotate(
+        base_momento=models.Subquery(anterior.values('momento')[:1]),
+        base_quantidade=models.Subquery(anterior.values('quantidade')[:1]),
+    )
+    casos = [
+        models.When(
+            base_momento__isnull=False,
+            then=models.F('base_quantidade')
+            + _soma_efeitos(criado__gt=models.OuterRef('base_momento'), criado__lte=momento),
+        ),
+    ]
+    if arquivado:
+        qs = qs.annotate(
+            proximo_momento=models.Subquery(posterior.values('momento')[:1]),
+            proxima_quantidade=models.Subquery(posterior.values('quantidade')[:1]),
+        )
+        casos.append(models.When(
+            proximo_momento__isnull=False,
+            then=models.F('proxima_quantidade')
+            - _soma_efeitos(criado__gt=momento, criado__lte=models.OuterRef('proximo_momento')),
+        ))
+    qs = qs.annotate(saldo=models.Case(*casos, default=models.F('quantidade') - _soma_efeitos(criado__gt=momento)))
+    if materiais is not None:
+        qs = qs.filter(pk__in=materiais)
+    if not arquivado:
+        return dict(qs.order_by().values_list('pk', 'saldo'))
+    return _completar_com_arquivo(momento, qs.order_by().values_list('pk', 'saldo', 'base_momento', 'proximo_momento'))
+
+
+def _completar_com_arquivo(momento, linhas):
+    # janela (inicio, fim] de cada material entre o snapshot usado e `momento`,
+    # com o sinal em que os movimentos arquivados dela entram no saldo
+    saldos, janelas = {}, {}
+    for pk, saldo, base, proximo in linhas:
+        saldos[pk] = saldo
+        if base is not None:
+            janelas[pk] = (base, momento, 1)
+        elif proximo is not None:
+            janelas[pk] = (momento, proximo, -1)
+    if not janelas:
+        return saldos
+    inicio = min(janela[0] for janela in janelas.values())
+    fim = max(janela[1] for janela in janelas.values())
+    # movimentos_arquivados usa [inicio, fim); datas têm resolução de microssegundo
+    for _, criado, _, material_id, _, tipo, quantidade, _, _ in arquivo.movimentos_arquivados(
+        inicio + timedelta(microseconds=1), fim + timedelta(microseconds=1)
+    ):
+        janela = janelas.get(material_id)
+        if janela and janela[0] < criado <= janela[1]:
+            saldos[material_id] += janela[2] * Movimento.efeito_estoque(tipo, quantidade)
+    return saldos
+
+
+def saldo_em(material_id, momento):
+    return saldos_em(momento, [material_id]).get(material_id)
+
+
+def marcos(desde, ate, periodo='diario'):
+    """Instantes de checkpoint (meia-noite local do dia ou do dia 1º do mês) entre `desde` e `ate`."""
+    dia = timezone.localtime(desde).date()
+    if periodo == 'mensal' and dia.day != 1:
+        dia = (dia.replace(day=1) + timedelta(days=32)).replace(day=1)
+    while True:
+        marco = exports.inicio_do_dia(dia)
+        if marco > ate:
+            return
+        if marco >= desde:
+            yield marco
+        dia = (dia.replace(day=1) + timedelta(days=32)).replace(day=1) if periodo == 'mensal' else dia + timedelta(days=1)
+
+
+def gerar_snapshots(momentos):
+    """
+    Grava os snapshots de todos os materiais em cada instante de `momentos`
+    (em ordem cronológica, então cada um parte do anterior). Instantes já
+    registrados são ignorados. Devolve quantos snapshots foram criados.
+    """
+    criados = 0
+    for momento in sorted(momentos):
+        with transaction.atomic():
+            existentes = set(SaldoSnapshot.objects.filter(momento=momento).values_list('material_id', flat=True))
+            novos = [
+                SaldoSnapshot(material_id=pk, momento=momento, quantidade=saldo)
+                for pk, saldo in saldos_em(momento).items() if pk not in existentes
+            ]
+            SaldoSnapshot.objects.bulk_create(novos, batch_size=1000, ignore_conflicts=True)
+        criados += len(novos)
+    return criados
+
+
+def arquivado_ate():
+    """Corte do arquivamento mais recente (None se nada foi arquivado)."""
+    return ArquivoMovimentos.objects.aggregate(corte=models.Max('corte'))['corte']
+
+
+def consolidado_esperado(desde=None):
+    """{(material_id, dia, tipo): (quantidade, total)} recalculado dos movimentos a partir de `desde`."""
+    qs = Movimento.objects.filter(material__isnull=False)
+    if desde:
+        qs = qs.filter(criado__gte=desde)
+    linhas = (
+        qs.order_by()
+        .annotate(dia=models.functions.TruncDate('criado'))
+        .values('material_id', 'dia', 'tipo')
+        .annotate(soma=models.Sum(Coalesce('quantidade', 0)), n=models.Count('id'))
+        .values_list('material_id', 'dia', 'tipo', 'soma', 'n')
+    )
+    return {(m, d, t): (q, n) for m, d, t, q, n in linhas.iterator(chunk_size=exports.CHUNK_SIZE)}
+
+
+def reconstruir_consolidado(corrigir=True):
+    """
+    Compara MovimentoDiario com o recalculado a partir dos movimentos e
+    devolve as chaves divergentes; com `corrigir`, regrava a tabela inteira
+    (também serve de carga inicial). Dias já arquivados não são tocados: o
+    consolidado é o único registro que resta deles na base. Sem `corrigir`
+    só lê, fora de transação (que tomaria o lock de escrita durante a
+    varredura); gravações concorrentes podem aparecer como divergências.
+    """
+    corte = arquivado_ate()
+    consolidado = MovimentoDiario.objects.all()
+    if corte:
+        consolidado = consolidado.filter(dia__gte=timezone.localdate(corte))
+    with transaction.atomic() if corrigir else nullcontext():
+        esperado = consolidado_esperado(corte)
+        atual = {
+            (m, d, t): (q, n)
+            for m, d, t, q, n in consolidado.exclude(quantidade=0, total=0)
+            .values_list('material_id', 'dia', 'tipo', 'quantidade', 'total')
+            .iterator(chunk_size=exports.CHUNK_SIZE)
+        }
+        divergentes = sorted(
+            (chave for chave in esperado.keys() | atual.keys() if esperado.get(chave) != atual.get(chave)),
+            key=lambda chave: (chave[1], chave[0], chave[2]),
+        )
+        if corrigir:
+            consolidado.delete()
+            MovimentoDiario.objects.bulk_create(
+                (MovimentoDiario(material_id=m, dia=d, tipo=t, quantidade=q, total=n)
+                 for (m, d, t), (q, n) in esperado.items()),
+                batch_size=1000,
+            )
+    return divergentes
+
+
+def arquivar_movimentos(ate, lote=900):
+    """
+    Move para o arquivo frio (stock.arquivo) os movimentos criados antes da
+    meia-noite de `ate`, um bloco gzip por mês. Empréstimos (EMPRESTIMO e
+    DEVOLVIDO) ficam na tabela, pois a lista e o status deles são vivos.
+
+    Antes de remover qualquer linha grava snapshots de saldo no corte e no
+    início de cada mês arquivado, a começar pelo mês do movimento mais
+    antigo: saldos posteriores ao corte continuam exatos e os anteriores
+    partem desses checkpoints, completados com o bloco do mês (ver
+    saldos_em). O estoque e o consolidado diário não mudam. Devolve
+    (blocos, movimentos).
+    """
+    corte = exports.inicio_do_dia(ate)
+    elegiveis = Movimento.objects.filter(criado__lt=corte).exclude(EMPRESTIMOS_Q)
+    primeiro = elegiveis.order_by('criado').values_list('criado', flat=True).first()
+    if primeiro is None:
+        return 0, 0
+    mes = timezone.localtime(primeiro).date().replace(day=1)
+    gerar_snapshots({exports.inicio_do_dia(mes), *marcos(primeiro, corte, 'mensal'), corte})
+
+    blocos = movimentos = 0
+    while exports.inicio_do_dia(mes) < corte:
+        proximo = (mes + timedelta(days=32)).replace(day=1)
+        qs = elegiveis.filter(criado__gte=exports.inicio_do_dia(mes),
+                              criado__lt=min(exports.inicio_do_dia(proximo), corte))
+        ids, extremos = [], {}
+
+        def linhas():
+            for linha in qs.order_by('-criado', '-id').values_list(*arquivo.CAMPOS).iterator(
+                chunk_size=exports.CHUNK_SIZE
+            ):
+                ids.append(linha[0])
+                extremos.setdefault('fim', linha[1])  # ordem decrescente: o primeiro é o mais recente
+                extremos['inicio'] = linha[1]
+                yield linha
+
+        with tempfile.TemporaryFile() as tmp:
+            arquivo.gravar_bloco(tmp, linhas())
+            if ids:
+                tmp.seek(0)
+                bloco = ArquivoMovimentos(mes=mes, corte=corte, linhas=len(ids), **extremos)
+                try:
+                    with transaction.atomic():
+                        bloco.arquivo.save(f'movimentos-{mes:%Y-%m}.csv.gz', File(tmp), save=True)
+                        for i in range(0, len(ids), lote):
+                            Movimento.objects.filter(pk__in=ids[i:i + lote]).delete()
+                except Exception:
+                    # nada foi removido da tabela: descarta o bloco gravado
+                    if bloco.arquivo:
+                        bloco.arquivo.delete(save=False)
+                    raise
+                blocos += 1
+                movimentos += len(ids)
+        mes = proximo
+    return blocos, movimentos
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate, pre_delete
+from django.dispatch import receiver
+
+from . import busca
+from .models import Material, MaterialRemovido, proxima_versao
+
+
+@receiver(pre_delete, sender=Material)
+def registrar_remocao(sender, instance, **kwargs):
+    # vale também para exclusões em massa (admin, QuerySet.delete()). Antes de
+    # excluir (na mesma transação): a versão da remoção supera a do próprio material
+    MaterialRemovido.objects.create(material_id=instance.pk, nome=instance.nome, versao=proxima_versao())
+
+
+@receiver(connection_created)
+def configurar_sqlite(sender, connection, **kwargs):
+    """
+    Aplica settings.SQLITE_PRAGMAS (WAL, busy timeout, cache...) a cada nova
+    conexão SQLite, ou SQLITE_PRAGMAS_POR_BANCO[alias] quando houver.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS_POR_BANCO', {}).get(connection.alias)
+    if pragmas is None:
+        pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    # direto na conexão DB-API: não entra no log de consultas (assertNumQueries etc.)
+    for nome, valor in pragmas.items():
+        connection.connection.execute(f'PRAGMA {nome} = {valor}')
+
+
+@receiver(post_migrate)
+def manter_triggers_busca(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    # migrações que recriam stock_material (AlterField no SQLite) apagam os triggers do índice
+    if sender.name != 'stock':
+        return
+    connection = connections[using]
+    if busca.disponivel(connection) and busca.TABELA in connection.introspection.table_names():
+        busca.instalar(connection)
@@ -1,8 +1,42 @@
 
-from django.test import TestCase
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+
+import openpyxl
+from PIL import Image
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db.models import Sum
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
-from .models import Material, Movimento
+from .forms import MovimentoForm
+from .models import (
+    STATUS_EMPRESTIMO, ArquivoMovimentos, Exportacao, Material, Movimento, MovimentoDiario, PeriodoAlerta,
+    SaldoSnapshot,
+)
+from .services import (
+    gerar_snapshots, reconciliar_alertas, reconstruir_consolidado, registrar_movimentos_lote, saldo_em, saldos_em,
+)
+from . import busca, exports, importacao, miniaturas, paginacao, previsao, roteamento, services
+from .benchmarks import comparar
+from .benchmarks.suite import suite
+from .middleware import InstrumentacaoMiddleware
+from .paginacao import paginar
 
 class MaterialMovimentoTests(TestCase):
     def test_entrada_atualiza_quantidade(self):
@@ -49,4 +83,1337 @@ class MaterialMovimentoTests(TestCase):
         movs = m.movimentos.filter(tipo='ADICAO')
         self.assertTrue(movs.exists())
         mv = movs.first()
-        self.assertEqual(mv.quantidade, 12)
\ No newline at end of file
+        self.assertEqual(mv.quantidade, 12)
+
+class AjusteEstoqueTests(TestCase):
+    def test_edicao_reverte_e_aplica_no_mesmo_material(self):
+        m = Material.objects.create(nome='Caneta', quantidade=10)
+        mv = Movimento.objects.create(material=m, tipo='ENTRADA', quantidade=5)
+        mv.tipo = 'SAIDA'
+        mv.quantidade = 3
+        mv.save()
+        m.refresh_from_db()
+        self.assertEqual(m.quantidade, 7)
+
+    def test_edicao_troca_de_material(self):
+        a = Material.objects.create(nome='A', quantidade=10)
+        b = Material.objects.create(nome='B', quantidade=10)
+        mv = Movimento.objects.create(material=a, tipo='SAIDA', quantidade=4)
+        mv.material = b
+        mv.save()
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((a.quantidade, b.quantidade), (10, 6))
+
+    def test_delete_reverte_quantidade(self):
+        m = Material.objects.create(nome='Papel', quantidade=20)
+        mv = Movimento.objects.create(material=m, tipo='SAIDA', quantidade=7)
+        mv.delete()
+        m.refresh_from_db()
+        self.assertEqual(m.quantidade, 20)
+
+    def test_emprestimo_nao_altera_quantidade(self):
+        m = Material.objects.create(nome='Grampeador', quantidade=3)
+        Movimento.objects.create(material=m, tipo='EMPRESTIMO', quantidade=1)
+        m.refresh_from_db()
+        self.assertEqual(m.quantidade, 3)
+
+    def test_ajustar_devolve_saldo(self):
+        m = Material.objects.create(nome='Clips', quantidade=10)
+        self.assertEqual(Material.objects.ajustar(m.pk, -4), 6)
+        self.assertIsNone(Material.objects.ajustar(m.pk + 1000, 1))
+
+    def test_instancia_em_memoria_recebe_novo_saldo(self):
+        m = Material.objects.create(nome='Borracha', quantidade=2)
+        Movimento.objects.create(material=m, tipo='ENTRADA', quantidade=3)
+        self.assertEqual(m.quantidade, 5)
+
+    def test_consultas_por_movimento(self):
+        m = Material.objects.create(nome='Pasta', quantidade=10)
+        # savepoint + UPDATE ... RETURNING + INSERT + contador + consolidado diário + release
+        with self.assertNumQueries(6):
+            mv = Movimento.objects.create(material_id=m.pk, tipo='SAIDA', quantidade=1)
+        # savepoint + SELECT anterior + UPDATE material + UPDATE movimento + contador + consolidado + release
+        mv.quantidade = 2
+        with self.assertNumQueries(7):
+            mv.save()
+
+
+class AjusteEstoqueConcorrenciaTests(TransactionTestCase):
+    THREADS = 8
+    POR_THREAD = 25
+
+    def test_saidas_concorrentes_nao_perdem_atualizacoes(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('requer banco de teste em arquivo')
+        m = Material.objects.create(nome='Caneta azul', quantidade=1000)
+        consultas = []
+        erros = []
+        inicio = threading.Barrier(self.THREADS)
+
+        def worker():
+            try:
+                inicio.wait()
+                with CaptureQueriesContext(connection) as ctx:
+                    for _ in range(self.POR_THREAD):
+                        Movimento.objects.create(material_id=m.pk, tipo='SAIDA', quantidade=1)
+                consultas.append(len(ctx.captured_queries))
+            except Exception as exc:  # pragma: no cover - relatado abaixo
+                erros.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(erros, [])
+        total = self.THREADS * self.POR_THREAD
+        m.refresh_from_db()
+        self.assertEqual(m.quantidade, 1000 - total)
+        self.assertEqual(Movimento.objects.filter(material=m).count(), total)
+        self.assertEqual(MovimentoDiario.objects.get(material=m, tipo='SAIDA').total, total)
+        # BEGIN + UPDATE ... RETURNING + INSERT + contador + consolidado diário + COMMIT por movimento
+        self.assertEqual(sum(consultas), 6 * total)
+
+
+class MovimentosLoteTests(TestCase):
+    def setUp(self):
+        self.a = Material.objects.create(nome='Caneta', quantidade=10)
+        self.b = Material.objects.create(nome='Papel', quantidade=5)
+
+    def test_lote_agrupa_deltas_por_material(self):
+        linhas = [
+            {'material': self.a.pk, 'tipo': 'ENTRADA', 'quantidade': 4},
+            {'material': self.a.pk, 'tipo': 'SAIDA', 'quantidade': 1},
+            {'material': self.b.pk, 'tipo': 'EMPRESTIMO', 'quantidade': 1, 'data_devolucao': '2030-01-10'},
+        ]
+        # savepoint + material + INSERT em massa + contador + 1 UPDATE (a) + consolidado + release + saldo de b
+        with self.assertNumQueries(8):
+            aplicado, resultados = registrar_movimentos_lote(linhas)
+        self.assertTrue(aplicado)
+        self.assertEqual([r['status'] for r in resultados], ['criado'] * 3)
+        self.assertEqual([r['saldo'] for r in resultados], [13, 13, 5])
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.quantidade, 13)
+        self.assertEqual(Movimento.objects.count(), 3)
+
+    def test_lote_invalido_nao_grava_nada(self):
+        linhas = [
+            {'material': self.a.pk, 'tipo': 'ENTRADA', 'quantidade': 4},
+            {'material': self.a.pk, 'tipo': 'EMPRESTIMO', 'quantidade': 1},
+            {'material': 9999, 'tipo': 'SAIDA', 'quantidade': 1},
+        ]
+        aplicado, resultados = registrar_movimentos_lote(linhas)
+        self.assertFalse(aplicado)
+        self.assertEqual([r['status'] for r in resultados], ['nao_aplicado', 'erro', 'erro'])
+        self.assertIn('__all__', resultados[1]['erros'])
+        self.assertIn('material', resultados[2]['erros'])
+        self.assertFalse(Movimento.objects.exists())
+
+    def test_lote_parcial_aplica_linhas_validas(self):
+        linhas = [
+            {'material': self.a.pk, 'tipo': 'SAIDA', 'quantidade': 2},
+            {'material': self.a.pk, 'tipo': 'XPTO', 'quantidade': 1},
+        ]
+        aplicado, resultados = registrar_movimentos_lote(linhas, parcial=True)
+        self.assertTrue(aplicado)
+        self.assertEqual([r['status'] for r in resultados], ['criado', 'erro'])
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.quantidade, 8)
+
+    def test_api_movimentos_lote(self):
+        u = get_user_model().objects.create_user(username='almox', password='pass')
+        self.client.force_login(u)
+        url = reverse('api_movimentos_lote')
+        resp = self.client.post(url, [{'material': self.b.pk, 'tipo': 'ENTRADA', 'quantidade': 100}],
+                                content_type='application/json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.json()['resultados'][0]['saldo'], 105)
+        self.assertEqual(Movimento.objects.get().usuario, u)
+        resp = self.client.post(url, {'material': self.b.pk}, content_type='application/json')
+        self.assertEqual(resp.status_code, 400)
+
+
+class ExportacaoTests(TestCase):
+    def setUp(self):
+        u = get_user_model().objects.create_user(username='relatorios', password='pass')
+        self.client.force_login(u)
+
+    def _csv(self, nome_url, **params):
+        resp = self.client.get(reverse(nome_url), params)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        return b''.join(resp.streaming_content).decode('utf-8')
+
+    def test_movimentos_streaming_mantem_bom_e_crlf(self):
+        m = Material.objects.create(nome='Caneta', quantidade=10)
+        Movimento.objects.create(material=m, tipo='SAIDA', quantidade=2, nota='balcão')
+        Movimento.objects.create(material=None, tipo='DELETE', quantidade=3, nota='nome=Lápis; motivo=quebrado')
+        corpo = self._csv('export_movements_csv')
+        self.assertTrue(corpo.startswith('\ufeffid,data,usuario,material_nome,tipo,quantidade,nota\r\n'))
+        linhas = corpo.lstrip('\ufeff').split('\r\n')
+        self.assertEqual(len(linhas), 4)  # cabeçalho + 2 linhas + final vazio
+        self.assertTrue(linhas[1].endswith(',,DELETE,3,quebrado'))
+        self.assertTrue(linhas[2].endswith(',Caneta,SAIDA,2,balcão'))
+
+    def test_emprestimos_status_no_csv(self):
+        m = Material.objects.create(nome='Grampeador', quantidade=1)
+        Movimento.objects.create(material=m, tipo='EMPRESTIMO', quantidade=1, data_devolucao='2000-01-01')
+        corpo = self._csv('export_emprestimos')
+        self.assertIn(',Grampeador,1,2000-01-01,,Atrasado\r\n', corpo)
+
+    def test_alertas_somente_abaixo_do_minimo(self):
+        Material.objects.create(nome='Papel', quantidade=1, minimo=5)
+        Material.objects.create(nome='Clips', quantidade=9, minimo=5)
+        corpo = self._csv('export_alertas_csv')
+        self.assertIn(',Papel,,1,5\r\n', corpo)
+        self.assertNotIn('Clips', corpo)
+
+    def test_buffer_agrupa_linhas_em_pedacos(self):
+        pedacos = list(exports.iterar_csv(['a'], ([i] for i in range(1000)), buffer_bytes=100))
+        self.assertGreater(len(pedacos), 1)
+        self.assertEqual(''.join(pedacos).count('\r\n'), 1001)
+
+    def test_xlsx_write_only_servido_de_arquivo(self):
+        m = Material.objects.create(nome='Caneta', quantidade=10, minimo=20)
+        Movimento.objects.create(material=m, tipo='SAIDA', quantidade=2)
+        for nome_url, titulo in [('export_materials_csv', 'Materiais'), ('export_movements_csv', 'Movimentos'),
+                                 ('export_emprestimos', 'Empréstimos'), ('export_alertas_csv', 'Alertas')]:
+            resp = self.client.get(reverse(nome_url), {'format': 'xlsx'})
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp['Content-Type'], exports.XLSX_CONTENT_TYPE)
+            wb = openpyxl.load_workbook(BytesIO(b''.join(resp.streaming_content)), read_only=True)
+            self.assertEqual(wb.sheetnames, [titulo])
+            linhas = list(wb[titulo].values)
+            self.assertGreater(int(resp['Content-Length']), 0)
+            if titulo == 'Movimentos':
+                self.assertEqual(linhas[1][3:6], ('Caneta', 'SAIDA', 2))
+
+
+class ExportacaoSegundoPlanoTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        ajustes = override_settings(EXPORTACOES_ROOT=self.tmp.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        u = get_user_model().objects.create_user(username='relatorios', password='pass')
+        self.client.force_login(u)
+        self.m = Material.objects.create(nome='Caneta', quantidade=10)
+        Movimento.objects.create(material=self.m, tipo='SAIDA', quantidade=2)
+
+    def _pedir(self, **dados):
+        dados.setdefault('relatorio', 'movimentos')
+        return self.client.post(reverse('api_exportacoes'), dados, content_type='application/json')
+
+    def test_fila_worker_e_download(self):
+        resp = self._pedir(start='2000-01-01')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp.json()['status'], 'PENDENTE')
+        # pedido igual enquanto está na fila não cria outro
+        self.assertEqual(self._pedir(start='2000-01-01').json()['id'], resp.json()['id'])
+
+        call_command('processar_exportacoes', '--uma-vez', stdout=StringIO())
+        resp = self._pedir(start='2000-01-01')
+        self.assertEqual(resp.status_code, 200)
+        dados = resp.json()
+        self.assertEqual(dados['status'], 'CONCLUIDA')
+
+        download = self.client.get(reverse('exportacao_download', args=[dados['id']]))
+        corpo = b''.join(download.streaming_content).decode('utf-8')
+        self.assertIn('Caneta,SAIDA,2', corpo)
+        self.assertIn('movimentos.csv', download['Content-Disposition'])
+
+    def test_dados_alterados_geram_novo_arquivo(self):
+        primeiro = self._pedir().json()['id']
+        call_command('processar_exportacoes', '--uma-vez', stdout=StringIO())
+        self.assertEqual(self._pedir().json()['id'], primeiro)
+
+        Movimento.objects.create(material=self.m, tipo='ENTRADA', quantidade=1)
+        segundo = self._pedir().json()
+        self.assertNotEqual(segundo['id'], primeiro)
+        self.assertEqual(segundo['status'], 'PENDENTE')
+
+        call_command('processar_exportacoes', '--uma-vez', stdout=StringIO())
+        # o arquivo anterior com os mesmos filtros é descartado
+        self.assertFalse(Exportacao.objects.filter(pk=primeiro).exists())
+
+    def test_pedido_travado_nao_e_reaproveitado_e_volta_para_a_fila(self):
+        travado = Exportacao.objects.get(pk=self._pedir().json()['id'])
+        Exportacao.objects.filter(pk=travado.pk).update(status='PROCESSANDO', iniciado=timezone.now(),
+                                                        batimento=timezone.now())
+        self.assertEqual(self._pedir().json()['id'], travado.pk)
+
+        Exportacao.objects.filter(pk=travado.pk).update(batimento=timezone.now() - timedelta(hours=1))
+        novo = self._pedir().json()['id']
+        self.assertNotEqual(novo, travado.pk)
+
+        call_command('processar_exportacoes', '--uma-vez', stdout=StringIO())
+        # o travado volta à fila e é gerado; o último a concluir descarta o outro arquivo
+        self.assertEqual(list(Exportacao.objects.values_list('status', flat=True)), ['CONCLUIDA'])
+
+    def test_batimento_e_conclusao_so_pelo_worker_que_assumiu(self):
+        exportacao = Exportacao.objects.get(pk=self._pedir().json()['id'])
+        gravar = exports.gravar
+
+        def reassumida_durante_a_geracao(*args, progresso, **kwargs):
+            progresso()
+            self.assertGreater(Exportacao.objects.get(pk=exportacao.pk).batimento, exportacao.criado)
+            # voltou à fila e outro worker assumiu: o próximo batimento interrompe este
+            Exportacao.objects.filter(pk=exportacao.pk).update(iniciado=timezone.now() + timedelta(seconds=1))
+            progresso()
+
+        with mock.patch.object(services, 'EXPORTACAO_BATIMENTO_SEGUNDOS', 0), \
+                mock.patch.object(exports, 'gravar', reassumida_durante_a_geracao):
+            self.assertFalse(services.processar_exportacao(exportacao))
+
+        def reassumida_no_fim(*args, **kwargs):
+            gravar(*args, **kwargs)
+            Exportacao.objects.filter(pk=exportacao.pk).update(iniciado=timezone.now() + timedelta(seconds=1))
+
+        Exportacao.objects.filter(pk=exportacao.pk).update(status='PENDENTE')
+        with mock.patch.object(exports, 'gravar', reassumida_no_fim):
+            self.assertFalse(services.processar_exportacao(exportacao))
+        # o arquivo gerado por quem perdeu o pedido é descartado e o status não muda
+        exportacao.refresh_from_db()
+        self.assertEqual((exportacao.status, exportacao.arquivo.name), ('PROCESSANDO', ''))
+        self.assertEqual([arquivos for _, _, arquivos in os.walk(self.tmp.name) if arquivos], [])
+
+    def test_assinatura_nao_agrega_as_linhas(self):
+        with CaptureQueriesContext(connection) as consultas:
+            antes = exports.assinatura('movimentos')
+        self.assertEqual(len(consultas), 3)
+        self.assertFalse([c['sql'] for c in consultas if 'COUNT(' in c['sql'] or 'atualizado' in c['sql']])
+        self.m.nome = 'Caneta azul'
+        self.m.save()
+        self.assertNotEqual(exports.assinatura('movimentos'), antes)
+        antes = exports.assinatura('movimentos')
+        Movimento.objects.create(material=self.m, tipo='ENTRADA', quantidade=1)
+        self.assertNotEqual(exports.assinatura('movimentos'), antes)
+
+    def test_filtros_diferentes_nao_reaproveitam(self):
+        a = self._pedir(start='2000-01-01').json()['id']
+        b = self._pedir(start='2000-01-02').json()['id']
+        c = self._pedir(format='xlsx', start='2000-01-01').json()['id']
+        self.assertEqual(len({a, b, c}), 3)
+
+    def test_relatorio_invalido(self):
+        self.assertEqual(self._pedir(relatorio='senhas').status_code, 400)
+
+
+class PlanoDeConsultaTests(TestCase):
+    """Confere (no SQLite) que as consultas quentes usam os índices da migração 0009."""
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('planos verificados apenas no SQLite')
+
+    def assertUsaIndice(self, qs, indice):
+        plano = qs.explain()
+        self.assertIn(indice, plano)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plano)
+
+    def test_lista_de_emprestimos(self):
+        qs = Movimento.objects.emprestimos().order_by('data_devolucao')
+        self.assertUsaIndice(qs, 'movimento_emprestimos_idx')
+
+    def test_emprestimos_em_aberto_do_dashboard(self):
+        qs = Movimento.objects.filter(tipo='EMPRESTIMO').order_by('data_devolucao')[:5]
+        self.assertUsaIndice(qs, 'movimento_emp_aberto_idx')
+
+    def test_exportacao_de_movimentos_por_periodo(self):
+        qs = exports.RELATORIOS['movimentos'].queryset(date(2025, 1, 1), date(2025, 1, 31))
+        self.assertUsaIndice(qs, 'movimento_criado_idx')
+
+    def test_alertas(self):
+        self.assertUsaIndice(Material.objects.em_alerta().order_by('nome'), 'material_alerta_idx')
+
+    def test_materiais_por_nome(self):
+        self.assertUsaIndice(Material.objects.order_by('nome', 'id'), 'material_nome_idx')
+
+    def test_periodo_equivale_a_filtro_por_data(self):
+        m = Material.objects.create(nome='Caneta', quantidade=10)
+        mv = Movimento.objects.create(material=m, tipo='ENTRADA', quantidade=1)
+        dia = timezone.localdate(mv.criado)
+        qs = exports.filtrar_periodo(Movimento.objects.all(), dia, dia)
+        self.assertEqual(list(qs), list(Movimento.objects.filter(criado__date=dia)))
+        self.assertFalse(exports.filtrar_periodo(Movimento.objects.all(), dia + timedelta(days=1)).exists())
+
+
+class PaginacaoKeysetTests(TestCase):
+    def _percorrer(self, qs, campo, tamanho, descendente=False):
+        vistos, cursor = [], None
+        while True:
+            pagina = paginar(qs, campo, cursor, tamanho, descendente)
+            vistos.extend(obj.pk for obj in pagina)
+            if not pagina.proximo:
+                return vistos, pagina
+            cursor = pagina.proximo
+
+    def test_materiais_por_nome_com_empates(self):
+        for i in range(23):
+            Material.objects.create(nome=f'Item {i % 7}')
+        qs = Material.objects.all()
+        esperado = list(qs.order_by('nome', 'pk').values_list('pk', flat=True))
+        vistos, _ = self._percorrer(qs, 'nome', 5)
+        self.assertEqual(vistos, esperado)
+        vistos, _ = self._percorrer(qs, 'nome', 4, descendente=True)
+        self.assertEqual(vistos, esperado[::-1])
+
+    def test_datas_nulas_e_volta_de_pagina(self):
+        m = Material.objects.create(nome='Grampeador')
+        for i in range(12):
+            data = None if i % 4 == 0 else date(2030, 1, 1 + i % 3)
+            Movimento.objects.create(material=m, tipo='EMPRESTIMO', quantidade=1, data_devolucao=data)
+        qs = Movimento.objects.emprestimos()
+        esperado = list(qs.order_by('data_devolucao', 'pk').values_list('pk', flat=True))
+        vistos, ultima = self._percorrer(qs, 'data_devolucao', 5)
+        self.assertEqual(vistos, esperado)
+        # voltando a partir da última página
+        anterior = paginar(qs, 'data_devolucao', ultima.anterior, 5)
+        self.assertEqual([obj.pk for obj in anterior], esperado[5:10])
+        self.assertIsNotNone(anterior.proximo)
+
+    def test_cursor_invalido_volta_ao_inicio(self):
+        Material.objects.create(nome='A')
+        pagina = paginar(Material.objects.all(), 'nome', 'lixo!', 10)
+        self.assertEqual(len(pagina), 1)
+        self.assertIsNone(pagina.anterior)
+
+    def test_consulta_de_pagina_usa_indice(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('planos verificados apenas no SQLite')
+        m = Material.objects.create(nome='Caneta')
+        qs = Material.objects.filter(paginacao._depois_de('nome', m.nome, m.pk, True, True)).order_by('nome', 'pk')[:26]
+        plano = qs.explain()
+        self.assertIn('material_nome_idx', plano)
+        self.assertNotIn('TEMP B-TREE', plano)
+
+    def test_views_paginam_e_filtram(self):
+        u = get_user_model().objects.create_user(username='balcao', password='pass')
+        self.client.force_login(u)
+        for i in range(30):
+            Material.objects.create(nome=f'Caneta {i:02d}')
+        Material.objects.create(nome='Papel A4')
+        resp = self.client.get(reverse('materials_list'), {'por_pagina': 10})
+        self.assertEqual(len(resp.context['materiais']), 10)
+        self.assertIn('cursor=', resp.context['url_proxima'])
+        self.assertIn('por_pagina=10', resp.context['url_proxima'])
+        self.assertContains(resp, '<td>10.</td>', html=True)
+        # a numeração das linhas continua na página seguinte
+        resp = self.client.get(reverse('materials_list') + resp.context['url_proxima'])
+        self.assertEqual(resp.context['materiais'].itens[0].nome, 'Caneta 10')
+        self.assertContains(resp, '<td>11.</td>', html=True)
+        self.assertIn('inicio=0', resp.context['url_anterior'])
+        resp = self.client.get(reverse('materials_list'), {'q': 'papel'})
+        self.assertEqual([m.nome for m in resp.context['materiais']], ['Papel A4'])
+
+        caneta = Material.objects.get(nome='Caneta 00')
+        Movimento.objects.create(material=caneta, tipo='EMPRESTIMO', quantidade=1, data_devolucao=date(2000, 1, 1))
+        Movimento.objects.create(material=caneta, tipo='EMPRESTIMO', quantidade=1, data_devolucao=date(2999, 1, 1))
+        resp = self.client.get(reverse('emprestimos_list'), {'status': 'atrasado'})
+        self.assertEqual([e.data_devolucao for e in resp.context['emprestimos']], [date(2000, 1, 1)])
+
+
+class StatusEmprestimoSqlTests(TestCase):
+    def setUp(self):
+        self.hoje = date(2025, 6, 15)
+        m = Material.objects.create(nome='Grampeador', quantidade=5)
+        datas = [None, self.hoje - timedelta(days=1), self.hoje, self.hoje + timedelta(days=1)]
+        for tipo in ('EMPRESTIMO', 'DEVOLVIDO', 'SAIDA', 'DELETE'):
+            for data in datas:
+                Movimento.objects.create(material=m, tipo=tipo, quantidade=1, data_devolucao=data)
+
+    def test_anotacao_igual_as_propriedades(self):
+        for mv in Movimento.objects.com_status(self.hoje):
+            esperado = Movimento.codigo_status(mv.tipo, mv.data_devolucao, self.hoje)
+            self.assertEqual(mv.status, esperado, (mv.tipo, mv.data_devolucao))
+            self.assertEqual(mv.status_display, STATUS_EMPRESTIMO[esperado][0])
+        # sem anotação as propriedades continuam calculando em Python
+        mv = Movimento.objects.filter(tipo='DEVOLVIDO').first()
+        self.assertEqual((mv.status_display, mv.status_badge_class, mv.status_color),
+                         ('Concluído', 'bg-success', '#28a745'))
+
+    def test_filtro_por_colunas_equivale_ao_filtro_pela_anotacao(self):
+        for codigo in list(STATUS_EMPRESTIMO):
+            pelas_colunas = set(Movimento.objects.filtrar_status(codigo, self.hoje).values_list('pk', flat=True))
+            pela_anotacao = set(
+                Movimento.objects.com_status(self.hoje).filter(status=codigo).values_list('pk', flat=True)
+            )
+            self.assertEqual(pelas_colunas, pela_anotacao, codigo)
+
+    def test_contagem_por_status_em_uma_consulta(self):
+        with self.assertNumQueries(1):
+            contagem = Movimento.objects.emprestimos().contar_status(self.hoje)
+        self.assertEqual(contagem, {'concluido': 4, 'sem_data': 1, 'atrasado': 1, 'andamento': 2})
+
+
+class ApiMateriaisCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.m = Material.objects.create(nome='Caneta', quantidade=10, minimo=2)
+
+    def test_etag_e_304(self):
+        url = reverse('api_materials')
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()[0]['nome'], 'Caneta')
+        etag = resp['ETag']
+        with self.assertNumQueries(1):
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+    def test_payload_vem_do_cache_ate_haver_escrita(self):
+        url = reverse('api_materials')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).json()[0]['quantidade'], 10)
+
+        Movimento.objects.create(material=self.m, tipo='SAIDA', quantidade=3)
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+        self.assertEqual(resp.json()[0]['quantidade'], 7)
+
+    def test_exclusao_muda_a_versao(self):
+        outro = Material.objects.create(nome='Papel')
+        versao = Material.objects.versao()
+        outro.delete()
+        self.assertNotEqual(Material.objects.versao(), versao)
+
+
+class SincronizacaoTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('sync', password='x')
+        self.client.force_login(self.user)
+        self.a = Material.objects.create(nome='Caneta', quantidade=10)
+        self.b = Material.objects.create(nome='Lápis', quantidade=5)
+
+    def sync(self, cursor=None, **params):
+        if cursor:
+            params['cursor'] = cursor
+        resp = self.client.get(reverse('api_sync'), params)
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_inicial_e_sem_alteracoes(self):
+        dados = self.sync()
+        self.assertEqual([m['nome'] for m in dados['materiais']], ['Caneta', 'Lápis'])
+        self.assertTrue(dados['completo'])
+        vazio = self.sync(dados['cursor'])
+        self.assertEqual((vazio['materiais'], vazio['removidos'], vazio['movimentos']), ([], [], []))
+        self.assertEqual(vazio['cursor'], dados['cursor'])
+
+    def test_alteracoes_movimentos_e_remocoes(self):
+        cursor = self.sync()['cursor']
+        Movimento.objects.create(material=self.a, tipo='SAIDA', quantidade=3, usuario=self.user)
+        removido = self.b.pk
+        self.b.delete()
+
+        dados = self.sync(cursor)
+        self.assertEqual([(m['id'], m['quantidade']) for m in dados['materiais']], [(self.a.pk, 7)])
+        self.assertEqual([r['material_id'] for r in dados['removidos']], [removido])
+        self.assertEqual([(mv['tipo'], mv['usuario']) for mv in dados['movimentos']], [('SAIDA', 'sync')])
+
+    def test_remover_o_de_maior_versao_nao_reusa_versoes(self):
+        cursor = self.sync()['cursor']
+        removido = self.b.pk  # o de maior versão
+        self.b.delete()
+        self.a.nome = 'Caneta azul'
+        self.a.save()
+
+        dados = self.sync(cursor)
+        self.assertEqual([m['nome'] for m in dados['materiais']], ['Caneta azul'])
+        self.assertEqual([r['material_id'] for r in dados['removidos']], [removido])
+        self.assertEqual(self.sync(dados['cursor'])['materiais'], [])
+
+    def test_limite_pagina_ate_completar(self):
+        for i in range(3):
+            Material.objects.create(nome=f'M{i}')
+        vistos, cursor = [], None
+        while True:
+            dados = self.sync(cursor, limite=2)
+            vistos += [m['id'] for m in dados['materiais']]
+            cursor = dados['cursor']
+            if dados['completo']:
+                break
+        self.assertEqual(sorted(vistos), sorted(Material.objects.values_list('pk', flat=True)))
+
+    def test_cursor_invalido(self):
+        resp = self.client.get(reverse('api_sync'), {'cursor': 'abc'})
+        self.assertEqual(resp.status_code, 400)
+
+
+class ResumoDashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('painel', password='x')
+        self.client.force_login(self.user)
+        hoje = timezone.now().date()
+        self.m = Material.objects.create(nome='Caneta', quantidade=1, minimo=5)
+        Material.objects.create(nome='Papel', quantidade=50, minimo=5)
+        Movimento.objects.create(material=self.m, tipo='EMPRESTIMO', quantidade=1,
+                                 data_devolucao=hoje - timedelta(days=1), usuario=self.user)
+        Movimento.objects.create(material=self.m, tipo='EMPRESTIMO', quantidade=1,
+                                 data_devolucao=hoje + timedelta(days=3))
+
+    def test_payload(self):
+        resumo = self.client.get(reverse('api_dashboard')).json()
+        self.assertEqual(resumo['alertas']['total'], 1)
+        self.assertEqual(resumo['alertas']['top'][0]['nome'], 'Caneta')
+        self.assertEqual(resumo['emprestimos']['por_status']['atrasado'], 1)
+        self.assertEqual(resumo['emprestimos']['abertos'], 2)
+        self.assertEqual([e['status'] for e in resumo['emprestimos']['proximos']], ['atrasado', 'andamento'])
+        self.assertEqual([m['nome'] for m in resumo['estoque']['top']], ['Caneta', 'Papel'])
+        self.assertEqual(resumo['estoque']['total'], 2)
+        self.assertEqual(
+            [(f['faixa'], f['materiais'], f['quantidade'], f['minimo']) for f in resumo['estoque']['faixas']],
+            [('abaixo', 1, 1, 5), ('atencao', 0, 0, 0), ('folga', 1, 50, 5)],
+        )
+
+    def test_tabela_limitada_e_grafico_agregado(self):
+        Material.objects.bulk_create(Material(nome=f'Item {i:02d}', quantidade=i) for i in range(30))
+        resumo = self.client.get(reverse('api_dashboard')).json()
+        self.assertEqual(len(resumo['estoque']['top']), services.DASHBOARD_ESTOQUE_LINHAS)
+        self.assertEqual(resumo['estoque']['total'], 32)
+        self.assertEqual(sum(f['materiais'] for f in resumo['estoque']['faixas']), 32)
+
+        resp = self.client.get(reverse('dashboard'))
+        self.assertContains(resp, 'Ver todos os 32 materiais')
+        self.assertNotContains(resp, 'Item 29')
+
+    def test_orcamento_de_consultas_e_invalidacao(self):
+        url = reverse('api_dashboard')
+        # duas versões + cinco consultas do resumo (a sessão/usuário somam duas)
+        with self.assertNumQueries(9):
+            self.client.get(url)
+        with self.assertNumQueries(4):
+            self.client.get(url)
+
+        Movimento.objects.create(material=self.m, tipo='ENTRADA', quantidade=10)
+        resumo = self.client.get(url).json()
+        self.assertEqual(resumo['alertas']['total'], 0)
+
+    def test_escritas_em_massa_invalidam_e_chave_nao_varre_tabelas(self):
+        url = reverse('api_dashboard')
+        self.assertEqual(self.client.get(url).json()['emprestimos']['abertos'], 2)
+        Movimento.objects.filter(tipo='EMPRESTIMO', data_devolucao__lt=timezone.now().date()).update(tipo='DEVOLVIDO')
+        self.assertEqual(self.client.get(url).json()['emprestimos']['abertos'], 1)
+        Movimento.objects.filter(tipo='EMPRESTIMO').delete()
+        self.assertEqual(self.client.get(url).json()['emprestimos']['abertos'], 0)
+
+        with CaptureQueriesContext(connection) as consultas:
+            Material.objects.versao()
+            Movimento.objects.versao()
+        for consulta in consultas.captured_queries:
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {consulta['sql']}")
+                self.assertFalse([linha for linha in cursor.fetchall() if linha[-1].startswith('SCAN')],
+                                 consulta['sql'])
+
+    def test_pagina_renderiza_do_resumo(self):
+        resp = self.client.get(reverse('dashboard'))
+        self.assertContains(resp, 'estoque-data')
+        self.assertContains(resp, 'Papel')
+
+
+class AlertasMaterializadosTests(TestCase):
+    def setUp(self):
+        self.m = Material.objects.create(nome='Caneta', quantidade=10, minimo=5)
+
+    def test_movimentos_abrem_e_fecham_periodos(self):
+        self.assertFalse(Material.objects.em_alerta().exists())
+        saida = Movimento.objects.create(material=self.m, tipo='SAIDA', quantidade=6)
+        self.m.refresh_from_db()
+        self.assertIsNotNone(self.m.alerta_desde)
+        inicio = self.m.alerta_desde
+
+        # continuar abaixo do mínimo não reinicia o alerta
+        Movimento.objects.create(material=self.m, tipo='SAIDA', quantidade=1)
+        self.m.refresh_from_db()
+        self.assertEqual(self.m.alerta_desde, inicio)
+
+        saida.delete()
+        self.m.refresh_from_db()
+        self.assertIsNone(self.m.alerta_desde)
+        periodo = PeriodoAlerta.objects.get(material=self.m)
+        self.assertEqual(periodo.inicio, inicio)
+        self.assertIsNotNone(periodo.fim)
+
+    def test_edicao_do_minimo(self):
+        self.m.minimo = 20
+        self.m.save()
+        self.assertEqual(list(Material.objects.em_alerta()), [self.m])
+        self.assertEqual(PeriodoAlerta.objects.filter(fim__isnull=True).count(), 1)
+        self.m.minimo = 1
+        self.m.save(update_fields=['minimo'])
+        self.assertFalse(Material.objects.em_alerta().exists())
+        self.assertFalse(PeriodoAlerta.objects.filter(fim__isnull=True).exists())
+
+    def test_reconciliacao_relata_e_corrige(self):
+        # escrita por fora do fluxo normal deixa o conjunto desatualizado
+        Material.objects.filter(pk=self.m.pk).update(quantidade=1)
+        out = StringIO()
+        call_command('reconciliar_alertas', '--verificar', stdout=out)
+        self.assertIn('abaixo do mínimo sem alerta: 1', out.getvalue())
+        self.assertFalse(Material.objects.em_alerta().exists())
+
+        outro = Material.objects.create(nome='Papel', quantidade=10, minimo=5)
+        Material.objects.filter(pk=outro.pk).update(quantidade=2)
+        versao = Material.objects.versao()
+        call_command('reconciliar_alertas', stdout=StringIO())
+        self.assertEqual(list(Material.objects.em_alerta()), [self.m, outro])
+        # a correção conta como escrita: cada material ganha uma versão nova e distinta
+        self.assertEqual(
+            sorted(Material.objects.values_list('versao', flat=True)), [int(versao) + 1, int(versao) + 2],
+        )
+        self.assertEqual(PeriodoAlerta.objects.filter(material=self.m, fim__isnull=True).count(), 1)
+        out = StringIO()
+        call_command('reconciliar_alertas', stdout=out)
+        self.assertIn('consistentes', out.getvalue())
+
+
+class SaldoHistoricoTests(TestCase):
+    def setUp(self):
+        self.agora = timezone.now()
+        self.dias = [self.agora - timedelta(days=d) for d in (30, 20, 10, 5)]
+        self.m = Material.objects.create(nome='Caneta', quantidade=0)
+        Material.objects.filter(pk=self.m.pk).update(criado=self.agora - timedelta(days=60))
+        # +10 há 30 dias, -3 há 20, empréstimo (sem efeito) há 10, +5 há 5: saldo atual 12
+        for (tipo, qtd), quando in zip([('ENTRADA', 10), ('SAIDA', 3), ('EMPRESTIMO', 2), ('ADICAO', 5)], self.dias):
+            mv = Movimento.objects.create(material=self.m, tipo=tipo, quantidade=qtd)
+            Movimento.objects.filter(pk=mv.pk).update(criado=quando)
+        self.esperado = [
+            (self.agora - timedelta(days=40), 0),
+            (self.agora - timedelta(days=25), 10),
+            (self.agora - timedelta(days=15), 7),
+            (self.agora - timedelta(days=7), 7),
+            (self.agora, 12),
+        ]
+
+    def test_sem_snapshots_parte_do_saldo_atual(self):
+        for momento, saldo in self.esperado:
+            self.assertEqual(saldo_em(self.m.pk, momento), saldo, momento)
+
+    def test_com_snapshots_soma_so_o_que_vem_depois(self):
+        gerar_snapshots([self.agora - timedelta(days=26), self.agora - timedelta(days=12)])
+        self.assertEqual(list(SaldoSnapshot.objects.order_by('momento').values_list('quantidade', flat=True)), [10, 7])
+        for momento, saldo in self.esperado:
+            self.assertEqual(saldo_em(self.m.pk, momento), saldo, momento)
+        # o snapshot é a base: alterá-lo muda os saldos posteriores a ele
+        SaldoSnapshot.objects.filter(quantidade=7).update(quantidade=100)
+        self.assertEqual(saldo_em(self.m.pk, self.agora), 105)
+
+    def test_edicao_de_quantidade_vira_movimento(self):
+        gerar_snapshots([self.agora - timedelta(days=12)])
+        self.client.force_login(get_user_model().objects.create_user('editor', password='x', is_staff=True))
+        self.client.post(reverse('materials_edit', args=[self.m.pk]), {'nome': 'Caneta', 'quantidade': 20, 'minimo': 0})
+        self.m.refresh_from_db()
+        self.assertEqual(self.m.quantidade, 20)
+        ajuste = Movimento.objects.latest('criado')
+        self.assertEqual((ajuste.tipo, ajuste.quantidade, ajuste.usuario.username), ('ADICAO', 8, 'editor'))
+        self.assertEqual(saldo_em(self.m.pk, timezone.now()), 20)
+        for momento, saldo in self.esperado:
+            self.assertEqual(saldo_em(self.m.pk, momento), saldo, momento)
+
+        # sem mudar a quantidade não há movimento
+        self.client.post(reverse('materials_edit', args=[self.m.pk]), {'nome': 'Caneta azul', 'quantidade': 20,
+                                                                      'minimo': 0})
+        self.assertEqual(Movimento.objects.filter(tipo='ADICAO').count(), 2)
+        self.assertEqual(Material.objects.get(pk=self.m.pk).nome, 'Caneta azul')
+
+    def test_material_criado_depois_nao_aparece(self):
+        novo = Material.objects.create(nome='Novo', quantidade=4)
+        self.assertNotIn(novo.pk, saldos_em(self.agora - timedelta(days=1)))
+        self.assertEqual(saldos_em(timezone.now())[novo.pk], 4)
+
+    def test_comando_e_api(self):
+        call_command('gerar_snapshots', '--desde', (self.agora - timedelta(days=3)).date().isoformat(),
+                     stdout=StringIO())
+        self.assertEqual(SaldoSnapshot.objects.count(), 4)
+        call_command('gerar_snapshots', stdout=StringIO())
+        self.assertEqual(SaldoSnapshot.objects.count(), 4)
+
+        self.client.force_login(get_user_model().objects.create_user('saldo', password='x'))
+        dia = (self.agora - timedelta(days=15)).date().isoformat()
+        resp = self.client.get(reverse('api_saldos'), {'data': dia, 'material': self.m.pk})
+        self.assertEqual(resp.json()['saldos'], {str(self.m.pk): 7})
+        self.assertEqual(self.client.get(reverse('api_saldos'), {'data': 'ontem'}).status_code, 400)
+
+
+class PrevisaoConsumoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hoje = timezone.localdate()
+        self.a = Material.objects.create(nome='Caneta', quantidade=0, minimo=10)
+        self.b = Material.objects.create(nome='Papel', quantidade=50, minimo=5)
+        # 3 por dia nos últimos 30 dias e uma saída antiga, fora da janela
+        for dias in range(30):
+            mv = Movimento.objects.create(material=self.a, tipo='SAIDA', quantidade=3)
+            Movimento.objects.filter(pk=mv.pk).update(criado=timezone.now() - timedelta(days=dias))
+        mv = Movimento.objects.create(material=self.a, tipo='SAIDA', quantidade=500)
+        Movimento.objects.filter(pk=mv.pk).update(criado=timezone.now() - timedelta(days=200))
+        Material.objects.filter(pk=self.a.pk).update(quantidade=100)
+        reconstruir_consolidado()  # as datas foram alteradas por fora de save()
+
+    def test_taxas_e_dias_ate_o_minimo(self):
+        with self.assertNumQueries(2):
+            resultado = previsao.prever(self.hoje)
+        a, b = resultado
+        self.assertEqual(a['material_id'], self.a.pk)
+        self.assertEqual(a['medias_moveis'], {'7d': 3.0, '30d': 3.0})
+        self.assertEqual(a['taxa_diaria'], 1.0)  # 90 unidades em 90 dias
+        self.assertEqual((a['dias_ate_minimo'], a['dias_ate_zerar']), (30.0, 33.3))
+        self.assertEqual(a['data_minimo'], self.hoje + timedelta(days=30))
+        self.assertIsNone(b['dias_ate_minimo'])
+
+    def test_api_em_cache_no_dia(self):
+        self.client.force_login(get_user_model().objects.create_user('prev', password='x'))
+        url = reverse('api_previsao')
+        self.assertEqual(self.client.get(url, {'limite': 1}).json()['materiais'][0]['nome'], 'Caneta')
+        Movimento.objects.create(material=self.b, tipo='SAIDA', quantidade=40)
+        self.assertIsNone(self.client.get(url).json()['materiais'][1]['dias_ate_minimo'])
+
+
+class ConsolidadoDiarioTests(TestCase):
+    def setUp(self):
+        self.m = Material.objects.create(nome='Caneta', quantidade=100)
+        self.hoje = timezone.localdate()
+
+    def linhas(self):
+        return set(MovimentoDiario.objects.exclude(total=0).values_list('dia', 'tipo', 'quantidade', 'total'))
+
+    def test_mantido_ao_salvar_editar_e_excluir(self):
+        a = Movimento.objects.create(material=self.m, tipo='SAIDA', quantidade=3)
+        Movimento.objects.create(material=self.m, tipo='SAIDA', quantidade=2)
+        b = Movimento.objects.create(material=self.m, tipo='ENTRADA', quantidade=10)
+        self.assertEqual(self.linhas(), {(self.hoje, 'SAIDA', 5, 2), (self.hoje, 'ENTRADA', 10, 1)})
+
+        a.tipo, a.quantidade = 'ADICAO', 4
+        a.save()
+        b.delete()
+        self.assertEqual(self.linhas(), {(self.hoje, 'SAIDA', 2, 1), (self.hoje, 'ADICAO', 4, 1)})
+        self.assertEqual(reconstruir_consolidado(corrigir=False), [])
+
+    def test_lote_e_verificacao(self):
+        registrar_movimentos_lote([
+            {'material': self.m.pk, 'tipo': 'SAIDA', 'quantidade': 1},
+            {'material': self.m.pk, 'tipo': 'SAIDA', 'quantidade': 2},
+        ])
+        self.assertEqual(self.linhas(), {(self.hoje, 'SAIDA', 3, 2)})
+
+        # movimento com data alterada por fora de save(): a verificação acusa e o comando corrige
+        mv = Movimento.objects.first()
+        Movimento.objects.filter(pk=mv.pk).update(criado=timezone.now() - timedelta(days=3))
+        out = StringIO()
+        call_command('consolidar_movimentos', '--verificar', stdout=out)
+        self.assertIn('2 linhas divergentes', out.getvalue())
+        call_command('consolidar_movimentos', stdout=StringIO())
+        self.assertEqual(reconstruir_consolidado(corrigir=False), [])
+
+    def test_serie_pela_api(self):
+        self.client.force_login(get_user_model().objects.create_user('serie', password='x'))
+        Movimento.objects.create(material=self.m, tipo='SAIDA', quantidade=3)
+        Movimento.objects.create(material=self.m, tipo='SAIDA', quantidade=4)
+        dados = self.client.get(reverse('api_movimentos_diarios'), {'start': self.hoje.isoformat()}).json()
+        self.assertEqual(dados['serie'], [{'dia': self.hoje.isoformat(), 'tipo': 'SAIDA', 'quantidade': 7, 'movimentos': 2}])
+        self.assertEqual(dados['totais'], {'SAIDA': {'quantidade': 7, 'movimentos': 2}})
+
+
+class ArquivamentoTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        ajustes = override_settings(ARQUIVO_MOVIMENTOS_ROOT=self.tmp.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client.force_login(get_user_model().objects.create_user('arq', password='x'))
+        self.hoje = timezone.localdate()
+        self.m = Material.objects.create(nome='Caneta', quantidade=100)
+        # saídas há 100, 70 e 40 dias, um empréstimo antigo e uma saída recente
+        for dias, tipo, qtd in ((100, 'SAIDA', 1), (70, 'SAIDA', 2), (40, 'SAIDA', 3), (90, 'EMPRESTIMO', 1),
+                                (5, 'SAIDA', 4)):
+            mv = Movimento.objects.create(material=self.m, tipo=tipo, quantidade=qtd, nota=f'{dias} dias')
+            Movimento.objects.filter(pk=mv.pk).update(criado=timezone.now() - timedelta(days=dias))
+        reconstruir_consolidado()
+
+    def _csv(self, **params):
+        resp = self.client.get(reverse('export_movements_csv'), params)
+        return b''.join(resp.streaming_content).decode('utf-8').splitlines()[1:]
+
+    def test_arquiva_e_exporta_de_forma_transparente(self):
+        antes = self._csv()
+        saldo = saldo_em(self.m.pk, timezone.now() - timedelta(days=20))
+
+        call_command('arquivar_movimentos', '--dias', '30', stdout=StringIO())
+        # ficam o empréstimo e a saída recente
+        self.assertEqual(sorted(Movimento.objects.values_list('nota', flat=True)), ['5 dias', '90 dias'])
+        self.assertEqual(ArquivoMovimentos.objects.aggregate(n=Sum('linhas'))['n'], 3)
+        self.m.refresh_from_db()
+        self.assertEqual(self.m.quantidade, 100 - 10)
+
+        self.assertEqual(self._csv(), antes)
+        inicio = (self.hoje - timedelta(days=75)).isoformat()
+        fim = (self.hoje - timedelta(days=35)).isoformat()
+        periodo = self._csv(start=inicio, end=fim)
+        self.assertEqual([linha.split(',')[-1] for linha in periodo], ['40 dias', '70 dias'])
+
+        # saldos depois do corte continuam exatos; o consolidado dos dias arquivados permanece
+        self.assertEqual(saldo_em(self.m.pk, timezone.now() - timedelta(days=20)), saldo)
+        self.assertEqual(reconstruir_consolidado(corrigir=False), [])
+        self.assertEqual(MovimentoDiario.objects.filter(tipo='SAIDA').aggregate(n=Sum('total'))['n'], 4)
+
+    def test_saldos_dentro_do_periodo_arquivado(self):
+        agora = timezone.now()
+        Material.objects.filter(pk=self.m.pk).update(criado=agora - timedelta(days=120))
+        # material criado no meio do período arquivado: ainda sem snapshot anterior
+        novo = Material.objects.create(nome='Lápis', quantidade=0)
+        for dias, tipo, qtd in ((55, 'ENTRADA', 10), (45, 'SAIDA', 4)):
+            mv = Movimento.objects.create(material=novo, tipo=tipo, quantidade=qtd)
+            Movimento.objects.filter(pk=mv.pk).update(criado=agora - timedelta(days=dias))
+        Material.objects.filter(pk=novo.pk).update(criado=agora - timedelta(days=60))
+        momentos = [agora - timedelta(days=dias) for dias in (110, 85, 58, 50, 35, 20, 0)]
+        antes = [saldos_em(momento) for momento in momentos]
+        self.assertEqual([s[self.m.pk] for s in antes], [100, 99, 97, 97, 94, 94, 90])
+        self.assertEqual([s.get(novo.pk) for s in antes], [None, None, 0, 10, 6, 6, 6])
+
+        call_command('arquivar_movimentos', '--dias', '30', stdout=StringIO())
+        self.assertFalse(Movimento.objects.filter(criado__lt=agora - timedelta(days=30), tipo='SAIDA').exists())
+        self.assertEqual([saldos_em(momento) for momento in momentos], antes)
+
+    def test_nada_a_arquivar(self):
+        out = StringIO()
+        call_command('arquivar_movimentos', '--antes-de', '2000-01-01', stdout=out)
+        self.assertIn('Nenhum movimento', out.getvalue())
+
+
+class ClearMovimentosTests(TestCase):
+    def setUp(self):
+        self.m = Material.objects.create(nome='Caneta', quantidade=100)
+        for i in range(7):
+            Movimento.objects.create(material=self.m, tipo='SAIDA', quantidade=1)
+        Movimento.objects.create(material=self.m, tipo='ENTRADA', quantidade=5)
+        antigo = Movimento.objects.create(material=self.m, tipo='ENTRADA', quantidade=5)
+        Movimento.objects.filter(pk=antigo.pk).update(criado=timezone.now() - timedelta(days=400))
+        reconstruir_consolidado()
+
+    def test_lotes_filtrados_sem_alterar_estoque(self):
+        out = StringIO()
+        call_command('clear_movimentos', '--yes', '--tipo', 'SAIDA', '--lote', '3', stdout=out)
+        self.assertEqual(out.getvalue().count('mov/s'), 3)  # 3 + 3 + 1
+        self.assertIn('Movimentos removidos: 7', out.getvalue())
+        self.assertEqual(set(Movimento.objects.values_list('tipo', flat=True)), {'ENTRADA'})
+        self.m.refresh_from_db()
+        self.assertEqual(self.m.quantidade, 103)
+        self.assertEqual(reconstruir_consolidado(corrigir=False), [])
+
+        antes_de = (timezone.localdate() - timedelta(days=30)).isoformat()
+        call_command('clear_movimentos', '--yes', '--before', antes_de, stdout=StringIO())
+        self.assertEqual(Movimento.objects.count(), 1)
+        self.assertEqual(reconstruir_consolidado(corrigir=False), [])
+
+    def test_fast_nao_aceita_filtros(self):
+        with self.assertRaises(CommandError):
+            call_command('clear_movimentos', '--yes', '--fast', '--tipo', 'SAIDA', stdout=StringIO())
+
+
+class ImportacaoMateriaisTests(TestCase):
+    def setUp(self):
+        self.existente = Material.objects.create(nome='Caneta', descricao='Azul', quantidade=10, minimo=2)
+
+    def _csv(self, texto):
+        return list(importacao.ler_planilha(BytesIO(texto.encode('utf-8-sig')), 'materiais.csv'))
+
+    def test_cria_atualiza_e_registra_movimentos(self):
+        linhas = self._csv(
+            'ID;Nome;Descrição;Quantidade;Quantidade ideal\n'
+            ';Caneta;;4;5\n'
+            ';Papel A4;Resma;30;10\n'
+            ';Clips;;;\n'
+            ';Papel A4;;1;1\n'
+            ';;sem nome;1;1\n'
+            ';Grampo;;-3;0\n'
+        )
+        resultado = importacao.importar_materiais(linhas, lote=2)
+        self.assertEqual((resultado['linhas'], resultado['criados'], resultado['atualizados']), (6, 2, 1))
+        self.assertEqual([e['linha'] for e in resultado['erros']], [5, 6, 7])
+
+        self.existente.refresh_from_db()
+        self.assertEqual((self.existente.descricao, self.existente.quantidade, self.existente.minimo), ('Azul', 4, 5))
+        self.assertIsNotNone(self.existente.alerta_desde)
+        papel = Material.objects.get(nome='Papel A4')
+        self.assertEqual((papel.quantidade, papel.minimo), (30, 10))
+        self.assertEqual(Material.objects.get(nome='Clips').quantidade, 0)
+        self.assertEqual(
+            sorted(Movimento.objects.values_list('material__nome', 'tipo', 'quantidade')),
+            [('Caneta', 'SAIDA', 6), ('Papel A4', 'ADICAO', 30)],
+        )
+        # versões distintas, alertas e consolidado coerentes com o que save() faria
+        versoes = list(Material.objects.values_list('versao', flat=True))
+        self.assertEqual(len(set(versoes)), len(versoes))
+        self.assertFalse(any(reconciliar_alertas(corrigir=False).values()))
+        self.assertEqual(reconstruir_consolidado(corrigir=False), [])
+
+    def test_simulacao_nao_grava(self):
+        resultado = importacao.importar_materiais(self._csv('Nome,Quantidade\nCaneta,10\nLápis,3\n'), simular=True)
+        self.assertEqual((resultado['criados'], resultado['inalterados'], resultado['movimentos']), (1, 1, 1))
+        self.assertFalse(Material.objects.filter(nome='Lápis').exists())
+        self.assertFalse(Movimento.objects.exists())
+
+    def test_nome_ambiguo_no_cadastro(self):
+        Material.objects.create(nome='Caneta')
+        resultado = importacao.importar_materiais(self._csv('Nome,Quantidade\nCaneta,1\n'))
+        self.assertEqual(resultado['erros'][0]['erros']['nome'][0]['code'], 'ambiguo')
+
+    def test_comando_xlsx(self):
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append(['Nome', 'Descrição', 'Quantidade Atual', 'Mínimo Necessário'])
+        ws.append(['Borracha', 'Branca', 12, 3])
+        with tempfile.NamedTemporaryFile(suffix='.xlsx') as arquivo:
+            wb.save(arquivo.name)
+            out = StringIO()
+            call_command('import_materiais', arquivo.name, stdout=out)
+        self.assertIn('1 criados', out.getvalue())
+        self.assertEqual(Material.objects.get(nome='Borracha').quantidade, 12)
+
+    def test_upload_pela_tela(self):
+        User = get_user_model()
+        self.client.force_login(User.objects.create_user(username='importador', password='pass'))
+        arquivo = BytesIO('Nome;Quantidade\nLápis;7\n'.encode('utf-8'))
+        arquivo.name = 'materiais.csv'
+        resp = self.client.post(reverse('materials_import'), {'arquivo': arquivo})
+        self.assertContains(resp, '1 criados')
+        mv = Movimento.objects.get(material__nome='Lápis')
+        self.assertEqual((mv.tipo, mv.quantidade, mv.usuario.username), ('ADICAO', 7, 'importador'))
+
+
+class MiniaturasTests(TestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        config = override_settings(MEDIA_ROOT=pasta.name)
+        config.enable()
+        self.addCleanup(config.disable)
+        self.storage = Material._meta.get_field('imagem').storage
+        User = get_user_model()
+        self.client.force_login(User.objects.create_user(username='fotos', password='pass', is_staff=True))
+
+    def _imagem(self, cor='red', tamanho=(1200, 900)):
+        buffer = BytesIO()
+        Image.new('RGB', tamanho, cor).save(buffer, 'JPEG')
+        return SimpleUploadedFile('foto.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def _arquivos(self):
+        _, arquivos = self.storage.listdir(miniaturas.PASTA)
+        return sorted(a for a in arquivos if miniaturas.NOME_MINIATURA.match(a))
+
+    def test_upload_agenda_e_gera_miniaturas(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('materials_add'), {'nome': 'Caneta', 'quantidade': 0, 'minimo': 0,
+                                                       'imagem': self._imagem()})
+        self.assertEqual(len(callbacks), 1)
+        mat = Material.objects.get(nome='Caneta')
+        self.assertEqual(mat.thumb_url, mat.imagem.url)  # ainda não geradas: usa a original
+
+        hash_imagem = miniaturas.gerar(mat.pk)
+        mat.refresh_from_db()
+        self.assertEqual(mat.imagem_hash, hash_imagem)
+        self.assertEqual(len(self._arquivos()), 4)
+        self.assertTrue(mat.thumb_url.endswith(f'{hash_imagem}_thumb.webp'))
+        with self.storage.open(f'materiais/{hash_imagem}_preview.jpg') as f:
+            self.assertEqual(Image.open(f).size, (800, 600))
+        self.assertEqual(self.client.get(reverse('api_materials')).json()[0]['thumb_url'], mat.thumb_url)
+
+    def test_remocao_e_exclusao_descartam_miniaturas(self):
+        mat = Material.objects.create(nome='Caneta', imagem=self._imagem())
+        outro = Material.objects.create(nome='Lápis', imagem=self._imagem('blue'))
+        miniaturas.gerar(mat.pk)
+        miniaturas.gerar(outro.pk)
+        self.assertEqual(len(self._arquivos()), 8)
+
+        hash_mat = Material.objects.get(pk=mat.pk).imagem_hash
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('materials_edit', args=[mat.pk]),
+                             {'nome': 'Caneta', 'quantidade': 0, 'minimo': 0, 'remove_image': '1'})
+        self.assertEqual(len(callbacks), 1)  # descarte agendado para depois do commit
+        mat.refresh_from_db()
+        self.assertEqual(mat.imagem_hash, '')
+        self.assertIsNone(mat.thumb_url)
+        self.assertEqual(miniaturas.descartar(hash_mat), 4)
+
+        hash_outro = Material.objects.get(pk=outro.pk).imagem_hash
+        self.client.post(reverse('materials_delete', args=[outro.pk]))
+        self.assertEqual(miniaturas.descartar(hash_outro), 4)
+        self.assertEqual(self._arquivos(), [])
+
+    def test_descarte_concorrente_nao_deixa_material_sem_arquivos(self):
+        antigo = Material.objects.create(nome='Caneta', imagem=self._imagem())
+        hash_imagem = miniaturas.gerar(antigo.pk)
+        Material.objects.filter(pk=antigo.pk).update(imagem='', imagem_hash='')
+        novo = Material.objects.create(nome='Lápis', imagem=self._imagem())  # mesmo conteúdo
+        gravar = miniaturas._gravar_faltantes
+        chamadas = []
+
+        def descarte_no_meio(*args):
+            gravar(*args)
+            chamadas.append(args)
+            if len(chamadas) == 1:
+                # o descarte agendado pela troca de imagem roda antes de gerar() gravar o hash
+                self.assertEqual(miniaturas.descartar(hash_imagem), 4)
+
+        with mock.patch.object(miniaturas, '_gravar_faltantes', descarte_no_meio):
+            self.assertEqual(miniaturas.gerar(novo.pk), hash_imagem)
+        self.assertEqual(len(self._arquivos()), 4)
+        self.assertEqual(miniaturas.descartar(hash_imagem), 0)
+
+    def test_comando_gera_pendentes_e_limpa_orfas(self):
+        mat = Material.objects.create(nome='Caneta', imagem=self._imagem())
+        self.storage.save('materiais/0123456789abcdef_thumb.webp', BytesIO(b'x'))
+        out = StringIO()
+        call_command('gerar_miniaturas', '--workers', '1', '--limpar-orfas', stdout=out)
+        self.assertIn('1 imagens, 0 com erro', out.getvalue())
+        self.assertIn('órfãs removidas: 1', out.getvalue())
+        mat.refresh_from_db()
+        self.assertTrue(mat.imagem_hash)
+        self.assertEqual(len(self._arquivos()), 4)
+
+
+class InstrumentacaoTests(TestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.arquivo = f'{pasta.name}/desempenho.jsonl'
+        config = override_settings(INSTRUMENTACAO_AMOSTRAGEM=1, INSTRUMENTACAO_ARQUIVO=self.arquivo)
+        config.enable()
+        self.addCleanup(config.disable)
+        User = get_user_model()
+        self.client.force_login(User.objects.create_user(username='medido', password='pass'))
+        Material.objects.create(nome='Caneta', quantidade=3)
+
+    def _registros(self):
+        with open(self.arquivo, encoding='utf-8') as f:
+            return [json.loads(linha) for linha in f]
+
+    def test_registra_requisicao_e_gera_relatorio(self):
+        for _ in range(3):
+            resp = self.client.get(reverse('materials_list'))
+        self.assertIn('consultas', resp['Server-Timing'])
+        self.client.get(reverse('api_materials'))
+        registros = self._registros()
+        self.assertEqual([r['view'] for r in registros], ['materials_list'] * 3 + ['api_materials'])
+        self.assertTrue(all(r['consultas'] > 0 and r['bytes'] > 0 for r in registros))
+
+        out = StringIO()
+        call_command('relatorio_desempenho', '--json', '--ordenar', 'n', stdout=out)
+        resumo = json.loads(out.getvalue())
+        self.assertEqual((resumo[0]['view'], resumo[0]['n']), ('materials_list', 3))
+        self.assertLessEqual(resumo[0]['p50'], resumo[0]['p99'])
+
+    def test_consultas_repetidas_sao_apontadas(self):
+        def view_n_mais_1(request):
+            for pk in range(6):
+                Material.objects.filter(pk=pk).first()
+            return HttpResponse('ok')
+
+        request = RequestFactory().get('/qualquer/')
+        with self.assertLogs('stock.desempenho', 'WARNING'):
+            InstrumentacaoMiddleware(view_n_mais_1)(request)
+        registro = self._registros()[-1]
+        self.assertEqual((registro['view'], registro['consultas'], registro['bytes']), (None, 6, 2))
+        self.assertEqual(registro['repetidas'][0]['vezes'], 6)
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_suite_mede_todas_as_entradas(self):
+        resultado = suite(n=300, materiais=20, imagens=2, criacoes=2)
+        self.assertIn('export_movimentos_xlsx', resultado['entradas'])
+        for nome, medida in resultado['entradas'].items():
+            self.assertGreater(medida['consultas'], 0, nome)
+            self.assertGreater(medida['pico_kb'], 0, nome)
+        self.assertEqual(Material.objects.exclude(imagem='').count(), 2)
+
+    def test_comparar_aponta_regressoes(self):
+        base = {'suite': {'n': 10, 'entradas': {
+            'dashboard': {'ms': 40.0, 'consultas': 8, 'pico_kb': 1000},
+            'api_materials': {'ms': 1.0, 'consultas': 3, 'pico_kb': 100},
+        }}, 'importacao': {'n': 10, 'criacao_s': 1.0, 'criacao_linhas_s': 1000}}
+        atual = {'suite': {'n': 10, 'entradas': {
+            'dashboard': {'ms': 60.0, 'consultas': 9, 'pico_kb': 1100},
+            'api_materials': {'ms': 2.5, 'consultas': 3, 'pico_kb': 100},  # +150%, mas só 1,5 ms
+        }}, 'importacao': {'n': 10, 'criacao_s': 1.1, 'criacao_linhas_s': 10}}
+        self.assertEqual(comparar(base, atual), [
+            ('suite', 'entradas.dashboard.ms', 40.0, 60.0),
+            ('suite', 'entradas.dashboard.consultas', 8, 9),
+        ])
+        atual['suite']['n'] = 20  # carga diferente: não compara
+        self.assertEqual(comparar(base, atual), [])
+
+
+class ConfiguracaoSqliteTests(TestCase):
+    def test_pragmas_aplicados_na_conexao(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('só SQLite')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            if not connection.is_in_memory_db():
+                cursor.execute('PRAGMA journal_mode')
+                self.assertEqual(cursor.fetchone()[0], 'wal')
+
+
+class RoteamentoRelatoriosTests(TestCase):
+    @unittest.skipIf(roteamento.configurado(), 'RELATORIOS_DB definido no ambiente')
+    def test_sem_banco_de_relatorios_le_do_principal(self):
+        Material.objects.create(nome='Cabo', quantidade=3)
+        roteador = roteamento.RelatoriosRouter()
+        self.assertFalse(roteamento.configurado())
+        with roteamento.relatorios():
+            self.assertTrue(roteamento.em_relatorio())
+            self.assertIsNone(roteador.db_for_read(Material))
+            self.assertEqual(Material.objects.get(nome='Cabo').quantidade, 3)
+        self.assertFalse(roteamento.em_relatorio())
+
+    def test_escritas_e_migracoes_nunca_na_replica(self):
+        roteador = roteamento.RelatoriosRouter()
+        with roteamento.relatorios():
+            self.assertEqual(roteador.db_for_write(Material), 'default')
+        self.assertFalse(roteador.allow_migrate(roteamento.RELATORIOS_ALIAS, 'stock'))
+        self.assertIsNone(roteador.allow_migrate('default', 'stock'))
+
+    def test_decorator_vale_durante_o_streaming(self):
+        vistos = []
+
+        def corpo():
+            for parte in ('a', 'b'):
+                vistos.append(roteamento.em_relatorio())
+                yield parte
+
+        view = roteamento.leitura_relatorios(lambda request: StreamingHttpResponse(corpo()))
+        resp = view(RequestFactory().get('/'))
+        self.assertEqual(vistos, [])
+        self.assertEqual(b''.join(resp.streaming_content), b'ab')
+        self.assertEqual(vistos, [True, True])
+        self.assertFalse(roteamento.em_relatorio())
+
+    def test_copia_sqlite_substitui_o_destino(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            origem, destino = f'{pasta}/origem.sqlite3', f'{pasta}/relatorios.sqlite3'
+            con = sqlite3.connect(origem)
+            con.execute('PRAGMA journal_mode = WAL')
+            con.execute('CREATE TABLE t (x INTEGER)')
+            con.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(100)])
+            con.commit()
+            roteamento.copiar_sqlite(origem, destino)
+            con.execute('DELETE FROM t WHERE x >= 10')
+            con.commit()
+            roteamento.copiar_sqlite(origem, destino)
+            con.close()
+
+            copia = sqlite3.connect(destino)
+            self.assertEqual(copia.execute('SELECT COUNT(*) FROM t').fetchone()[0], 10)
+            self.assertEqual(copia.execute('PRAGMA journal_mode').fetchone()[0], 'delete')
+            copia.close()
+            self.assertFalse([n for n in os.listdir(pasta) if n.endswith('.tmp')])
+
+    @unittest.skipIf(roteamento.configurado(), 'RELATORIOS_DB definido no ambiente')
+    def test_comando_sem_configuracao(self):
+        with self.assertRaises(CommandError):
+            call_command('atualizar_relatorios', stdout=StringIO())
+
+
+@unittest.skipUnless(busca.disponivel(), 'índice FTS5 só no SQLite')
+class BuscaMateriaisTests(TestCase):
+    def setUp(self):
+        self.cabo = Material.objects.create(nome='Cabo elétrico 2,5mm', descricao='Rolo de 100 m')
+        self.fita = Material.objects.create(nome='Fita isolante', descricao='Para emendas de cabos elétricos')
+        self.parafuso = Material.objects.create(nome='Parafuso', descricao='Aço inox')
+
+    def _nomes(self, texto):
+        return [m.nome for m in busca.buscar(texto)]
+
+    def test_sem_acentos_por_prefixo_e_nome_antes_da_descricao(self):
+        self.assertEqual(self._nomes('ELETRICO'), ['Cabo elétrico 2,5mm', 'Fita isolante'])
+        self.assertEqual(self._nomes('cab ele'), ['Cabo elétrico 2,5mm', 'Fita isolante'])
+        self.assertEqual(self._nomes('aco'), ['Parafuso'])
+        # aspas, * e operadores digitados são texto comum, não sintaxe do FTS5
+        self.assertEqual(self._nomes('"rolo* (100'), ['Cabo elétrico 2,5mm'])
+        self.assertEqual(self._nomes('rolo OR parafuso'), [])
+        self.assertEqual(self._nomes('  '), [])
+
+    def test_consulta_o_banco_escolhido_pelo_roteador(self):
+        with mock.patch.object(busca.router, 'db_for_read', return_value='default') as db_for_read:
+            self.assertEqual(self._nomes('parafuso'), ['Parafuso'])
+        db_for_read.assert_called_with(Material)
+        qs = Material.objects.using('default')
+        self.assertEqual(list(busca.filtrar(qs, 'fita').values_list('nome', flat=True)), ['Fita isolante'])
+
+    def test_indice_acompanha_gravacoes_em_massa(self):
+        self.parafuso.nome = 'Parafuso sextavado'
+        self.parafuso.save()
+        self.assertEqual(self._nomes('sextav'), ['Parafuso sextavado'])
+        Material.objects.filter(pk=self.cabo.pk).update(descricao='Bobina')
+        self.assertEqual(self._nomes('bobina'), ['Cabo elétrico 2,5mm'])
+        Material.objects.bulk_create([Material(nome='Cabo de rede', descricao='')])
+        Material.objects.filter(pk=self.fita.pk).delete()
+        self.assertEqual(self._nomes('cabo'), ['Cabo de rede', 'Cabo elétrico 2,5mm'])
+        call_command('reconstruir_busca', stdout=StringIO())
+        self.assertEqual(self._nomes('cabo'), ['Cabo de rede', 'Cabo elétrico 2,5mm'])
+
+    def test_api_e_listagem(self):
+        self.client.force_login(get_user_model().objects.create_user(username='busca', password='x'))
+        resp = self.client.get(reverse('api_materials_busca'), {'q': 'eletr', 'limite': 1})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([r['id'] for r in resp.json()['resultados']], [self.cabo.pk])
+        self.assertEqual(self.client.get(reverse('api_materials_busca'), {'q': 'x', 'limite': 'a'}).status_code, 400)
+
+        resp = self.client.get(reverse('materials_list'), {'q': 'inox'})
+        self.assertEqual([m.pk for m in resp.context['materiais']], [self.parafuso.pk])
+
+
+class SeletorMaterialTests(TestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_user(username='seletor', password='x'))
+
+    def _form(self):
+        with CaptureQueriesContext(connection) as consultas:
+            resp = self.client.get(reverse('movimento_add'))
+        return resp.content.decode(), len(consultas)
+
+    def test_formulario_nao_cresce_com_o_catalogo(self):
+        Material.objects.create(nome='Caneta azul', quantidade=5)
+        html, consultas = self._form()
+        Material.objects.bulk_create(Material(nome=f'Item {i:03d}', quantidade=1) for i in range(200))
+        html_depois, consultas_depois = self._form()
+        self.assertEqual(consultas_depois, consultas)
+        self.assertEqual(len(html_depois), len(html))
+        self.assertNotIn('Caneta azul', html)
+        self.assertIn(reverse('api_materials_lookup'), html)
+
+    def test_post_valida_so_o_id_enviado(self):
+        mat = Material.objects.create(nome='Caneta azul', quantidade=5)
+        with CaptureQueriesContext(connection) as consultas:
+            form = MovimentoForm({'material': mat.pk, 'tipo': 'ENTRADA', 'quantidade': 2})
+            self.assertTrue(form.is_valid(), form.errors)
+        # o get do ModelChoiceField e a validação da FK do modelo, ambas pelo id
+        self.assertEqual(len(consultas), 2)
+        self.assertTrue(all('"stock_material"."id" = ' in q['sql'] for q in consultas.captured_queries))
+        self.assertIn(f'<option value="{mat.pk}" selected>Caneta azul (5)</option>', str(form['material']))
+        self.assertFalse(MovimentoForm({'material': 'x', 'tipo': 'ENTRADA', 'quantidade': 2}).is_valid())
+        self.assertFalse(MovimentoForm({'material': mat.pk + 1, 'tipo': 'ENTRADA', 'quantidade': 2}).is_valid())
+
+    def test_lookup_com_limite(self):
+        Material.objects.bulk_create(Material(nome=f'Caneta {cor}', quantidade=1) for cor in ('azul', 'preta', 'vermelha'))
+        Material.objects.create(nome='Borracha', quantidade=2)
+        url = reverse('api_materials_lookup')
+        self.assertEqual([r['texto'] for r in self.client.get(url, {'limite': 2}).json()['resultados']],
+                         ['Borracha (2)', 'Caneta azul (1)'])
+        resultados = self.client.get(url, {'q': 'can', 'limite': 2}).json()['resultados']
+        self.assertEqual(len(resultados), 2)
+        self.assertTrue(all(r['texto'].startswith('Caneta') for r in resultados))
+        self.assertEqual(self.client.get(url, {'limite': 'x'}).status_code, 400)
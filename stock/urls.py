@@ -5,17 +5,29 @@ urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('materials/', views.material_list, name='materials_list'),
     path('materials/add/', views.material_create, name='materials_add'),
+    path('materials/importar/', views.material_import, name='materials_import'),
     path('materials/<int:pk>/edit/', views.material_edit, name='materials_edit'),
     path('materials/<int:pk>/delete/', views.material_delete, name='materials_delete'),
     path('movimentos/add/', views.movimento_create, name='movimento_add'),
     path('emprestimos/', views.emprestimos_list, name='emprestimos_list'),
     path('reports/emprestimos/', views.export_emprestimos, name='export_emprestimos'),
     path('api/materials/', views.api_materials, name='api_materials'),
+    path('api/materials/busca/', views.api_busca_materiais, name='api_materials_busca'),
+    path('api/materials/lookup/', views.api_materials_lookup, name='api_materials_lookup'),
+    path('api/movimentos/lote/', views.api_movimentos_lote, name='api_movimentos_lote'),
+    path('api/movimentos/diario/', views.api_movimentos_diarios, name='api_movimentos_diarios'),
+    path('api/sync/', views.api_sync, name='api_sync'),
+    path('api/dashboard/', views.api_dashboard, name='api_dashboard'),
+    path('api/saldos/', views.api_saldos, name='api_saldos'),
+    path('api/previsao/', views.api_previsao, name='api_previsao'),
     path('login/', views.CustomLoginView.as_view(), name='login'),
     path('reports/materials/csv/', views.export_materials_csv, name='export_materials_csv'),
     path('reports/movements/csv/', views.export_movements_csv, name='export_movements_csv'),
     path('alertas/', views.alertas_completos, name='alertas_completos'),
     path('export_alertas_csv/', views.export_alertas_csv, name='export_alertas_csv'),
+    path('api/exportacoes/', views.api_exportacoes, name='api_exportacoes'),
+    path('api/exportacoes/<int:id>/', views.api_exportacao, name='api_exportacao'),
+    path('exportacoes/<int:id>/download/', views.exportacao_download, name='exportacao_download'),
     path('emprestimos/', views.emprestimos_list, name='emprestimos_list'),
 path('emprestimos/<int:id>/concluir/', views.concluir_emprestimo, name='concluir_emprestimo'),
 path('emprestimos/<int:id>/deletar/', views.deletar_emprestimo, name='deletar_emprestimo'),
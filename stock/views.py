@@ -1,17 +1,29 @@
-import re
-from io import BytesIO
-import openpyxl
+import json
+from datetime import timedelta
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.views import LoginView
-from django.http import JsonResponse, HttpResponse
-from django.db import models as dj_models
-from .models import Material, Movimento
-from .forms import MaterialForm, MovimentoForm
+from django.core.cache import cache
+from django.db.models import Sum
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from .models import STATUS_EMPRESTIMO, Exportacao, Material, Movimento, MovimentoDiario, url_miniatura
+from .forms import ImportacaoUploadForm, MaterialForm, MovimentoForm
+from .importacao import importar_materiais, ler_planilha, mensagens_erro
 from .serializers import MaterialSerializer
-from rest_framework.decorators import api_view
-from django.utils.dateparse import parse_date
-import csv
+from .paginacao import paginar, tamanho_pagina
+from .previsao import previsao_do_dia
+from .services import (
+    SYNC_LIMITE_PADRAO, registrar_movimentos_lote, resumo_dashboard, saldos_em, salvar_material_editado, sincronizar,
+    solicitar_exportacao,
+)
+from . import busca, exports, miniaturas
+from .roteamento import leitura_relatorios
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from django.utils.dateparse import parse_date, parse_datetime
 from django.contrib import messages
 from django.urls import reverse
 from django.utils import timezone
@@ -22,28 +34,82 @@ class CustomLoginView(LoginView):
     template_name = 'registration/login.html'
 
 
+DASHBOARD_CACHE_SEGUNDOS = 60 * 60
+
+
+def _resumo_dashboard(request):
+    """
+    Resumo do dashboard em cache por usuário. A chave leva as versões de
+    materiais e movimentos (duas consultas por índice) e o dia, então qualquer
+    escrita ou a virada do dia gera uma chave nova; as antigas expiram sozinhas.
+    """
+    hoje = timezone.now().date()
+    chave = (f'dashboard:{request.user.pk}:{hoje}:'
+             f'{Material.objects.versao()}:{Movimento.objects.versao()}')
+    resumo = cache.get(chave)
+    if resumo is None:
+        resumo = resumo_dashboard(hoje)
+        cache.set(chave, resumo, DASHBOARD_CACHE_SEGUNDOS)
+    return resumo
+
+
 @login_required
 def dashboard(request):
-    # top 5 materiais abaixo do mínimo
-    alertas_top = Material.objects.filter(quantidade__lt=dj_models.F('minimo')).order_by('nome')[:5]
-    # próximos 5 empréstimos ordenados por data_devolucao
-    emprestimos_soon = Movimento.objects.filter(tipo='EMPRESTIMO').order_by('data_devolucao')[:5]
     return render(request, 'stock/dashboard.html', {
-        'alertas_top': alertas_top,
-        'emprestimos_soon': emprestimos_soon,
+        'resumo': _resumo_dashboard(request),
+        'previsao': [p for p in previsao_do_dia() if p['dias_ate_minimo'] is not None][:5],
     })
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_dashboard(request):
+    return JsonResponse(_resumo_dashboard(request))
+
+
 @login_required
 def alertas_completos(request):
-    alertas = Material.objects.filter(quantidade__lt=dj_models.F('minimo')).order_by('nome')
+    alertas = Material.objects.em_alerta().order_by('nome')
     return render(request, 'stock/alertas_completos.html', {'alertas': alertas})
 
 
+def _urls_paginacao(request, pagina):
+    """
+    URLs da página anterior/próxima preservando os filtros da query string.
+    Leva também ?inicio= (posição do primeiro item), para a numeração das
+    linhas continuar entre as páginas: o cursor não carrega deslocamento.
+    """
+    try:
+        inicio = max(0, int(request.GET.get('inicio') or 0))
+    except ValueError:
+        inicio = 0
+    urls = {'inicio': inicio}
+    for nome, cursor, posicao in (('url_anterior', pagina.anterior, max(0, inicio - pagina.tamanho)),
+                                  ('url_proxima', pagina.proximo, inicio + len(pagina))):
+        if cursor:
+            params = request.GET.copy()
+            params['cursor'] = cursor
+            params['inicio'] = posicao
+            urls[nome] = f'?{params.urlencode()}'
+    return urls
+
+
 @login_required
 def material_list(request):
+    q = (request.GET.get('q') or '').strip()
+    ordem = '-nome' if request.GET.get('ordem') == '-nome' else 'nome'
+    por_pagina = tamanho_pagina(request.GET.get('por_pagina'))
     materiais = Material.objects.all()
-    return render(request, 'stock/materials_list.html', {'materiais': materiais})
+    if q:
+        materiais = busca.filtrar(materiais, q)
+    pagina = paginar(materiais, 'nome', request.GET.get('cursor'), por_pagina, descendente=ordem == '-nome')
+    return render(request, 'stock/materials_list.html', {
+        'materiais': pagina,
+        'q': q,
+        'ordem': ordem,
+        'por_pagina': por_pagina,
+        **_urls_paginacao(request, pagina),
+    })
 
 
 @login_required
@@ -52,6 +118,8 @@ def material_create(request):
         form = MaterialForm(request.POST, request.FILES)
         if form.is_valid():
             mat = form.save()
+            if mat.imagem:
+                miniaturas.agendar(mat.pk)
             # Cria um movimento inicial se o material tiver quantidade
             if mat.quantidade and mat.quantidade > 0:
                 mv = Movimento(material=mat, tipo='ADICAO', quantidade=mat.quantidade)
@@ -64,17 +132,53 @@ def material_create(request):
     return render(request, 'stock/material_form.html', {'form': form})
 
 
+@login_required
+def material_import(request):
+    """Importação de materiais e saldos por planilha (mesma rotina do comando import_materiais)."""
+    resultado = None
+    if request.method == 'POST':
+        form = ImportacaoUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            arquivo = form.cleaned_data['arquivo']
+            try:
+                resultado = importar_materiais(
+                    ler_planilha(arquivo.file, arquivo.name),
+                    usuario=request.user,
+                    simular=form.cleaned_data['simular'],
+                )
+            except ValueError as exc:
+                form.add_error('arquivo', str(exc))
+            else:
+                resultado['simulado'] = form.cleaned_data['simular']
+                resultado['mensagens'] = [
+                    (erro['linha'], '; '.join(mensagens_erro(erro))) for erro in resultado['erros'][:100]
+                ]
+    else:
+        form = ImportacaoUploadForm()
+    return render(request, 'stock/material_import.html', {'form': form, 'resultado': resultado})
+
+
 @login_required
 def material_edit(request, pk):
     mat = get_object_or_404(Material, pk=pk)
     if request.method == 'POST':
         form = MaterialForm(request.POST, request.FILES, instance=mat)
+        imagem_anterior, hash_anterior = mat.imagem.name, mat.imagem_hash
         if request.POST.get('remove_image') == '1':
             if mat.imagem:
                 mat.imagem.delete(save=False)
             mat.imagem = None
         if form.is_valid():
-            form.save()
+            trocou = mat.imagem.name != imagem_anterior or 'imagem' in form.changed_data
+            if trocou:
+                # até as novas miniaturas ficarem prontas, thumb_url aponta para a original
+                mat.imagem_hash = ''
+            # mudança de quantidade vira movimento de ajuste (histórico de saldos consistente)
+            salvar_material_editado(form, request.user)
+            if trocou:
+                miniaturas.agendar_descarte(hash_anterior)
+                if mat.imagem:
+                    miniaturas.agendar(mat.pk)
             return redirect('materials_list')
     else:
         form = MaterialForm(instance=mat)
@@ -100,7 +204,9 @@ def material_delete(request, pk):
         if request.user.is_authenticated:
             mv.usuario = request.user
         mv.save(adjust_material=False)
+        hash_imagem = mat.imagem_hash
         mat.delete()
+        miniaturas.agendar_descarte(hash_imagem)
         messages.success(request, f'Material "{mat.nome}" excluído.')
         return redirect('materials_list')
     return render(request, 'stock/material_confirm_delete.html', {'material': mat})
@@ -122,45 +228,199 @@ def movimento_create(request):
         form = MovimentoForm()
     return render(request, 'stock/movimento_form.html', {'form': form})
 
+
+LOTE_MAX_MOVIMENTOS = 10000
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def api_movimentos_lote(request):
+    """
+    Recebe uma lista JSON de movimentos e aplica todos em uma transação.
+    Use ?parcial=1 para gravar as linhas válidas mesmo que outras falhem.
+    """
+    linhas = request.data
+    if not isinstance(linhas, list):
+        return JsonResponse({'erro': 'Envie uma lista JSON de movimentos.'}, status=400)
+    if len(linhas) > LOTE_MAX_MOVIMENTOS:
+        return JsonResponse({'erro': f'Máximo de {LOTE_MAX_MOVIMENTOS} movimentos por lote.'}, status=400)
+    parcial = request.query_params.get('parcial') == '1'
+    aplicado, resultados = registrar_movimentos_lote(linhas, usuario=request.user, parcial=parcial)
+    return JsonResponse({'aplicado': aplicado, 'resultados': resultados}, status=201 if aplicado else 400)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_sync(request):
+    """
+    Sincronização incremental: ?cursor=<cursor da resposta anterior>&limite=N.
+    Sem cursor, devolve tudo desde o início (em páginas de `limite`).
+    """
+    try:
+        limite = max(1, min(int(request.GET.get('limite') or SYNC_LIMITE_PADRAO), 5000))
+        dados = sincronizar(request.GET.get('cursor'), limite)
+    except ValueError:
+        return JsonResponse({'erro': 'Cursor ou limite inválido.'}, status=400)
+    return JsonResponse(dados)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@leitura_relatorios
+def api_saldos(request):
+    """
+    Saldos em um instante passado: ?momento=<ISO 8601> ou ?data=AAAA-MM-DD
+    (fim do dia), opcionalmente filtrando por ?material=<id> (repetível).
+    """
+    try:
+        if request.GET.get('data'):
+            momento = exports.inicio_do_dia(parse_date(request.GET['data']) + timedelta(days=1))
+        else:
+            momento = parse_datetime(request.GET.get('momento') or '')
+            if momento is not None and timezone.is_naive(momento):
+                momento = timezone.make_aware(momento)
+        materiais = [int(pk) for pk in request.GET.getlist('material')] or None
+    except (TypeError, ValueError):
+        momento = None
+    if momento is None:
+        return JsonResponse({'erro': 'Informe momento (ISO 8601) ou data (AAAA-MM-DD) válidos.'}, status=400)
+    return JsonResponse({'momento': momento, 'saldos': saldos_em(momento, materiais)})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@leitura_relatorios
+def api_previsao(request):
+    """
+    Consumo diário, médias móveis e dias até o mínimo de cada material,
+    dos que acabam primeiro aos sem consumo. ?limite=N corta a lista.
+    """
+    previsao = previsao_do_dia()
+    try:
+        limite = int(request.GET.get('limite') or 0)
+    except ValueError:
+        limite = 0
+    if limite > 0:
+        previsao = previsao[:limite]
+    return JsonResponse({'data': timezone.localdate(), 'materiais': previsao})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@leitura_relatorios
+def api_movimentos_diarios(request):
+    """
+    Série diária de movimentos por tipo (?start=&end=AAAA-MM-DD, ?material=<id>),
+    lida do consolidado diário: o custo depende de dias x materiais, não do
+    número de movimentos.
+    """
+    inicio, fim = _periodo(request.GET)
+    qs = MovimentoDiario.objects.periodo(inicio, fim).order_by()
+    if request.GET.get('material'):
+        try:
+            qs = qs.filter(material_id=int(request.GET['material']))
+        except ValueError:
+            return JsonResponse({'erro': 'Material inválido.'}, status=400)
+    somas = {'quantidade': Sum('quantidade'), 'movimentos': Sum('total')}
+    return JsonResponse({
+        'serie': list(qs.values('dia', 'tipo').annotate(**somas).order_by('dia', 'tipo')),
+        'totais': {linha.pop('tipo'): linha for linha in qs.values('tipo').annotate(**somas)},
+    })
+
+
+API_MATERIALS_CACHE_SEGUNDOS = 60 * 60
+
+
 @api_view(['GET'])
 def api_materials(request):
-    materiais = Material.objects.all().order_by('nome')
-    data = [
+    """
+    Catálogo para o gráfico do dashboard. O ETag é a versão dos materiais
+    (uma consulta nos índices de versão): se o cliente já tem essa versão
+    recebe 304, e o JSON de cada versão fica no cache, então nada é
+    serializado de novo até que algum material mude.
+    """
+    versao = Material.objects.versao()
+    etag = quote_etag(versao)
+    resposta = get_conditional_response(request, etag=etag)
+    if resposta is None:
+        chave = f'api_materials:{versao}'
+        payload = cache.get(chave)
+        if payload is None:
+            storage = Material._meta.get_field('imagem').storage
+            data = [
+                {
+                    'id': m['id'],
+                    'nome': m['nome'],
+                    'quantidade': m['quantidade'],
+                    'minimo': m['minimo'],
+                    'imagem_url': storage.url(m['imagem']) if m['imagem'] else None,
+                    'thumb_url': url_miniatura(storage, m['imagem'], m['imagem_hash']),
+                }
+                for m in Material.objects.order_by('nome')
+                .values('id', 'nome', 'quantidade', 'minimo', 'imagem', 'imagem_hash')
+            ]
+            payload = json.dumps(data, cls=DjangoJSONEncoder)
+            cache.set(chave, payload, API_MATERIALS_CACHE_SEGUNDOS)
+        resposta = HttpResponse(payload, content_type='application/json')
+    resposta['ETag'] = etag
+    # o navegador guarda a resposta mas revalida sempre (If-None-Match)
+    resposta['Cache-Control'] = 'private, no-cache'
+    return resposta
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_busca_materiais(request):
+    """
+    Busca de materiais por nome e descrição (?q=, sem acentos, cada palavra
+    como prefixo), do mais ao menos relevante. ?limite=N (até 100).
+    """
+    q = (request.GET.get('q') or '').strip()
+    try:
+        limite = max(1, min(int(request.GET.get('limite') or busca.LIMITE_PADRAO), busca.LIMITE_MAX))
+    except ValueError:
+        return JsonResponse({'erro': 'Limite inválido.'}, status=400)
+    resultados = [
         {
-            'id': m.id,
+            'id': m.pk,
             'nome': m.nome,
+            'descricao': m.descricao,
             'quantidade': m.quantidade,
             'minimo': m.minimo,
-            'imagem_url': (m.imagem.url if getattr(m, 'imagem', None) else None)
+            'thumb_url': m.thumb_url,
         }
-        for m in materiais
+        for m in busca.buscar(q, limite)
     ]
-    return JsonResponse(data, safe=False)
+    return JsonResponse({'q': q, 'resultados': resultados})
 
-@login_required
-def emprestimos_list(request):
-    emprestimos = Movimento.objects.filter(
-        tipo__in=['EMPRESTIMO', 'DEVOLVIDO']
-    ).select_related('material', 'usuario').order_by('data_devolucao')
-
-    # adiciona atributos temporários para exibição (não altera o modelo)
-    for e in emprestimos:
-        if e.tipo == 'DEVOLVIDO':
-            e.status_label = '✅ Concluído'
-            e.status_color = 'green'
-        elif e.data_devolucao and e.data_devolucao < timezone.now().date():
-            e.status_label = '⚠️ Atrasado'
-            e.status_color = 'red'
-        else:
-            e.status_label = '⏳ Em andamento'
-            e.status_color = 'orange'
+LOOKUP_LIMITE_MAX = 50
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_materials_lookup(request):
+    """
+    Opções do seletor de material (MaterialAutocomplete): id e o mesmo texto
+    do <option>. Com ?q= usa a busca por prefixo; sem, os primeiros por nome.
+    ?limite=N (até 50).
+    """
+    q = (request.GET.get('q') or '').strip()
+    try:
+        limite = max(1, min(int(request.GET.get('limite') or busca.LIMITE_PADRAO), LOOKUP_LIMITE_MAX))
+    except ValueError:
+        return JsonResponse({'erro': 'Limite inválido.'}, status=400)
+    campos = ('id', 'nome', 'quantidade')
+    if q:
+        ids = busca.ranquear(q, limite)
+        encontrados = Material.objects.only(*campos).in_bulk(ids)
+        materiais = [encontrados[pk] for pk in ids if pk in encontrados]
+    else:
+        materiais = Material.objects.only(*campos).order_by('nome', 'id')[:limite]
+    return JsonResponse({'resultados': [{'id': m.pk, 'texto': str(m)} for m in materiais]})
 
-    return render(request, 'stock/emprestimos_list.html', {'emprestimos': emprestimos})
 
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def emprestimo_delete(request, pk):
-    emprestimo = get_object_or_404(Movimento, pk=pk, tipo='EMPRESTIMO')
+    emprestimo = get_object_or_404(Movimento.objects.select_related('material'), pk=pk, tipo='EMPRESTIMO')
     if request.method == 'POST':
         emprestimo.delete()
         messages.success(request, f'Empréstimo de "{emprestimo.material.nome if emprestimo.material else "item"}" removido com sucesso.')
@@ -169,217 +429,74 @@ def emprestimo_delete(request, pk):
 
 
 
-@login_required
-def export_emprestimos(request):
-    fmt = (request.GET.get('format') or 'csv').lower()
-    qs = Movimento.objects.filter(
-        tipo__in=['EMPRESTIMO', 'DEVOLVIDO']
-    ).select_related('material', 'usuario').order_by('data_devolucao')
-
-    # adiciona status calculado para exportação
-    for e in qs:
-        if e.tipo == 'DEVOLVIDO':
-            e.status_label = '✅ Concluído'
-        elif e.data_devolucao and e.data_devolucao < timezone.now().date():
-            e.status_label = '⚠️ Atrasado'
-        else:
-            e.status_label = '⏳ Em andamento'
-
-    # --- XLSX ---
-    if fmt == 'xlsx':
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Empréstimos"
-        headers = [
-            'ID', 'Data movimento', 'Usuário', 'Material',
-            'Quantidade', 'Data prevista devolução', 'Nota', 'Status'
-        ]
-        ws.append(headers)
-
-        for mv in qs:
-            mat_nome = mv.material.nome if mv.material else (mv.nota or '')
-            user = mv.usuario.username if mv.usuario else ''
-            ws.append([
-                mv.id,
-                mv.criado.strftime('%Y-%m-%d'),
-                user,
-                mat_nome,
-                mv.quantidade,
-                mv.data_devolucao.strftime('%Y-%m-%d') if mv.data_devolucao else '',
-                mv.nota,
-                mv.status_label
-            ])
-
-        stream = BytesIO()
-        wb.save(stream)
-        stream.seek(0)
-        resp = HttpResponse(
-            stream.read(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        resp['Content-Disposition'] = 'attachment; filename="emprestimos.xlsx"'
-        return resp
-
-    # --- CSV ---
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = 'attachment; filename="emprestimos.csv"'
-    response.write('\ufeff')
-    writer = csv.writer(response, lineterminator='\r\n')
-    writer.writerow([
-        'ID', 'Data movimento', 'Usuário', 'Material',
-        'Quantidade', 'Data prevista devolução', 'Nota', 'Status'
-    ])
-
-    for mv in qs:
-        mat_nome = mv.material.nome if mv.material else (mv.nota or '')
-        user = mv.usuario.username if mv.usuario else ''
-        writer.writerow([
-            mv.id,
-            mv.criado.strftime('%Y-%m-%d'),
-            user,
-            mat_nome,
-            mv.quantidade,
-            mv.data_devolucao.strftime('%Y-%m-%d') if mv.data_devolucao else '',
-            mv.nota,
-            mv.status_label
-        ])
-    return response
+def _periodo(params):
+    """Lê os filtros start/end (AAAA-MM-DD); valores inválidos são ignorados."""
+    datas = []
+    for nome in ('start', 'end'):
+        valor = params.get(nome)
+        try:
+            datas.append(parse_date(valor) if valor else None)
+        except (TypeError, ValueError):
+            datas.append(None)
+    return tuple(datas)
+
 
 @login_required
+@leitura_relatorios
 def export_materials_csv(request):
     fmt = (request.GET.get('format') or 'csv').lower()
-    materiais = Material.objects.all().order_by('nome')
-
-    if fmt == 'xlsx':
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Materiais"
-        headers = ['ID', 'Nome', 'Descrição', 'Quantidade', 'Mínimo']
-        ws.append(headers)
-        for m in materiais:
-            ws.append([m.id, m.nome, m.descricao, m.quantidade, m.minimo])
-        stream = BytesIO()
-        wb.save(stream)
-        stream.seek(0)
-        response = HttpResponse(stream.read(),
-                                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename="materiais.xlsx"'
-        return response
-
-    # fallback CSV (comportamento existente)
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = 'attachment; filename="materiais.csv"'
-    response.write('\ufeff')
-    writer = csv.writer(response, lineterminator='\r\n')
-    writer.writerow(['ID', 'Nome', 'Descrição', 'Quantidade', 'Quantidade ideal'])
-    for m in materiais:
-        writer.writerow([m.id, m.nome, m.descricao, m.quantidade, m.minimo])
-    return response
+    return exports.responder('materiais', fmt)
 
 
 @login_required
+@leitura_relatorios
 def export_movements_csv(request):
-    qs = Movimento.objects.select_related('material').all().order_by('-criado')
-
-    start = request.GET.get('start')
-    end = request.GET.get('end')
-
-    if start:
-        try:
-            sd = parse_date(start)
-            if sd:
-                qs = qs.filter(criado__date__gte=sd)
-        except Exception:
-            pass
-
-    if end:
-        try:
-            ed = parse_date(end)
-            if ed:
-                qs = qs.filter(criado__date__lte=ed)
-        except Exception:
-            pass
-
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = 'attachment; filename="movimentos.csv"'
-    response.write('\ufeff')
-
-    writer = csv.writer(response, lineterminator='\r\n')
-    # material_id removido do cabeçalho
-    writer.writerow(['id', 'data', 'usuario', 'material_nome', 'tipo', 'quantidade', 'nota'])
-
-    for mv in qs:
-        usuario = mv.usuario.username if getattr(mv, 'usuario', None) else ''
-        data_str = mv.criado.strftime('%d/%m/%Y') if getattr(mv, 'criado', None) else ''
-
-        if mv.material is not None:
-            material_nome = mv.material.nome
-            nota_csv = mv.nota or ''
-        else:
-            material_nome = ''
-            nota_csv = ''
-            if mv.nota:
-                # tenta extrair motivo da nota estruturada "nome=...; motivo=..."
-                m_motivo = re.search(r'motivo=([^;]+)', mv.nota)
-                if m_motivo:
-                    nota_csv = m_motivo.group(1).strip()
-                else:
-                    # se não encontrar motivo, usa a nota inteira
-                    nota_csv = mv.nota
-
-        writer.writerow([
-            mv.id,
-            data_str,
-            usuario,
-            material_nome,
-            mv.tipo,
-            mv.quantidade,
-            nota_csv
-        ])
-
-    return response
+    fmt = (request.GET.get('format') or 'csv').lower()
+    inicio, fim = _periodo(request.GET)
+    return exports.responder('movimentos', fmt, inicio, fim)
 
 
 @login_required
+@leitura_relatorios
 def export_alertas_csv(request):
     fmt = (request.GET.get('format') or 'csv').lower()
-    alertas = Material.objects.filter(quantidade__lt=dj_models.F('minimo')).order_by('nome')
-
-    if fmt == 'xlsx':
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Alertas"
-        headers = ['ID', 'Nome', 'Descrição', 'Quantidade Atual', 'Mínimo Necessário']
-        ws.append(headers)
-        for mat in alertas:
-            ws.append([mat.id, mat.nome, mat.descricao, mat.quantidade, mat.minimo])
-        stream = BytesIO()
-        wb.save(stream)
-        stream.seek(0)
-        response = HttpResponse(stream.read(),
-                                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename="materiais_alerta.xlsx"'
-        return response
-
-    # CSV fallback
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = 'attachment; filename="materiais_alerta.csv"'
-    response.write('\ufeff')
-    writer = csv.writer(response, lineterminator='\r\n')
-    writer.writerow(['ID', 'Nome', 'Descrição', 'Quantidade Atual', 'Quantidade ideal'])
-    
-    for mat in alertas:
-        writer.writerow([mat.id, mat.nome, mat.descricao, mat.quantidade, mat.minimo])
-    return response
+    return exports.responder('alertas', fmt)
 
-@login_required
-def emprestimos_list(request):
-    emprestimos = Movimento.objects.filter(tipo__in=['EMPRESTIMO', 'DEVOLVIDO']).select_related('material', 'usuario').order_by('data_devolucao')
+EMPRESTIMO_FILTROS = ['andamento', 'atrasado', 'sem_data', 'concluido']
 
-    # status_display e status_color são propriedades no modelo
-    # Não atribuímos valores aqui para evitar erro de propriedade somente leitura
 
-    return render(request, 'stock/emprestimos_list.html', {'emprestimos': emprestimos})
+@login_required
+def emprestimos_list(request):
+    q = (request.GET.get('q') or '').strip()
+    status = request.GET.get('status') or ''
+    ordem = '-data_devolucao' if request.GET.get('ordem') == '-data_devolucao' else 'data_devolucao'
+    por_pagina = tamanho_pagina(request.GET.get('por_pagina'))
+
+    hoje = timezone.now().date()
+
+    emprestimos = Movimento.objects.emprestimos()
+    if q:
+        emprestimos = emprestimos.filter(material__nome__icontains=q)
+    contagem = emprestimos.contar_status(hoje)
+    if status in EMPRESTIMO_FILTROS:
+        emprestimos = emprestimos.filtrar_status(status, hoje)
+    emprestimos = emprestimos.com_status(hoje).select_related('material', 'usuario')
+    pagina = paginar(emprestimos, 'data_devolucao', request.GET.get('cursor'), por_pagina,
+                     descendente=ordem == '-data_devolucao')
+
+    # status_display e status_badge_class usam a anotação `status` calculada no banco
+    filtros_status = [('', 'Todos', sum(contagem.values()))] + [
+        (codigo, STATUS_EMPRESTIMO[codigo][0], contagem.get(codigo, 0)) for codigo in EMPRESTIMO_FILTROS
+    ]
+    return render(request, 'stock/emprestimos_list.html', {
+        'emprestimos': pagina,
+        'q': q,
+        'status': status,
+        'ordem': ordem,
+        'por_pagina': por_pagina,
+        'filtros_status': filtros_status,
+        **_urls_paginacao(request, pagina),
+    })
 
 
 @login_required
@@ -389,7 +506,7 @@ def concluir_emprestimo(request, id):
     Marca um empréstimo como concluído (finalizado). Se já estiver concluído,
     avisa e redireciona sem levantar 404.
     """
-    emprestimo = get_object_or_404(Movimento, id=id)
+    emprestimo = get_object_or_404(Movimento.objects.select_related('material'), id=id)
     if emprestimo.tipo != 'DEVOLVIDO':
         emprestimo.tipo = 'DEVOLVIDO'
         # opcional: registrar a data de devolução como hoje
@@ -408,66 +525,67 @@ def deletar_emprestimo(request, id):
     """
     Exclui um empréstimo da base de dados.
     """
-    emprestimo = get_object_or_404(Movimento, id=id, tipo__in=['EMPRESTIMO', 'DEVOLVIDO'])
+    emprestimo = get_object_or_404(Movimento.objects.select_related('material'), id=id, tipo__in=['EMPRESTIMO', 'DEVOLVIDO'])
     nome = emprestimo.material.nome if emprestimo.material else "—"
     emprestimo.delete()
     messages.success(request, f'Empréstimo de "{nome}" foi excluído.')
     return redirect('emprestimos_list')
 
 @login_required
+@leitura_relatorios
 def export_emprestimos(request):
     fmt = (request.GET.get('format') or 'csv').lower()
-    qs = Movimento.objects.filter(tipo__in=['EMPRESTIMO', 'DEVOLVIDO']).select_related('material', 'usuario').order_by('data_devolucao')
-
-    # status_display já é calculado pela propriedade do modelo
-
-    # --- XLSX ---
-    if fmt == 'xlsx':
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Empréstimos"
-        headers = ['ID','Data movimento','Usuário','Material','Quantidade','Data prevista devolução','Nota','Status']
-        ws.append(headers)
-
-        for mv in qs:
-            mat_nome = mv.material.nome if mv.material else (mv.nota or '')
-            user = mv.usuario.username if mv.usuario else ''
-            ws.append([
-                mv.id,
-                mv.criado.strftime('%Y-%m-%d'),
-                user,
-                mat_nome,
-                mv.quantidade,
-                mv.data_devolucao.strftime('%Y-%m-%d') if mv.data_devolucao else '',
-                mv.nota,
-                mv.status_display
-            ])
-
-        stream = BytesIO()
-        wb.save(stream)
-        stream.seek(0)
-        resp = HttpResponse(stream.read(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        resp['Content-Disposition'] = 'attachment; filename="emprestimos.xlsx"'
-        return resp
-
-    # --- CSV ---
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = 'attachment; filename="emprestimos.csv"'
-    response.write('\ufeff')
-    writer = csv.writer(response, lineterminator='\r\n')
-    writer.writerow(['ID','Data movimento','Usuário','Material','Quantidade','Data prevista devolução','Nota','Status'])
-
-    for mv in qs:
-        mat_nome = mv.material.nome if mv.material else (mv.nota or '')
-        user = mv.usuario.username if mv.usuario else ''
-        writer.writerow([
-            mv.id,
-            mv.criado.strftime('%Y-%m-%d'),
-            user,
-            mat_nome,
-            mv.quantidade,
-            mv.data_devolucao.strftime('%Y-%m-%d') if mv.data_devolucao else '',
-            mv.nota,
-            mv.status_display
-        ])
-    return response
+    # status calculado por linha em exports.linhas_emprestimos (mesma regra de status_display)
+    return exports.responder('emprestimos', fmt)
+
+
+def _exportacao_json(request, exportacao):
+    data = {
+        'id': exportacao.id,
+        'relatorio': exportacao.relatorio,
+        'formato': exportacao.formato,
+        'start': exportacao.inicio.isoformat() if exportacao.inicio else None,
+        'end': exportacao.fim.isoformat() if exportacao.fim else None,
+        'status': exportacao.status,
+        'status_url': request.build_absolute_uri(reverse('api_exportacao', args=[exportacao.id])),
+        'download_url': None,
+        'erro': exportacao.erro or None,
+    }
+    if exportacao.status == 'CONCLUIDA':
+        data['download_url'] = request.build_absolute_uri(reverse('exportacao_download', args=[exportacao.id]))
+    return data
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def api_exportacoes(request):
+    """
+    Pede um relatório em segundo plano: {"relatorio": "movimentos", "format": "csv",
+    "start": "2025-01-01", "end": "2025-01-31"}. Se os dados não mudaram desde a
+    última geração com os mesmos filtros, o arquivo existente é devolvido.
+    """
+    relatorio = request.data.get('relatorio')
+    fmt = (request.data.get('format') or 'csv').lower()
+    if relatorio not in exports.RELATORIOS or fmt not in exports.FORMATOS:
+        return JsonResponse({'erro': 'Relatório ou formato inválido.'}, status=400)
+    inicio, fim = _periodo(request.data)
+    exportacao = solicitar_exportacao(relatorio, fmt, inicio, fim, usuario=request.user)
+    status = 200 if exportacao.status == 'CONCLUIDA' else 202
+    return JsonResponse(_exportacao_json(request, exportacao), status=status)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_exportacao(request, id):
+    exportacao = get_object_or_404(Exportacao, id=id)
+    return JsonResponse(_exportacao_json(request, exportacao))
+
+
+@login_required
+def exportacao_download(request, id):
+    exportacao = get_object_or_404(Exportacao, id=id, status='CONCLUIDA')
+    return FileResponse(
+        exportacao.arquivo.open('rb'),
+        as_attachment=True,
+        filename=exports.nome_arquivo(exportacao.relatorio, exportacao.formato),
+    )